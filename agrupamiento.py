@@ -0,0 +1,158 @@
+"""
+Agrupamiento (clustering) de marcadores en el servidor para zooms bajos.
+
+Se usa una rejilla en proyección Web Mercator: a cada zoom el mundo mide
+256 * 2^zoom píxeles y se divide en celdas de radio_px píxeles. Los
+marcadores que caen en la misma celda forman un cluster con su centroide y
+el número de puntos. Según aumenta el zoom las celdas encogen y los
+clusters se deshacen en marcadores individuales.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from cache_lru import CacheLRU
+from marcador import PROYECCION_MAPA, marcador_para_mapa
+
+LAT_MAXIMA = 85.05112878  # Límite de la proyección Web Mercator
+
+
+def proyectar(lats: np.ndarray, lons: np.ndarray):
+    """lat/lon -> coordenadas Mercator normalizadas en [0, 1]."""
+    lats = np.clip(lats, -LAT_MAXIMA, LAT_MAXIMA)
+    x = (lons + 180.0) / 360.0
+    seno = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * np.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+class IndiceClusters:
+
+    def __init__(self, lats: Sequence[float], lons: Sequence[float], datos: List[dict],
+                 radio_px: int = 60, max_zoom: int = 16):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.datos = datos
+        self.radio_px = radio_px
+        self.max_zoom = max_zoom
+        self._x, self._y = proyectar(self.lats, self.lons)
+        self._niveles: Dict[int, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _nivel(self, zoom: int) -> dict:
+        """Clusters de un zoom (se calculan la primera vez que se piden)."""
+        nivel = self._niveles.get(zoom)
+        if nivel is not None:
+            return nivel
+
+        celdas = max(1, int(256 * 2 ** zoom / self.radio_px))
+        cx = (self._x * celdas).astype(np.int64)
+        cy = (self._y * celdas).astype(np.int64)
+        claves = cx * celdas + cy
+
+        unicas, inversa, cantidades = np.unique(claves, return_inverse=True, return_counts=True)
+        nivel = {
+            "lat": np.bincount(inversa, weights=self.lats) / cantidades,
+            "lon": np.bincount(inversa, weights=self.lons) / cantidades,
+            "cantidad": cantidades,
+            # Para los clusters de un solo punto: qué marcador es
+            "primero": np.full(len(unicas), -1, dtype=np.int64),
+        }
+        nivel["primero"][inversa] = np.arange(len(inversa))
+        self._niveles[zoom] = nivel
+        return nivel
+
+    def consultar(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float, zoom: int) -> dict:
+        """
+        Devuelve {"clusters": [...], "marcadores": [...]} para la caja visible.
+        Por encima de max_zoom todos los puntos van como marcadores sueltos.
+        """
+        if zoom > self.max_zoom:
+            dentro = self._en_caja(self.lats, self.lons, min_lon, min_lat, max_lon, max_lat)
+            return {"clusters": [], "marcadores": [self.datos[i] for i in np.flatnonzero(dentro)]}
+
+        nivel = self._nivel(zoom)
+        dentro = self._en_caja(nivel["lat"], nivel["lon"], min_lon, min_lat, max_lon, max_lat)
+
+        clusters, marcadores = [], []
+        for i in np.flatnonzero(dentro):
+            cantidad = int(nivel["cantidad"][i])
+            if cantidad == 1:
+                marcadores.append(self.datos[int(nivel["primero"][i])])
+            else:
+                clusters.append({
+                    "lat": float(nivel["lat"][i]),
+                    "lon": float(nivel["lon"][i]),
+                    "cantidad": cantidad,
+                })
+        return {"clusters": clusters, "marcadores": marcadores}
+
+    @staticmethod
+    def _en_caja(lats, lons, min_lon, min_lat, max_lon, max_lat) -> np.ndarray:
+        en_lat = (lats >= min_lat) & (lats <= max_lat)
+        if max_lon - min_lon >= 360:
+            return en_lat
+        if not -180 <= min_lon <= 180:
+            min_lon = (min_lon + 180) % 360 - 180
+        if not -180 <= max_lon <= 180:
+            max_lon = (max_lon + 180) % 360 - 180
+        if min_lon <= max_lon:
+            return en_lat & (lons >= min_lon) & (lons <= max_lon)
+        # La caja cruza el antimeridiano
+        return en_lat & ((lons >= min_lon) | (lons <= max_lon))
+
+
+class CacheClusters:
+    """
+    Un IndiceClusters por usuario, construido desde Mongo la primera vez y
+    descartado cuando el usuario añade un marcador. Esa invalidación solo
+    llega al proceso que atiende la escritura, así que las entradas caducan
+    además a los ttl segundos.
+    """
+
+    def __init__(self, coleccion, max_usuarios: int = 256, radio_px: int = 60, max_zoom: int = 16,
+                 ttl: Optional[float] = 300.0):
+        self.coleccion = coleccion
+        self.radio_px = radio_px
+        self.max_zoom = max_zoom
+        self.cache = CacheLRU(max_entradas=max_usuarios, ttl=ttl)
+        # Si se invalida mientras se construye un índice, ese índice no se guarda.
+        # Solo hace falta mientras hay construcciones en curso para ese usuario
+        self._generacion: Dict[str, int] = {}
+        self._construyendo: Dict[str, int] = {}
+
+    async def obtener(self, email: str) -> IndiceClusters:
+        indice: Optional[IndiceClusters] = self.cache.obtener(email)
+        if indice is not None:
+            return indice
+
+        self._construyendo[email] = self._construyendo.get(email, 0) + 1
+        generacion = self._generacion.get(email, 0)
+        try:
+            lats, lons, datos = [], [], []
+            cursor = self.coleccion.find({"email_usuario": email}, PROYECCION_MAPA)
+            async for doc in cursor:
+                lats.append(doc["latitud"])
+                lons.append(doc["longitud"])
+                datos.append(marcador_para_mapa(doc))
+
+            indice = IndiceClusters(lats, lons, datos, self.radio_px, self.max_zoom)
+            if self._generacion.get(email, 0) == generacion:
+                self.cache.guardar(email, indice)
+        finally:
+            pendientes = self._construyendo.pop(email) - 1
+            if pendientes:
+                self._construyendo[email] = pendientes
+            else:
+                self._generacion.pop(email, None)
+        return indice
+
+    def invalidar(self, email: str) -> None:
+        if email in self._construyendo:
+            self._generacion[email] = self._generacion.get(email, 0) + 1
+        self.cache.invalidar(email)
+
+    def metricas(self) -> dict:
+        return self.cache.metricas()
@@ -1,14 +1,20 @@
-from fastapi import FastAPI, Response, Body , HTTPException, UploadFile, File        # FastAPI
+from fastapi import FastAPI, Response, Body , HTTPException, UploadFile, File, Query        # FastAPI
 from archivo import Archivo
 from bson import ObjectId
-import motor.motor_asyncio as motor
 from environs import Env
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import cloudinary
+from typing import List, Optional
 from contextlib import asynccontextmanager
-import cloudinary.uploader
+from subidas import AlmacenamientoLocal, crear_ejecutor
+from cola_archivos import PENDIENTE, SUBIENDO, LISTO, ERROR, crear_trabajador
+from deduplicacion import AlmacenBlobs
+from cache_lru import CacheLRU
+from recursos import Recursos
+from instrumentacion import CONTENT_TYPE_PROMETHEUS, MiddlewareTiempos, exponer_prometheus
+from indices import INDICES_ARCHIVOS, crear_indices
+from fastapi.staticfiles import StaticFiles
 """
 url_calendario = "http://localhost:8000/"
 url_evento = "http://localhost:8001/"
@@ -30,23 +36,57 @@ url_notificaciones = "http://notificacion-service:8000/"
 
 env = Env()
 env.read_env()
-uri = env('MONGO_URI')
-
-cloudinary.config( 
-    cloud_name = env('CLOUDINARY_CLOUD_NAME'), 
-    api_key = env('CLOUDINARY_API_KEY'), 
-    api_secret = env('CLOUDINARY_API_SECRET'),
-    secure = True
-)
 
 nombre_basedatos = "KalendasV2"
 nombre_coleccion = "Archivos"
 
-client = motor.AsyncIOMotorClient(uri)
+# Cliente de Mongo (pool configurable) y cliente HTTP compartido; se abren y
+# cierran en el lifespan
+recursos = Recursos(env)
+client = recursos.mongo
 database = client[nombre_basedatos][nombre_coleccion]
 
 
-app = FastAPI()
+# Pool de hilos para las subidas/borrados (Cloudinary o disco local)
+ejecutor_subidas = crear_ejecutor(env)
+
+# Contenidos ya subidos (por SHA-256) con su número de referencias
+blobs = AlmacenBlobs(client[nombre_basedatos]["Blobs"], ejecutor_subidas)
+
+# Modo diferido: se responde 202 y la subida la hace un trabajador en segundo plano
+subida_diferida = env.bool('ARCHIVOS_DIFERIDOS', False)
+trabajador_archivos = crear_trabajador(env, database, ejecutor_subidas, blobs)
+
+# Caché id -> metadatos de los archivos ya subidos (solo los que tienen enlace)
+cache_archivos = CacheLRU(
+    max_entradas=env.int('CACHE_ARCHIVOS', 10000),
+    ttl=env.float('CACHE_ARCHIVOS_TTL', 3600.0),
+)
+# Cuánto pueden guardar navegadores y CDN la redirección de /ver
+max_age_redireccion = env.int('ARCHIVOS_REDIRECCION_MAX_AGE', 86400)
+# Máximo de ids por petición en /enlaces
+max_ids_enlaces = env.int('ARCHIVOS_MAX_IDS_ENLACES', 1000)
+
+PROYECCION_ARCHIVO = {"nombre": 1, "tipo": 1, "enlace": 1, "estado": 1}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await recursos.iniciar()
+    await crear_indices(client[nombre_basedatos], INDICES_ARCHIVOS)
+    await trabajador_archivos.iniciar()
+    yield
+    # Apagado: primero lo que aún escribe en Mongo, después los clientes
+    await trabajador_archivos.detener()
+    ejecutor_subidas.cerrar()
+    await recursos.cerrar()
+
+
+app = FastAPI(lifespan=lifespan)
+
+if isinstance(ejecutor_subidas.almacenamiento, AlmacenamientoLocal):
+    almacen = ejecutor_subidas.almacenamiento
+    app.mount(almacen.url_base, StaticFiles(directory=almacen.directorio), name="media")
 
 origins = [
     "http://127.0.0.1:8000",  
@@ -74,21 +114,40 @@ app.add_middleware(
     allow_headers=["*"],      # Permite todos los headers (Content-Type, Authorization, etc.)
 )
 
+# Tiempos por petición y por tramo (Server-Timing y /metrics)
+app.add_middleware(MiddlewareTiempos, nombre="archivos", perfilado=env.bool('PERFILADO', False))
+
 path = "/v2/archivo"
 
 
-async def upload_image(archivo_id: str, file: UploadFile):
+def cachear_archivo(archivo_id: str, archivo: dict) -> None:
+    # Los pendientes o con error todavía pueden cambiar: no se guardan
+    if archivo.get("enlace") and archivo.get("estado", LISTO) == LISTO:
+        cache_archivos.guardar(archivo_id, {c: archivo.get(c) for c in PROYECCION_ARCHIVO})
+
+
+async def buscar_archivo(archivo_id: str) -> Optional[dict]:
+    """Metadatos de un archivo (nombre, tipo, enlace, estado), pasando por la caché."""
+    archivo = cache_archivos.obtener(archivo_id)
+    if archivo is not None:
+        return archivo
+
+    try:
+        obj_id = ObjectId(archivo_id)
+    except:
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    archivo = await database.find_one({"_id": obj_id}, PROYECCION_ARCHIVO)
+    if archivo:
+        cachear_archivo(archivo_id, archivo)
+    return archivo
+
+
+async def upload_image(blob: dict, file: UploadFile):
     try:
         await file.seek(0)
-        
-        upload_result = cloudinary.uploader.upload(
-            file.file,
-            public_id=str(archivo_id),  
-            folder="archivos", # Carpeta en Cloudinary
-            resource_type="auto"
-        )
-        
-        return upload_result["secure_url"]
+        # Si el contenido ya estaba subido devuelve su enlace sin llamar a Cloudinary
+        return await blobs.asegurar_subido(blob, file.file)
 
     except Exception as e:
         print(f"ERROR CLOUDINARY: {e}")
@@ -96,68 +155,166 @@ async def upload_image(archivo_id: str, file: UploadFile):
 
 
 @app.post(path)
-async def crear_Archivo(file: UploadFile = File(...)):
+async def crear_Archivo(file: UploadFile = File(...), diferido: Optional[bool] = Query(None)):
     try:
         tipo = file.content_type
         # Limpieza del nombre del archivo
         nombre = os.path.basename(file.filename.replace("\\", "/")) if file.filename else "sin_nombre"
-        
-        body = {
-            "nombre": nombre,
-            "tipo": tipo,
-            "enlace": ""
-        }
-        
-        insert_result = await database.insert_one(body)
-        archivo_id = insert_result.inserted_id
-        
-        url_imagen = await upload_image(str(archivo_id), file)
-
 
-        await database.update_one(
-            {"_id": archivo_id}, 
-            {"$set": {"enlace": url_imagen}}
-        )
+        if diferido is None:
+            diferido = subida_diferida
+
+        if diferido:
+            # Guardamos en el spool y respondemos ya; el enlace llegará después
+            body = await trabajador_archivos.encolar(file, nombre, tipo)
+            archivo_id = str(body["_id"])
+            if body["estado"] == LISTO:
+                # Contenido repetido: ya tiene enlace, no hay nada que esperar
+                archivo = {"_id": archivo_id, "nombre": nombre, "tipo": tipo,
+                           "enlace": body["enlace"], "hash": body["hash"]}
+                cachear_archivo(archivo_id, archivo)
+                return {"mensaje": "Archivo insertado correctamente", "archivo": archivo, "reutilizado": True}
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "mensaje": "Archivo aceptado, subida pendiente",
+                    "archivo": {"_id": archivo_id, "nombre": nombre, "tipo": tipo,
+                                "enlace": "", "estado": PENDIENTE},
+                },
+                headers={"Location": f"{path}/estado/{archivo_id}"},
+            )
         
-        body["enlace"] = url_imagen
-        body["_id"] = str(archivo_id)
-
-        return {"mensaje": "Archivo insertado correctamente", "archivo": body}
+        # Hash del contenido (por bloques) y una referencia más a su blob
+        hash_archivo, tamano = await blobs.calcular_hash(file)
+        blob = await blobs.adquirir(hash_archivo, tamano)
+        reutilizado = bool(blob.get("enlace"))
+
+        try:
+            url_imagen = await upload_image(blob, file)
+            body = {
+                "nombre": nombre,
+                "tipo": tipo,
+                "enlace": url_imagen,
+                "hash": hash_archivo,
+            }
+            insert_result = await database.insert_one(body)
+        except Exception:
+            await blobs.liberar(hash_archivo)
+            raise
+
+        body["_id"] = str(insert_result.inserted_id)
+        cachear_archivo(body["_id"], body)
+
+        return {"mensaje": "Archivo insertado correctamente", "archivo": body, "reutilizado": reutilizado}
 
     except Exception as e:
 
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
-@app.get(path + "/ver/{archivo_id}")
-async def redireccionar_Al_Archivo(archivo_id:str):
+@app.get(path + "/metricas/subidas")
+async def metricas_Subidas():
+    return {**ejecutor_subidas.metricas(), "deduplicacion": blobs.metricas()}
+
+@app.get(path + "/metricas/recursos")
+async def metricas_Recursos():
+    return recursos.metricas()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas_Prometheus():
+    return PlainTextResponse(exponer_prometheus(recursos.indicadores()), media_type=CONTENT_TYPE_PROMETHEUS)
+
+@app.get(path + "/metricas/cache")
+async def metricas_Cache():
+    return cache_archivos.metricas()
+
+@app.post(path + "/enlaces")
+async def obtener_Enlaces(ids: List[str] = Body(..., embed=True)):
+    """
+    Resuelve muchos ids a la vez: los que no están en caché, con una sola
+    consulta $in. Los ids inválidos, inexistentes o sin enlace devuelven null.
+    """
+    if len(ids) > max_ids_enlaces:
+        raise HTTPException(status_code=400, detail=f"Como mucho {max_ids_enlaces} ids por petición")
+
+    enlaces = {}
+    pendientes = {}
+    for archivo_id in dict.fromkeys(ids):
+        archivo = cache_archivos.obtener(archivo_id)
+        if archivo is not None:
+            enlaces[archivo_id] = archivo["enlace"]
+            continue
+        enlaces[archivo_id] = None
+        if ObjectId.is_valid(archivo_id):
+            pendientes[ObjectId(archivo_id)] = archivo_id
+
+    if pendientes:
+        async for archivo in database.find({"_id": {"$in": list(pendientes)}}, PROYECCION_ARCHIVO):
+            archivo_id = pendientes[archivo["_id"]]
+            cachear_archivo(archivo_id, archivo)
+            if archivo.get("estado", LISTO) == LISTO:
+                enlaces[archivo_id] = archivo.get("enlace") or None
+
+    return {"enlaces": enlaces}
+
+@app.get(path + "/estado/{archivo_id}")
+async def obtener_Estado_Archivo(archivo_id: str):
     try:
         obj_id = ObjectId(archivo_id)
     except:
-         raise HTTPException(status_code=400, detail="ID inválido")
+        raise HTTPException(status_code=400, detail="ID inválido")
 
-    archivo = await database.find_one({"_id": obj_id})
+    archivo = await database.find_one(
+        {"_id": obj_id},
+        {"estado": 1, "enlace": 1, "intentos": 1, "ultimo_error": 1, "proximo_intento": 1},
+    )
     if not archivo:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    proximo = archivo.get("proximo_intento")
+    return {
+        "_id": archivo_id,
+        # Los documentos anteriores al modo diferido no tienen estado: ya están subidos
+        "estado": archivo.get("estado", "listo"),
+        "enlace": archivo.get("enlace", ""),
+        "intentos": archivo.get("intentos", 0),
+        "ultimo_error": archivo.get("ultimo_error"),
+        "proximo_intento": proximo.isoformat() if proximo else None,
+    }
+
+@app.get(path + "/ver/{archivo_id}")
+async def redireccionar_Al_Archivo(archivo_id:str):
+    archivo = await buscar_archivo(archivo_id)
+    if not archivo:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    estado = archivo.get("estado")
+    if estado in (PENDIENTE, SUBIENDO):
+        # Aún se está subiendo: indicamos al cliente que vuelva a intentarlo
+        return JSONResponse(
+            status_code=202,
+            content={"mensaje": "El archivo todavía se está procesando", "estado": estado},
+            headers={"Retry-After": "2", "Cache-Control": "no-store"},
+        )
+    if estado == ERROR:
+        raise HTTPException(status_code=502, detail="No se pudo subir el archivo")
         
     enlace = archivo.get("enlace")
     if not enlace:
         raise HTTPException(status_code=404, detail="El archivo existe pero no tiene imagen asociada")
         
-    return RedirectResponse(url=enlace)
+    # El enlace de un id no cambia: el navegador puede reutilizar la redirección
+    return RedirectResponse(
+        url=enlace,
+        headers={"Cache-Control": f"public, max-age={max_age_redireccion}, immutable"},
+    )
 
 
 #GET UNO R
 @app.get(path+"/{archivo_id}")
 async def obtener_Archivo(archivo_id: str) -> Archivo:
-    try:
-        id = ObjectId(archivo_id)
-    except:
-        raise HTTPException(status_code=400, detail="ID inválido")
-    
-    docs = await database.find_one({"_id":id})
+    docs = await buscar_archivo(archivo_id)
     if not docs:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    del docs["_id"]
     archivo = Archivo(**docs)
     
     return archivo
@@ -172,26 +329,46 @@ async def eliminar_Archivo(archivo_id: str):
         raise HTTPException(status_code=400, detail="ID inválido")
 
     archivo = await database.find_one({"_id": obj_id})
+    if archivo and archivo.get("estado") in (PENDIENTE, SUBIENDO):
+        # Subida diferida sin terminar: el trabajador se encarga de lo ya subido
+        if await trabajador_archivos.cancelar(obj_id):
+            cache_archivos.invalidar(archivo_id)
+            return {"mensaje": "Archivo eliminado correctamente"}
+        # Ha terminado (o fallado) entretanto: se borra como uno normal
+        archivo = await database.find_one({"_id": obj_id})
     if not archivo:
         raise HTTPException(status_code=404, detail="Archivo no encontrado en BD")
 
+    if archivo.get("hash"):
+        # Contenido compartido: solo se borra en Cloudinary con la última referencia
+        resultado = await database.delete_one({"_id": obj_id})
+        cache_archivos.invalidar(archivo_id)
+        if resultado.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="No se pudo borrar de la BD")
+        try:
+            await blobs.liberar(archivo["hash"])
+        except Exception as e:
+            print(f"ERROR CRÍTICO EN CLOUDINARY: {e}")
+        return {"mensaje": "Archivo eliminado correctamente"}
+
     try:
         # 1. Construimos el ID esperado
         public_id = f"archivos/{archivo_id}" #Ruta en Cloudinary
         
         # 2. Intentamos borrar el archivo en Cloudinary
-        resultado_cloud = cloudinary.uploader.destroy(public_id)
+        resultado_cloud = await ejecutor_subidas.borrar(public_id)
         
         # Si la respuesta es 'not found', intentamos borrar sin la carpeta (para imágenes viejas)
         if resultado_cloud.get('result') == 'not found':
              print("No encontrado en carpeta 'archivos', intentando borrar en raíz...")
-             resultado_cloud_root = cloudinary.uploader.destroy(archivo_id)
+             resultado_cloud_root = await ejecutor_subidas.borrar(archivo_id)
              print(f"Respuesta Cloudinary (Raíz): {resultado_cloud_root}")
 
     except Exception as e:
         print(f"ERROR CRÍTICO EN CLOUDINARY: {e}")
 
     resultado = await database.delete_one({"_id": obj_id})
+    cache_archivos.invalidar(archivo_id)
     if resultado.deleted_count == 0:
         raise HTTPException(status_code=404, detail="No se pudo borrar de la BD")
 
@@ -200,10 +377,9 @@ async def eliminar_Archivo(archivo_id: str):
 #Me devuelve el enlace del archivo
 @app.get(path+"/obtenerEnlace/{archivo_id}")
 async def obtener_Enlace_Archivo(archivo_id: str) -> str:
-    resultado = await database.find_one({"_id": ObjectId(archivo_id)})
+    resultado = await buscar_archivo(archivo_id)
     if resultado is None:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    del resultado["_id"]
     archivo = Archivo(**resultado)
     enlace = archivo.enlace
     return enlace
@@ -0,0 +1,80 @@
+"""
+Arranque en frío reproducible: lanza N procesos nuevos y en cada uno mide el
+tiempo de importar la aplicación y el de la primera petición (por defecto
+GET /, que renderiza index.html) con httpx.ASGITransport, sin servidor ni
+lifespan. Sirve para detectar regresiones al añadir imports en main.py.
+
+    python benchmarks/bench_arranque.py --procesos 10
+    python benchmarks/bench_arranque.py --modulo archivoAPI --ruta /v2/archivo/metricas/cache
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from perfil_importacion import RAIZ, entorno
+
+# Se ejecuta en cada proceso nuevo; imprime una línea JSON con los tiempos
+HIJO = """
+import asyncio, json, sys, time
+inicio = time.perf_counter()
+modulo = __import__(sys.argv[1])
+importado = time.perf_counter()
+
+async def primera_peticion():
+    import httpx
+    transporte = httpx.ASGITransport(app=modulo.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://local") as cliente:
+        t0 = time.perf_counter()
+        respuesta = await cliente.get(sys.argv[2])
+        return respuesta.status_code, time.perf_counter() - t0
+
+estado, peticion = asyncio.run(primera_peticion())
+print(json.dumps({"importar": importado - inicio, "peticion": peticion, "estado": estado}))
+"""
+
+
+def medir_proceso(modulo: str, ruta: str) -> dict:
+    proceso = subprocess.run(
+        [sys.executable, "-c", HIJO, modulo, ruta],
+        cwd=RAIZ, env=entorno(), capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise SystemExit(f"ERROR EN EL PROCESO:\n{proceso.stderr[-2000:]}")
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def estadisticas(valores: list) -> dict:
+    ordenados = sorted(valores)
+    p95 = ordenados[min(len(ordenados) - 1, int(round(0.95 * (len(ordenados) - 1))))]
+    return {
+        "mediana_ms": round(statistics.median(ordenados) * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "min_ms": round(ordenados[0] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="main")
+    parser.add_argument("--ruta", default="/")
+    parser.add_argument("--procesos", type=int, default=10)
+    args = parser.parse_args()
+
+    # Un primer proceso para generar los .pyc: no cuenta
+    medir_proceso(args.modulo, args.ruta)
+    muestras = [medir_proceso(args.modulo, args.ruta) for _ in range(args.procesos)]
+
+    print(json.dumps({
+        "modulo": args.modulo,
+        "ruta": args.ruta,
+        "procesos": args.procesos,
+        "estado": sorted({m["estado"] for m in muestras}),
+        "importar": estadisticas([m["importar"] for m in muestras]),
+        "primera_peticion": estadisticas([m["peticion"] for m in muestras]),
+        "total": estadisticas([m["importar"] + m["peticion"] for m in muestras]),
+    }, indent=2))
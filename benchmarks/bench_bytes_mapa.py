@@ -0,0 +1,71 @@
+"""
+Bytes de imagen que descarga una vista del mapa: popups con la foto original
+(como antes) frente a la miniatura/srcset. Sube fotos sintéticas con el
+backend local (Pillow) y suma lo que pediría el navegador.
+
+    python benchmarks/bench_bytes_mapa.py --fotos 20 --ancho 4000 --alto 3000 --popups 10
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imagenes import TAMANOS_DERIVADAS
+from subidas import AlmacenamientoLocal, EjecutorSubidas
+
+
+def foto_sintetica(ancho: int, alto: int, semilla: int) -> bytes:
+    # Ruido suavizado: se comprime parecido a una foto real, no como un color plano
+    ruido = Image.effect_noise((ancho // 4, alto // 4), 60 + semilla % 40).convert("RGB")
+    imagen = ruido.resize((ancho, alto)).filter(ImageFilter.GaussianBlur(1))
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=92)
+    return salida.getvalue()
+
+
+async def medir(fotos: int, ancho: int, alto: int, popups: int, lado_maximo: int) -> dict:
+    with tempfile.TemporaryDirectory() as directorio:
+        ejecutor = EjecutorSubidas(AlmacenamientoLocal(directorio))
+        subidas = [foto_sintetica(ancho, alto, i) for i in range(fotos)]
+        resultados = await asyncio.gather(*(
+            ejecutor.subir_imagen(io.BytesIO(datos), lado_maximo, folder="bench") for datos in subidas
+        ))
+
+        def tamano(url: str) -> int:
+            return os.path.getsize(os.path.join(directorio, url[len("/media/"):]))
+
+        vistas = min(popups, fotos)
+        bytes_vista = {
+            "original_sin_reducir": sum(len(d) for d in subidas[:vistas]),
+            "original_reducido": sum(tamano(r["secure_url"]) for r in resultados[:vistas]),
+        }
+        for nombre in TAMANOS_DERIVADAS:
+            bytes_vista[nombre] = sum(tamano(r["derivadas"][nombre]) for r in resultados[:vistas])
+        ejecutor.cerrar()
+
+    return {
+        "fotos": fotos,
+        "resolucion_subida": f"{ancho}x{alto}",
+        "lado_maximo": lado_maximo,
+        "popups_por_vista": vistas,
+        "bytes_por_vista": bytes_vista,
+        "ahorro_miniatura": round(1 - bytes_vista["miniatura"] / bytes_vista["original_sin_reducir"], 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fotos", type=int, default=20)
+    parser.add_argument("--ancho", type=int, default=4000)
+    parser.add_argument("--alto", type=int, default=3000)
+    parser.add_argument("--popups", type=int, default=10)
+    parser.add_argument("--lado-maximo", type=int, default=2048)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(medir(args.fotos, args.ancho, args.alto, args.popups, args.lado_maximo)), indent=2))
@@ -0,0 +1,75 @@
+"""
+Mide el agrupamiento de marcadores con N marcadores sintéticos: tiempo de
+construir cada nivel de zoom y de consultar la vista mundial y una vista
+regional.
+
+    python benchmarks/bench_clusters.py --marcadores 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agrupamiento import IndiceClusters
+
+
+def sintetico(n: int, semilla: int = 42):
+    rng = np.random.default_rng(semilla)
+    # Mezcla de puntos repartidos por el mundo y concentrados en "ciudades"
+    centros = rng.uniform([-60, -150], [65, 150], size=(200, 2))
+    elegidos = centros[rng.integers(0, len(centros), n // 2)]
+    cercanos = elegidos + rng.normal(0, 0.5, size=elegidos.shape)
+    dispersos = rng.uniform([-60, -180], [75, 180], size=(n - len(cercanos), 2))
+    puntos = np.vstack([cercanos, dispersos])
+    datos = [{"ciudad": f"Sitio {i}", "lat": float(lat), "lon": float(lon), "img": ""}
+             for i, (lat, lon) in enumerate(puntos)]
+    return puntos[:, 0], puntos[:, 1], datos
+
+
+def medir(n: int, max_zoom: int) -> dict:
+    lats, lons, datos = sintetico(n)
+
+    inicio = time.perf_counter()
+    indice = IndiceClusters(lats, lons, datos, max_zoom=max_zoom)
+    construccion = time.perf_counter() - inicio
+
+    niveles = {}
+    for zoom in range(0, max_zoom + 1):
+        inicio = time.perf_counter()
+        indice._nivel(zoom)
+        primera = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        mundo = indice.consultar(-180, -85, 180, 85, zoom)
+        consulta_mundo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        region = indice.consultar(-10, 35, 5, 44, zoom)
+        consulta_region = time.perf_counter() - inicio
+
+        niveles[zoom] = {
+            "calculo_nivel_ms": round(primera * 1000, 2),
+            "mundo_ms": round(consulta_mundo * 1000, 2),
+            "mundo_elementos": len(mundo["clusters"]) + len(mundo["marcadores"]),
+            "region_ms": round(consulta_region * 1000, 2),
+            "region_elementos": len(region["clusters"]) + len(region["marcadores"]),
+        }
+
+    return {
+        "marcadores": n,
+        "proyeccion_ms": round(construccion * 1000, 2),
+        "niveles": niveles,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marcadores", type=int, default=100_000)
+    parser.add_argument("--max-zoom", type=int, default=12)
+    args = parser.parse_args()
+    print(json.dumps(medir(args.marcadores, args.max_zoom), indent=2))
@@ -0,0 +1,105 @@
+"""
+Compara el filtrado de Objeto1 antiguo (un find + un find_one por resultado)
+con el actual (un cursor con proyección), contando los comandos que llegan
+a Mongo. Necesita un mongod local:
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_filtrar_objeto1.py --docs 5000
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+import time
+
+import motor.motor_asyncio as motor
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from objeto1 import PROYECCION_OBJETO1, serializar_objeto1
+
+
+class ContadorComandos(monitoring.CommandListener):
+    def __init__(self):
+        self.comandos = {}
+
+    def started(self, event):
+        self.comandos[event.command_name] = self.comandos.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reiniciar(self):
+        self.comandos = {}
+
+
+async def sembrar(coleccion, docs: int):
+    await coleccion.drop()
+    base = datetime(2024, 1, 1)
+    await coleccion.insert_many([
+        {
+            "lista1": ["a", "b", str(i % 7)],
+            "descripcion": f"objeto numero {i}",
+            "booleano": i % 2 == 0,
+            "fecha": base + timedelta(hours=i),
+            "entero": i,
+            # Campo pesado que la proyección evita transferir
+            "relleno": "x" * 2000,
+        }
+        for i in range(docs)
+    ])
+
+
+async def filtrar_antiguo(coleccion, filtros):
+    lista = []
+    async for reg in coleccion.find(filtros):
+        objeto1 = await coleccion.find_one({"_id": reg["_id"]})
+        lista.append(serializar_objeto1(objeto1))
+    return lista
+
+
+async def filtrar_actual(coleccion, filtros, batch_size):
+    lista = []
+    async for reg in coleccion.find(filtros, PROYECCION_OBJETO1).batch_size(batch_size):
+        lista.append(serializar_objeto1(reg))
+    return lista
+
+
+async def main(docs: int, batch_size: int):
+    contador = ContadorComandos()
+    client = motor.AsyncIOMotorClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017"),
+                                      event_listeners=[contador])
+    coleccion = client["MiMapaBench"]["Tabla1"]
+    await sembrar(coleccion, docs)
+    filtros = {"entero": {"$gte": 0}}
+
+    resultados = {}
+    for nombre, funcion in (
+        ("antiguo", lambda: filtrar_antiguo(coleccion, filtros)),
+        ("actual", lambda: filtrar_actual(coleccion, filtros, batch_size)),
+    ):
+        contador.reiniciar()
+        inicio = time.perf_counter()
+        lista = await funcion()
+        resultados[nombre] = {
+            "documentos": len(lista),
+            "segundos": round(time.perf_counter() - inicio, 3),
+            "comandos": dict(contador.comandos),
+            "round_trips": sum(contador.comandos.values()),
+        }
+
+    await client.drop_database("MiMapaBench")
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.docs, args.batch_size))
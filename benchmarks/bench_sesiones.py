@@ -0,0 +1,101 @@
+"""
+Compara la sesión "gorda" (usuario completo + ID token en la cookie firmada)
+con la sesión ligera (solo el id en la cookie y los datos en SesionesMemoria):
+tamaño de la cabecera Cookie y coste por petición.
+
+    python benchmarks/bench_sesiones.py --peticiones 5000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sesiones import SesionesMemoria, nuevo_sid
+
+CLAVE = "SUPER_SECRET_KEY_RANDOM"
+
+
+def token_falso() -> str:
+    # Un ID token de Google real ronda 1-1,3 KB
+    cabecera = base64.urlsafe_b64encode(json.dumps({"alg": "RS256", "kid": "x" * 40}).encode()).decode()
+    cuerpo = base64.urlsafe_b64encode(os.urandom(600)).decode()
+    firma = base64.urlsafe_b64encode(os.urandom(256)).decode()
+    return f"{cabecera}.{cuerpo}.{firma}"
+
+
+USUARIO = {
+    "google_id": "1" * 21,
+    "email": "usuario@example.com",
+    "name": "Usuaria de Prueba",
+    "picture": "https://lh3.googleusercontent.com/a/" + "x" * 80,
+}
+
+
+def app_gorda():
+    async def login(request):
+        request.session["user"] = {**USUARIO, "raw_token": token_falso()}
+        return JSONResponse({})
+
+    async def pagina(request):
+        return JSONResponse({"email": request.session.get("user", {}).get("email")})
+
+    return Starlette(routes=[Route("/login", login), Route("/", pagina)],
+                     middleware=[Middleware(SessionMiddleware, secret_key=CLAVE)])
+
+
+def app_ligera(almacen: SesionesMemoria):
+    async def login(request):
+        sid = nuevo_sid()
+        await almacen.guardar(sid, {**USUARIO, "token_fragmento": token_falso()[-16:]})
+        request.session["sid"] = sid
+        return JSONResponse({})
+
+    async def pagina(request):
+        user = await almacen.obtener(request.session.get("sid", ""))
+        return JSONResponse({"email": (user or {}).get("email")})
+
+    return Starlette(routes=[Route("/login", login), Route("/", pagina)],
+                     middleware=[Middleware(SessionMiddleware, secret_key=CLAVE)])
+
+
+async def medir(app, peticiones: int) -> dict:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as cliente:
+        await cliente.get("/login")
+        cookie = "; ".join(f"{k}={v}" for k, v in cliente.cookies.items())
+
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            await cliente.get("/")
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "bytes_cabecera_cookie": len("Cookie: " + cookie),
+        "us_por_peticion": round(duracion / peticiones * 1e6, 1),
+    }
+
+
+async def main(peticiones: int):
+    resultados = {
+        "antes_cookie_gorda": await medir(app_gorda(), peticiones),
+        "despues_solo_sid": await medir(app_ligera(SesionesMemoria()), peticiones),
+    }
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peticiones", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.peticiones))
@@ -0,0 +1,49 @@
+"""
+Mide el rendimiento del pool de subidas con el backend local (sin red).
+
+    python benchmarks/bench_subidas.py --subidas 200 --hilos 4 --tamano 2000000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subidas import AlmacenamientoLocal, EjecutorSubidas
+
+
+async def medir(subidas: int, hilos: int, tamano: int) -> dict:
+    with tempfile.TemporaryDirectory() as directorio:
+        ejecutor = EjecutorSubidas(AlmacenamientoLocal(directorio), hilos=hilos)
+        datos = os.urandom(tamano)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(
+            ejecutor.subir(io.BytesIO(datos), public_id=str(i), folder="bench")
+            for i in range(subidas)
+        ))
+        duracion = time.perf_counter() - inicio
+        ejecutor.cerrar()
+
+    return {
+        "subidas": subidas,
+        "hilos": hilos,
+        "bytes_por_subida": tamano,
+        "segundos": round(duracion, 3),
+        "subidas_por_segundo": round(subidas / duracion, 1),
+        "metricas": ejecutor.metricas(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subidas", type=int, default=200)
+    parser.add_argument("--hilos", type=int, default=4)
+    parser.add_argument("--tamano", type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(medir(args.subidas, args.hilos, args.tamano)), indent=2))
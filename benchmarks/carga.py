@@ -0,0 +1,521 @@
+"""
+Prueba de carga de los caminos más usados de los dos servicios:
+
+    ver_mapa          GET  /mapa?email_destino=...      (main.app, con sesión)
+    marcadores        GET  /marcadores/{email}          (main.app)
+    nuevo_marcador    POST /web/nuevo-marcador          (main.app, geocoding + foto)
+    archivo           POST /v2/archivo                  (archivoAPI.app)
+    filtrar_objeto1   GET  /path/filtrar                (main.app)
+    cambios           GET  /marcadores/{email}/cambios  (main.app, sincronización del mapa)
+    teselas           GET  /teselas/{z}/{x}/{y}.png     (main.app, proxy con caché en disco)
+
+Siembra usuarios, marcadores, visitas y documentos de Objeto1 sintéticos,
+arranca las dos aplicaciones con su lifespan y las ataca en concurrencia con
+httpx.ASGITransport (sin servidor ni red). Los servicios externos son locales:
+
+- Nominatim, los certificados de Google y el origen de las teselas: un
+  httpx.MockTransport con latencia configurable en el cliente HTTP
+  compartido. Los usuarios entran por /login con ID tokens firmados por una
+  clave RSA generada al vuelo. Las teselas (TILES_PROXY=true) se guardan en
+  un directorio temporal; --teselas fija cuántas distintas se piden, así que
+  tras la primera vuelta se sirven desde disco.
+- Cloudinary: ALMACENAMIENTO=local en un directorio temporal.
+- Mongo: por defecto mongomock_motor en memoria (mide el coste de la
+  aplicación, no el de la BD). mongomock no admite los UpdateOne de pymongo
+  4.x en bulk_write, así que los resúmenes de visitas no se actualizan
+  durante la prueba (sí las visitas; ver "visitas" en el resultado). Con
+  --mongo se usa un mongod de verdad; BORRA las colecciones de MiMapa y
+  KalendasV2 que siembra, así que solo contra una instancia desechable.
+
+Por escenario da throughput, latencia p50/p95/p99 y el pico de RSS, en JSON
+para comparar entre commits:
+
+    python benchmarks/carga.py --usuarios 50 --marcadores 200 --peticiones 500 --concurrencia 20
+    python benchmarks/carga.py --mongo mongodb://localhost:27017 --salida carga.json
+    python benchmarks/carga.py --escenarios ver_mapa,marcadores
+"""
+import argparse
+import asyncio
+import contextlib
+from datetime import datetime, timedelta, timezone
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ESCENARIOS = ("ver_mapa", "marcadores", "nuevo_marcador", "archivo", "filtrar_objeto1", "cambios", "teselas")
+CLIENT_ID = "carga.apps.googleusercontent.com"
+URL_NOMINATIM = "http://nominatim.local/search"
+URL_CERTS = "http://google.local/oauth2/v1/certs"
+URL_TESELAS = "http://teselas.local/{z}/{x}/{y}.png"
+KID = "clave-carga"
+
+
+# --- MEMORIA ---
+
+def rss_pico() -> int:
+    """Máximo RSS del proceso desde que arrancó, en bytes."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+def rss_actual() -> int:
+    """RSS del proceso en bytes (Linux); fuera de Linux, el pico de getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return rss_pico()
+
+
+class MuestreoRSS:
+    """Guarda el RSS máximo visto mientras dura un escenario."""
+
+    def __init__(self, intervalo: float = 0.01):
+        self.intervalo = intervalo
+        self.pico = 0
+        self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            self.pico = max(self.pico, rss_actual())
+            await asyncio.sleep(self.intervalo)
+
+    async def __aenter__(self):
+        self.pico = rss_actual()
+        self._tarea = asyncio.create_task(self._bucle())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._tarea.cancel()
+        self.pico = max(self.pico, rss_actual())
+
+
+# --- SERVICIOS EXTERNOS FALSOS ---
+
+class Google:
+    """Clave RSA y certificado propios para firmar ID tokens como Google."""
+
+    def __init__(self):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+        from google.auth import crypt
+
+        clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "carga")])
+        ahora = datetime.now(timezone.utc)
+        certificado = (
+            x509.CertificateBuilder()
+            .subject_name(nombre).issuer_name(nombre)
+            .public_key(clave.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(ahora - timedelta(days=1))
+            .not_valid_after(ahora + timedelta(days=1))
+            .sign(clave, hashes.SHA256())
+        )
+        self.certs = {KID: certificado.public_bytes(serialization.Encoding.PEM).decode()}
+        pem = clave.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        self.firmante = crypt.RSASigner.from_string(pem, key_id=KID)
+
+    def token(self, email: str) -> str:
+        from google.auth import jwt
+
+        ahora = int(time.time())
+        return jwt.encode(self.firmante, {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": str(zlib.crc32(email.encode())),
+            "email": email,
+            "name": email.split("@")[0],
+            "iat": ahora,
+            "exp": ahora + 3600,
+        }).decode()
+
+
+def transporte_externo(google: Google, latencia: float) -> httpx.MockTransport:
+    """Responde como Nominatim, como el endpoint de certificados de Google y como origen de teselas."""
+    from PIL import Image
+
+    def tesela(ruta: str) -> bytes:
+        # PNG de 256x256 de un color que depende de la tesela
+        semilla = zlib.crc32(ruta.encode())
+        salida = io.BytesIO()
+        Image.new("RGB", (256, 256), (semilla & 255, semilla >> 8 & 255, semilla >> 16 & 255)).save(salida, "PNG")
+        return salida.getvalue()
+
+    async def responder(request: httpx.Request) -> httpx.Response:
+        if latencia:
+            await asyncio.sleep(latencia)
+        url = str(request.url)
+        if url.startswith(URL_CERTS):
+            return httpx.Response(200, json=google.certs, headers={"Cache-Control": "public, max-age=3600"})
+        if url.startswith(URL_NOMINATIM):
+            # Coordenadas estables por nombre de ciudad
+            semilla = zlib.crc32(request.url.params.get("q", "").encode())
+            lat = (semilla % 15000) / 100 - 60
+            lon = (semilla // 15000 % 36000) / 100 - 180
+            return httpx.Response(200, json=[{"lat": str(lat), "lon": str(lon)}])
+        if request.url.host == "teselas.local":
+            return httpx.Response(200, content=tesela(request.url.path), headers={"Content-Type": "image/png"})
+        return httpx.Response(404)
+
+    return httpx.MockTransport(responder)
+
+
+# --- ENTORNO Y APLICACIONES ---
+
+def preparar_entorno(args, directorio: str) -> None:
+    """Variables que leen main.py y archivoAPI.py al importarse."""
+    os.environ.update({
+        "MONGO_URI": args.mongo or "mongodb://memoria",
+        "CLIENT_ID": CLIENT_ID,
+        "CLOUDINARY_CLOUD_NAME": "carga",
+        "CLOUDINARY_API_KEY": "carga",
+        "CLOUDINARY_API_SECRET": "carga",
+        "ALMACENAMIENTO": "local",
+        "MEDIA_DIR": os.path.join(directorio, "media"),
+        "SPOOL_DIR": os.path.join(directorio, "spool"),
+        "NOMINATIM_URL": URL_NOMINATIM,
+        "GOOGLE_CERTS_URL": URL_CERTS,
+        "ARCHIVOS_DIFERIDOS": "false",
+        "CARGA_PEREZOSA": "false",
+        "TILES_PROXY": "true",
+        "TILES_ORIGEN": URL_TESELAS,
+        "TILES_DIR": os.path.join(directorio, "teselas"),
+    })
+    if not args.mongo:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("Sin --mongo hace falta mongomock_motor (pip install mongomock-motor)")
+        import motor.motor_asyncio
+
+        # recursos.py construye el cliente con motor.AsyncIOMotorClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+def imagen_jpeg(lado: int) -> bytes:
+    from PIL import Image
+
+    imagen = Image.effect_noise((lado, lado * 3 // 4), 50).convert("RGB")
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=85)
+    return salida.getvalue()
+
+
+# --- DATOS SINTÉTICOS ---
+
+async def sembrar(main, archivo_api, args, ciudades: list) -> list:
+    rng = random.Random(args.semilla)
+    usuarios = [f"usuario{i}@carga.local" for i in range(args.usuarios)]
+    base = datetime(2024, 1, 1)
+
+    for coleccion in (main.marcadores_coleccion, main.visitas_coleccion, main.coleccion1,
+                      main.db["ResumenVisitas"], main.db["VisitantesMapa"], main.geocache_coleccion,
+                      main.sesiones_coleccion, archivo_api.database, archivo_api.blobs.coleccion):
+        await coleccion.delete_many({})
+
+    marcadores = []
+    for email in usuarios:
+        for j in range(args.marcadores):
+            lat, lon = rng.uniform(-60, 70), rng.uniform(-180, 180)
+            marcadores.append({
+                "email_usuario": email,
+                "ciudad_pais": rng.choice(ciudades),
+                "latitud": lat,
+                "longitud": lon,
+                "imagen_url": f"/media/archivos/{j}.jpg" if j % 3 == 0 else None,
+                "ubicacion": main.punto_geojson(lat, lon),
+                "version": j + 1,
+            })
+    for i in range(0, len(marcadores), 5000):
+        await main.marcadores_coleccion.insert_many(marcadores[i:i + 5000])
+    await main.versiones_marcadores.versiones.delete_many({})
+    if args.marcadores:
+        await main.versiones_marcadores.versiones.insert_many(
+            [{"_id": email, "version": args.marcadores} for email in usuarios]
+        )
+
+    visitas = [
+        {
+            "email_visitado": email,
+            "email_visitante": rng.choice(usuarios),
+            "token_visitante": "carga",
+            "fecha": base + timedelta(minutes=rng.randrange(500000)),
+        }
+        for email in usuarios
+        for _ in range(args.visitas)
+    ]
+    if visitas:
+        await main.visitas_coleccion.insert_many([dict(v) for v in visitas])
+        # Resúmenes ya agregados, escritos directamente (ver resumen_visitas.py)
+        por_mapa = {}
+        for v in visitas:
+            por_mapa.setdefault(v["email_visitado"], []).append(v)
+        parejas = {(v["email_visitado"], v["email_visitante"]) for v in visitas}
+        await main.db["VisitantesMapa"].insert_many([
+            {"_id": {"visitado": visitado, "visitante": visitante}, "primera": base}
+            for visitado, visitante in parejas
+        ])
+        await main.db["ResumenVisitas"].insert_many([
+            {
+                "_id": email,
+                "total": len(lista),
+                "unicos": len({v["email_visitante"] for v in lista}),
+                "ultimas": [
+                    {"email_visitante": v["email_visitante"], "fecha": v["fecha"], "token": v["token_visitante"]}
+                    for v in sorted(lista, key=lambda v: v["fecha"], reverse=True)[:main.resumen_visitas.ultimas]
+                ],
+            }
+            for email, lista in por_mapa.items()
+        ])
+
+    objetos = [
+        {
+            "lista1": ["a", "b", str(i % 7)],
+            "descripcion": f"objeto numero {i}",
+            "booleano": i % 2 == 0,
+            "fecha": base + timedelta(hours=i),
+            "entero": i,
+        }
+        for i in range(args.objetos)
+    ]
+    if objetos:
+        await main.coleccion1.insert_many(objetos)
+    return usuarios
+
+
+async def iniciar_sesiones(cliente: httpx.AsyncClient, google: Google, usuarios: list) -> dict:
+    """Cookie de sesión de cada usuario, entrando por /login como en el navegador."""
+    cookies = {}
+    for email in usuarios:
+        respuesta = await cliente.post("/login", json={"token": google.token(email)})
+        if respuesta.status_code != 303:
+            raise SystemExit(f"ERROR LOGIN {email}: {respuesta.status_code} {respuesta.text[:200]}")
+        cookies[email] = f"session={respuesta.cookies['session']}"
+    return cookies
+
+
+# --- ESCENARIOS ---
+
+def crear_escenarios(mapa, archivos, usuarios, cookies, ciudades, args) -> dict:
+    """Cada escenario: (función que hace una petición, códigos esperados)."""
+    rng = random.Random(args.semilla + 1)
+    foto = imagen_jpeg(args.lado_imagen)
+    inicio_objetos = datetime(2024, 1, 1)
+
+    async def ver_mapa(i):
+        visitante, visitado = rng.choice(usuarios), rng.choice(usuarios)
+        return await mapa.get("/mapa", params={"email_destino": visitado}, headers={"Cookie": cookies[visitante]})
+
+    async def marcadores(i):
+        return await mapa.get(f"/marcadores/{rng.choice(usuarios)}", params={"limit": args.limite})
+
+    async def nuevo_marcador(i):
+        email = rng.choice(usuarios)
+        return await mapa.post(
+            "/web/nuevo-marcador",
+            data={"email": email, "ciudad": rng.choice(ciudades)},
+            files={"imagen": (f"foto{i}.jpg", foto, "image/jpeg")},
+            headers={"Cookie": cookies[email]},
+        )
+
+    async def archivo(i):
+        # Contenido distinto en cada petición: sin deduplicación
+        contenido = os.urandom(args.kb_archivo * 1024)
+        return await archivos.post("/v2/archivo", files={"file": (f"archivo{i}.bin", contenido, "application/octet-stream")})
+
+    async def filtrar_objeto1(i):
+        desde = inicio_objetos + timedelta(hours=rng.randrange(max(1, args.objetos)))
+        return await mapa.get("/path/filtrar", params={
+            "start_fecha": desde.isoformat(),
+            "end_fecha": (desde + timedelta(hours=args.ventana_horas)).isoformat(),
+        })
+
+    async def cambios(i):
+        # Mitad de los clientes con la copia al día, mitad a medio sincronizar
+        desde = args.marcadores if i % 2 else rng.randrange(args.marcadores + 1)
+        return await mapa.get(f"/marcadores/{rng.choice(usuarios)}/cambios", params={"desde": desde, "limit": 1000})
+
+    teselas = [(z, x, y) for z in range(2, 20) for x in range(2) for y in range(2)][:args.teselas]
+
+    async def tesela(i):
+        z, x, y = rng.choice(teselas)
+        return await mapa.get(f"/teselas/{z}/{x}/{y}.png")
+
+    return {
+        "ver_mapa": (ver_mapa, {200}),
+        "marcadores": (marcadores, {200}),
+        "nuevo_marcador": (nuevo_marcador, {303}),
+        "archivo": (archivo, {200}),
+        "filtrar_objeto1": (filtrar_objeto1, {200}),
+        "cambios": (cambios, {200}),
+        "teselas": (tesela, {200}),
+    }
+
+
+def percentil(ordenados: list, p: float) -> float:
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return round(ordenados[indice] * 1000, 2)
+
+
+async def ejecutar(funcion, esperados: set, peticiones: int, concurrencia: int, calentamiento: int) -> dict:
+    for i in range(calentamiento):
+        await funcion(-1 - i)
+
+    latencias, estados = [], {}
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for i in siguiente:
+            t0 = time.perf_counter()
+            try:
+                estado = (await funcion(i)).status_code
+            except Exception as e:
+                estado = type(e).__name__
+            latencias.append(time.perf_counter() - t0)
+            estados[str(estado)] = estados.get(str(estado), 0) + 1
+            if estado not in esperados:
+                errores += 1
+
+    async with MuestreoRSS() as rss:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    ordenados = sorted(latencias)
+    return {
+        "peticiones": peticiones,
+        "errores": errores,
+        "estados": estados,
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(peticiones / duracion, 1),
+        "latencia_ms": {
+            "p50": percentil(ordenados, 50),
+            "p95": percentil(ordenados, 95),
+            "p99": percentil(ordenados, 99),
+            "media": round(statistics.fmean(ordenados) * 1000, 2),
+            "max": round(ordenados[-1] * 1000, 2),
+        },
+        "rss_pico_mb": round(rss.pico / 2 ** 20, 1),
+    }
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def medir(args) -> dict:
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        preparar_entorno(args, directorio)
+        import archivoAPI
+        import main
+        from instrumentacion import eventos_httpx
+
+        google = Google()
+        ciudades = [f"Ciudad {i}, País {i % 40}" for i in range(args.ciudades)]
+        # Cliente HTTP compartido de main.py con Nominatim y Google simulados
+        main.recursos._http = httpx.AsyncClient(
+            transport=transporte_externo(google, args.latencia_externa / 1000), event_hooks=eventos_httpx()
+        )
+
+        resultados = {}
+        async with main.app.router.lifespan_context(main.app), \
+                archivoAPI.app.router.lifespan_context(archivoAPI.app):
+            t0 = time.perf_counter()
+            usuarios = await sembrar(main, archivoAPI, args, ciudades)
+            siembra = time.perf_counter() - t0
+
+            transporte_mapa = httpx.ASGITransport(app=main.app)
+            transporte_archivos = httpx.ASGITransport(app=archivoAPI.app)
+            async with httpx.AsyncClient(transport=transporte_mapa, base_url="http://mapa") as mapa, \
+                    httpx.AsyncClient(transport=transporte_archivos, base_url="http://archivos") as archivos:
+                cookies = await iniciar_sesiones(mapa, google, usuarios)
+                tabla = crear_escenarios(mapa, archivos, usuarios, cookies, ciudades, args)
+                for nombre in escenarios:
+                    funcion, esperados = tabla[nombre]
+                    resultados[nombre] = await ejecutar(
+                        funcion, esperados, args.peticiones, args.concurrencia, args.calentamiento
+                    )
+            await main.buffer_visitas.vaciar()
+            visitas = main.buffer_visitas.metricas()
+            teselas = main.proxy_teselas().metricas() if main.proxy_teselas.creado else None
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "mongo": "memoria" if not args.mongo else "mongod",
+        "configuracion": {
+            clave: getattr(args, clave)
+            for clave in ("usuarios", "marcadores", "visitas", "objetos", "ciudades", "peticiones",
+                          "concurrencia", "calentamiento", "latencia_externa", "lado_imagen", "kb_archivo",
+                          "teselas")
+        },
+        "siembra_s": round(siembra, 2),
+        "rss_pico_proceso_mb": round(rss_pico() / 2 ** 20, 1),
+        "escenarios": resultados,
+        "visitas": visitas,
+        "teselas": teselas,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", help="URI de un mongod desechable (por defecto, en memoria)")
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--marcadores", type=int, default=200, help="marcadores por usuario")
+    parser.add_argument("--visitas", type=int, default=50, help="visitas por mapa")
+    parser.add_argument("--objetos", type=int, default=5000, help="documentos de Objeto1")
+    parser.add_argument("--ciudades", type=int, default=200, help="nombres distintos para el geocoding")
+    parser.add_argument("--peticiones", type=int, default=500, help="peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--calentamiento", type=int, default=20, help="peticiones previas que no cuentan")
+    parser.add_argument("--latencia-externa", type=float, default=50.0, help="ms de Nominatim/Google simulados")
+    parser.add_argument("--lado-imagen", type=int, default=1600, help="lado de la foto de nuevo_marcador")
+    parser.add_argument("--kb-archivo", type=int, default=256, help="tamaño de cada subida a /v2/archivo")
+    parser.add_argument("--limite", type=int, default=100, help="limit de /marcadores/{email}")
+    parser.add_argument("--teselas", type=int, default=64, help="teselas distintas del escenario teselas")
+    parser.add_argument("--ventana-horas", type=int, default=48, help="rango de fechas de filtrar_objeto1")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="además de imprimirlo, guarda el JSON en este archivo")
+    args = parser.parse_args()
+
+    # Los print de la aplicación van a stderr: stdout queda solo para el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        resultado = asyncio.run(medir(args))
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
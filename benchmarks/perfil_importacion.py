@@ -0,0 +1,91 @@
+"""
+Perfil del arranque: ejecuta `python -X importtime -c "import main"` en un
+proceso nuevo y resume el informe por módulo y por paquete (tiempo propio y
+acumulado, en ms). Las variables de entorno que faltan se rellenan con
+valores de prueba; no hace falta Mongo, no se conecta al importar.
+
+    python benchmarks/perfil_importacion.py --modulo main --top 25
+    python benchmarks/perfil_importacion.py --modulo archivoAPI --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV_PRUEBA = {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CLIENT_ID": "perfil",
+    "CLOUDINARY_CLOUD_NAME": "perfil",
+    "CLOUDINARY_API_KEY": "perfil",
+    "CLOUDINARY_API_SECRET": "perfil",
+}
+
+
+def entorno() -> dict:
+    variables = dict(os.environ)
+    for clave, valor in ENV_PRUEBA.items():
+        variables.setdefault(clave, valor)
+    variables["PYTHONPATH"] = RAIZ
+    variables.pop("PYTHONDONTWRITEBYTECODE", None)
+    return variables
+
+
+def importtime(modulo: str) -> list:
+    """Filas (modulo, propio_us, acumulado_us) del informe de -X importtime."""
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, env=entorno(), capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise SystemExit(f"ERROR IMPORTANDO {modulo}:\n{proceso.stderr[-2000:]}")
+
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        filas.append((nombre.strip(), int(propio), int(acumulado)))
+    return filas
+
+
+def resumen(filas: list, top: int) -> dict:
+    paquetes = defaultdict(int)
+    for nombre, propio, _ in filas:
+        paquetes[nombre.split(".")[0]] += propio
+
+    def ms(us: int) -> float:
+        return round(us / 1000, 2)
+
+    total = sum(propio for _, propio, _ in filas)
+    por_acumulado = sorted(filas, key=lambda f: f[2], reverse=True)[:top]
+    por_paquete = sorted(paquetes.items(), key=lambda p: p[1], reverse=True)[:top]
+    return {
+        "modulos": len(filas),
+        "total_ms": ms(total),
+        "modulos_acumulado_ms": [{"modulo": n, "propio": ms(p), "acumulado": ms(a)} for n, p, a in por_acumulado],
+        "paquetes_ms": [{"paquete": n, "propio": ms(p)} for n, p in por_paquete],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    datos = resumen(importtime(args.modulo), args.top)
+    if args.json:
+        print(json.dumps(datos, indent=2))
+    else:
+        print(f"import {args.modulo}: {datos['total_ms']} ms en {datos['modulos']} módulos\n")
+        print(f"{'acumulado':>10} {'propio':>8}  módulo")
+        for fila in datos["modulos_acumulado_ms"]:
+            print(f"{fila['acumulado']:>10} {fila['propio']:>8}  {fila['modulo']}")
+        print(f"\n{'propio':>10}  paquete")
+        for fila in datos["paquetes_ms"]:
+            print(f"{fila['propio']:>10}  {fila['paquete']}")
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+FIRE_AND_FORGET = "fire-and-forget"
+AWAIT_ACK = "await-ack"
+
+
+class BufferVisitas:
+    """
+    Acumula en memoria las visitas de ver_mapa y las escribe por lotes con
+    insert_many(ordered=False) cuando se llena el lote o pasa el intervalo.
+
+    - fire-and-forget: registrar() vuelve al instante.
+    - await-ack: registrar() espera a que el lote con la visita se escriba.
+
+    Opcionalmente agrupa las visitas repetidas del mismo visitante al mismo
+    mapa dentro de una ventana de segundos (solo se guarda la primera).
+    Tras cada lote se llama a al_escribir con las visitas que se guardaron.
+    """
+
+    def __init__(
+        self,
+        coleccion,
+        max_lote: int = 100,
+        intervalo: float = 1.0,
+        ventana_coalescencia: float = 0.0,
+        modo: str = FIRE_AND_FORGET,
+        al_escribir: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        if modo not in (FIRE_AND_FORGET, AWAIT_ACK):
+            raise ValueError(f"Modo de durabilidad desconocido: {modo}")
+        self.coleccion = coleccion
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.ventana_coalescencia = ventana_coalescencia
+        self.modo = modo
+        self.al_escribir = al_escribir
+
+        self._pendientes: List[dict] = []
+        self._esperando: List[asyncio.Future] = []
+        self._ultimas: Dict[Tuple[str, str], float] = {}
+        self._lleno = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self._parar = False
+
+        self.registradas = 0
+        self.agrupadas = 0
+        self.escritas = 0
+        self.errores = 0
+        self.lotes = 0
+        self.ultimo_vaciado_ms: Optional[float] = None
+
+    # --- ENTRADA ---
+
+    async def registrar(self, visita: dict) -> None:
+        if self._coalescer(visita):
+            self.agrupadas += 1
+            return
+
+        self.registradas += 1
+        self._pendientes.append(visita)
+        futuro = None
+        if self.modo == AWAIT_ACK:
+            futuro = asyncio.get_running_loop().create_future()
+            self._esperando.append(futuro)
+
+        if len(self._pendientes) >= self.max_lote or self._tarea is None:
+            # Sin tarea de fondo (p.ej. fuera del lifespan) escribimos directamente
+            if self._tarea is None:
+                await self.vaciar()
+            else:
+                self._lleno.set()
+
+        if futuro is not None:
+            await futuro
+
+    def _coalescer(self, visita: dict) -> bool:
+        if not self.ventana_coalescencia:
+            return False
+        clave = (visita["email_visitado"], visita["email_visitante"])
+        ahora = time.monotonic()
+        anterior = self._ultimas.get(clave)
+        if anterior is not None and ahora - anterior < self.ventana_coalescencia:
+            return True
+        self._ultimas[clave] = ahora
+        return False
+
+    # --- ESCRITURA ---
+
+    async def vaciar(self) -> None:
+        if not self._pendientes:
+            return
+        lote, self._pendientes = self._pendientes, []
+        esperando, self._esperando = self._esperando, []
+
+        inicio = time.perf_counter()
+        error = None
+        # Posiciones del lote que no se escribieron (None: ninguna se escribió)
+        fallidas: Optional[set] = set()
+        escritas = lote
+        try:
+            await self.coleccion.insert_many(lote, ordered=False)
+        except BulkWriteError as e:
+            # Con ordered=False el resto del lote sí se ha escrito
+            fallidas = {err["index"] for err in e.details.get("writeErrors", [])}
+            escritas = [v for i, v in enumerate(lote) if i not in fallidas]
+            self.errores += len(fallidas)
+            error = e
+        except Exception as e:
+            escritas = []
+            fallidas = None
+            self.errores += len(lote)
+            error = e
+            print(f"ERROR GUARDANDO VISITAS ({len(lote)}): {e}")
+        self.escritas += len(escritas)
+
+        if escritas and self.al_escribir is not None:
+            try:
+                await self.al_escribir(escritas)
+            except Exception as e:
+                print(f"ERROR ACTUALIZANDO RESUMEN DE VISITAS: {e}")
+        self.lotes += 1
+        self.ultimo_vaciado_ms = round((time.perf_counter() - inicio) * 1000, 2)
+
+        # En await-ack cada visita del lote tiene su futuro en la misma posición:
+        # solo fallan las peticiones cuyas visitas no se escribieron
+        for indice, futuro in enumerate(esperando):
+            if futuro.done():
+                continue
+            if error is not None and (fallidas is None or indice in fallidas):
+                futuro.set_exception(error)
+            else:
+                futuro.set_result(None)
+
+        self._purgar_ventana()
+
+    def _purgar_ventana(self) -> None:
+        if not self.ventana_coalescencia:
+            return
+        limite = time.monotonic() - self.ventana_coalescencia
+        self._ultimas = {clave: t for clave, t in self._ultimas.items() if t >= limite}
+
+    async def _bucle(self) -> None:
+        while not self._parar:
+            try:
+                await asyncio.wait_for(self._lleno.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._lleno.clear()
+            await self.vaciar()
+
+    # --- CICLO DE VIDA ---
+
+    async def iniciar(self) -> None:
+        self._parar = False
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self) -> None:
+        """Para la tarea de fondo y escribe lo que quede en el buffer."""
+        self._parar = True
+        self._lleno.set()
+        if self._tarea is not None:
+            await self._tarea
+            self._tarea = None
+        await self.vaciar()
+
+    def metricas(self) -> dict:
+        return {
+            "modo": self.modo,
+            "en_buffer": len(self._pendientes),
+            "registradas": self.registradas,
+            "agrupadas": self.agrupadas,
+            "escritas": self.escritas,
+            "errores": self.errores,
+            "lotes": self.lotes,
+            "ultimo_vaciado_ms": self.ultimo_vaciado_ms,
+        }
+
+
+def crear_buffer(env, coleccion, al_escribir=None) -> BufferVisitas:
+    return BufferVisitas(
+        coleccion,
+        al_escribir=al_escribir,
+        max_lote=env.int('VISITAS_LOTE', 100),
+        intervalo=env.float('VISITAS_INTERVALO', 1.0),
+        ventana_coalescencia=env.float('VISITAS_VENTANA', 0.0),
+        modo=env('VISITAS_MODO', FIRE_AND_FORGET),
+    )
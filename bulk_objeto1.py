@@ -0,0 +1,170 @@
+"""
+Escritura masiva de Objeto1 (POST /path/bulk).
+
+El cuerpo es un array JSON de operaciones, leído en streaming con ijson:
+
+    [{"op": "insertar", "documento": {"lista1": [...], "descripcion": "...",
+                                      "booleano": true, "fecha": "2024-01-01", "entero": 1}},
+     {"op": "actualizar", "id": "...", "campos": {"entero": 2}},
+     {"op": "eliminar", "id": "..."}]
+
+Las operaciones se validan (Objeto1Datos / Objeto1Parcial) y se agrupan en
+lotes que se mandan con un solo bulk_write(ordered=False). Antes de cada
+lote se comprueba con una consulta $in qué ids existen, para poder decir
+por operación si no se encontró el documento (bulk_write solo da totales).
+
+Como en importacion.py, el cuerpo se vuelca antes a un SpooledTemporaryFile
+y el informe sale como NDJSON: una línea por operación
+({"op", "tipo", "estado", "id"|"error"}) y un resumen al final.
+"""
+import json
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+import ijson
+from pydantic import ValidationError
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from objeto1 import Objeto1Datos, Objeto1Parcial
+
+TIPOS = ("insertar", "actualizar", "eliminar")
+
+Operacion = Tuple[int, dict]
+
+
+def _linea(datos: dict) -> bytes:
+    return (json.dumps(datos, ensure_ascii=False) + "\n").encode()
+
+
+def _errores_validacion(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+class EscritorBulkObjeto1:
+
+    def __init__(self, coleccion, lote: int = 500, al_escribir: Optional[Callable[[], None]] = None):
+        self.coleccion = coleccion
+        self.lote = lote
+        # Se llama tras cada lote que ha cambiado algo (p.ej. invalidar /stats)
+        self.al_escribir = al_escribir
+
+    async def escribir(self, operaciones: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+        """Genera el informe NDJSON: una línea por operación y un resumen al final."""
+        resumen = {"operaciones": 0, "insertadas": 0, "actualizadas": 0, "eliminadas": 0,
+                   "no_encontradas": 0, "errores": 0}
+        lote: List[Operacion] = []
+        numero = 0
+        entrada = operaciones.__aiter__()
+        while True:
+            # Solo el parseo cuenta como cuerpo mal formado, no lo que pase al procesar un lote
+            try:
+                operacion = await entrada.__anext__()
+            except StopAsyncIteration:
+                break
+            except (ValueError, ijson.JSONError) as e:
+                # Se escriben las operaciones leídas hasta el error
+                resumen["error_cuerpo"] = str(e)
+                break
+            numero += 1
+            lote.append((numero, operacion))
+            if len(lote) >= self.lote:
+                completo, lote = lote, []
+                async for linea in self._procesar(completo, resumen):
+                    yield linea
+        if lote:
+            async for linea in self._procesar(lote, resumen):
+                yield linea
+
+        yield _linea({"resumen": resumen})
+
+    def _preparar(self, numero: int, operacion) -> dict:
+        """Valida una operación; devuelve su línea de informe con la operación de pymongo."""
+        if not isinstance(operacion, dict) or operacion.get("op") not in TIPOS:
+            return {"op": numero, "estado": "error", "error": f"op debe ser uno de: {', '.join(TIPOS)}"}
+        tipo = operacion["op"]
+        informe = {"op": numero, "tipo": tipo}
+
+        if tipo == "insertar":
+            try:
+                documento = Objeto1Datos.model_validate(operacion.get("documento")).model_dump()
+            except ValidationError as e:
+                return {**informe, "estado": "error", "error": _errores_validacion(e)}
+            # El id se genera aquí para poder devolverlo aunque otras del lote fallen
+            documento["_id"] = ObjectId()
+            return {**informe, "id": documento["_id"], "pymongo": InsertOne(documento)}
+
+        if not ObjectId.is_valid(operacion.get("id")):
+            return {**informe, "estado": "error", "error": "id inválido"}
+        obj_id = ObjectId(operacion["id"])
+        if tipo == "eliminar":
+            return {**informe, "id": obj_id, "pymongo": DeleteOne({"_id": obj_id})}
+
+        try:
+            campos = Objeto1Parcial.model_validate(operacion.get("campos")).model_dump(exclude_none=True)
+        except ValidationError as e:
+            return {**informe, "estado": "error", "error": _errores_validacion(e)}
+        if not campos:
+            return {**informe, "estado": "error", "error": "campos vacío"}
+        return {**informe, "id": obj_id, "pymongo": UpdateOne({"_id": obj_id}, {"$set": campos})}
+
+    async def _procesar(self, lote: List[Operacion], resumen: dict) -> AsyncIterator[bytes]:
+        resumen["operaciones"] += len(lote)
+
+        # 1. Validar
+        informes = [self._preparar(numero, operacion) for numero, operacion in lote]
+
+        # 2. Qué documentos existen, para los que se actualizan o borran
+        ids = [i["id"] for i in informes if "pymongo" in i and i["tipo"] != "insertar"]
+        existentes = set()
+        try:
+            if ids:
+                async for doc in self.coleccion.find({"_id": {"$in": ids}}, {"_id": 1}):
+                    existentes.add(doc["_id"])
+        except PyMongoError as e:
+            for informe in informes:
+                if informe.pop("pymongo", None) is not None:
+                    informe["estado"] = "error"
+                    informe["error"] = f"Error de lectura del lote: {e}"
+
+        pendientes = []
+        for informe in informes:
+            if "pymongo" not in informe:
+                continue
+            if informe["tipo"] != "insertar" and informe["id"] not in existentes:
+                informe.pop("pymongo")
+                informe["estado"] = "no_encontrado"
+                continue
+            pendientes.append(informe)
+
+        # 3. Un bulk_write por lote
+        fallidas = {}
+        if pendientes:
+            try:
+                await self.coleccion.bulk_write([i.pop("pymongo") for i in pendientes], ordered=False)
+            except BulkWriteError as e:
+                fallidas = {err["index"]: err.get("errmsg", "Error de escritura")
+                            for err in e.details.get("writeErrors", [])}
+            except PyMongoError as e:
+                # Red, timeout...: no sabemos qué operaciones se aplicaron, el lote cuenta como fallido
+                fallidas = dict.fromkeys(range(len(pendientes)), f"Error de escritura del lote: {e}")
+            for indice, informe in enumerate(pendientes):
+                if indice in fallidas:
+                    informe["estado"] = "error"
+                    informe["error"] = fallidas[indice]
+                else:
+                    informe["estado"] = "ok"
+            if len(fallidas) < len(pendientes) and self.al_escribir is not None:
+                self.al_escribir()
+
+        contadores = {"insertar": "insertadas", "actualizar": "actualizadas", "eliminar": "eliminadas"}
+        for informe in informes:
+            if informe["estado"] == "ok":
+                resumen[contadores[informe["tipo"]]] += 1
+            elif informe["estado"] == "no_encontrado":
+                resumen["no_encontradas"] += 1
+            else:
+                resumen["errores"] += 1
+            if "id" in informe:
+                informe["id"] = str(informe["id"])
+            yield _linea(informe)
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import time
+from typing import Any, Hashable, Optional
+
+
+class CacheLRU:
+    """
+    Caché en memoria de proceso con política LRU y caducidad (TTL) por entrada.
+    No es thread-safe: está pensada para usarse desde el bucle de eventos.
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl: Optional[float] = None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: Hashable, defecto: Any = None) -> Any:
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return defecto
+
+        valor, expira = entrada
+        if expira is not None and expira <= time.monotonic():
+            # Caducada: la quitamos y contamos como fallo
+            del self._datos[clave]
+            self.fallos += 1
+            return defecto
+
+        self._datos.move_to_end(clave)
+        self.aciertos += 1
+        return valor
+
+    def guardar(self, clave: Hashable, valor: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expira = time.monotonic() + ttl if ttl is not None else None
+        self._datos[clave] = (valor, expira)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def invalidar(self, clave: Hashable) -> None:
+        self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._datos),
+            "max_entradas": self.max_entradas,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+        }
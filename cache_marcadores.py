@@ -0,0 +1,160 @@
+"""
+Caché de lectura de los marcadores de cada usuario.
+
+Dos niveles: una LRU con TTL en memoria del proceso y, opcionalmente, un
+backend compartido entre procesos (interfaz BackendCompartido; en local se
+puede usar BackendCompartidoMemoria). Cada entrada lleva un ETag calculado
+sobre su contenido, de modo que una petición con If-None-Match se puede
+contestar con 304 sin tocar Mongo. Se invalida al crear marcadores.
+"""
+from bisect import bisect_right
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from bson import ObjectId
+
+from cache_lru import CacheLRU
+from marcador import CAMPOS_MARCADOR
+from paginacion import codificar_cursor, decodificar_cursor, limitar
+
+
+class BackendCompartido(Protocol):
+    async def obtener(self, clave: str) -> Optional[bytes]: ...
+
+    async def guardar(self, clave: str, valor: bytes, ttl: float) -> None: ...
+
+    async def borrar(self, clave: str) -> None: ...
+
+
+class BackendCompartidoMemoria:
+    """Sustituto local de un backend compartido (tipo Redis) para pruebas."""
+
+    def __init__(self):
+        self._datos: Dict[str, Tuple[bytes, float]] = {}
+
+    async def obtener(self, clave: str) -> Optional[bytes]:
+        valor = self._datos.get(clave)
+        if valor is None or valor[1] <= time.monotonic():
+            return None
+        return valor[0]
+
+    async def guardar(self, clave: str, valor: bytes, ttl: float) -> None:
+        self._datos[clave] = (valor, time.monotonic() + ttl)
+
+    async def borrar(self, clave: str) -> None:
+        self._datos.pop(clave, None)
+
+
+def calcular_limites(marcadores: List[dict]) -> Optional[list]:
+    if not marcadores:
+        return None
+    lats = [m["latitud"] for m in marcadores]
+    lons = [m["longitud"] for m in marcadores]
+    return [[min(lats), min(lons)], [max(lats), max(lons)]]
+
+
+class CacheMarcadores:
+
+    def __init__(self, coleccion, max_usuarios: int = 1024, ttl: float = 300.0,
+                 max_marcadores: int = 5000, compartido: Optional[BackendCompartido] = None):
+        self.coleccion = coleccion
+        self.ttl = ttl
+        # Los usuarios con más marcadores que esto no se cachean (van a Mongo)
+        self.max_marcadores = max_marcadores
+        self.compartido = compartido
+        self.memoria = CacheLRU(max_entradas=max_usuarios, ttl=ttl)
+        self.aciertos_compartido = 0
+        self.lecturas_mongo = 0
+        self.respuestas_304 = 0
+        # Si se invalida mientras se lee de Mongo, esa lectura no se guarda
+        self._generacion: Dict[str, int] = {}
+
+    @staticmethod
+    def _clave(email: str) -> str:
+        return f"marcadores:{email}"
+
+    async def _leer_cache(self, email: str) -> Optional[dict]:
+        entrada = self.memoria.obtener(email)
+        if entrada is None and self.compartido is not None:
+            valor = await self.compartido.obtener(self._clave(email))
+            if valor is not None:
+                self.aciertos_compartido += 1
+                entrada = json.loads(valor)
+                self.memoria.guardar(email, entrada)
+        return entrada
+
+    async def etag(self, email: str) -> Optional[str]:
+        """ETag de la entrada cacheada, sin consultar Mongo (None si no está)."""
+        entrada = await self._leer_cache(email)
+        return entrada.get("etag") if entrada else None
+
+    async def obtener(self, email: str) -> Optional[dict]:
+        """
+        Devuelve {"etag", "marcadores", "limites"} o None si el usuario tiene
+        demasiados marcadores para cachearlos.
+        """
+        entrada = await self._leer_cache(email)
+        if entrada is not None:
+            return entrada if entrada.get("etag") else None
+
+        self.lecturas_mongo += 1
+        generacion = self._generacion.get(email, 0)
+        proyeccion = dict.fromkeys(CAMPOS_MARCADOR, 1)
+        cursor = self.coleccion.find({"email_usuario": email}, proyeccion).sort("_id", 1)
+        docs = await cursor.limit(self.max_marcadores + 1).to_list(self.max_marcadores + 1)
+
+        if len(docs) > self.max_marcadores:
+            # Entrada "negativa": recordamos que no merece la pena cachearlo
+            entrada = {"etag": None}
+        else:
+            marcadores = [{"_id": str(doc["_id"]), **{c: doc.get(c) for c in CAMPOS_MARCADOR}} for doc in docs]
+            contenido = json.dumps(marcadores, sort_keys=True, default=str).encode()
+            entrada = {
+                "etag": f'"{hashlib.sha1(contenido).hexdigest()}"',
+                "marcadores": marcadores,
+                "limites": calcular_limites(marcadores),
+            }
+
+        if self._generacion.get(email, 0) == generacion:
+            self.memoria.guardar(email, entrada)
+            if self.compartido is not None:
+                await self.compartido.guardar(self._clave(email), json.dumps(entrada).encode(), self.ttl)
+        return entrada if entrada["etag"] else None
+
+    async def invalidar(self, email: str) -> None:
+        self._generacion[email] = self._generacion.get(email, 0) + 1
+        self.memoria.invalidar(email)
+        if self.compartido is not None:
+            await self.compartido.borrar(self._clave(email))
+
+    @staticmethod
+    def pagina(entrada: dict, cursor: Optional[str], limit: Optional[int]) -> Tuple[List[dict], Optional[str]]:
+        """
+        Misma paginación por _id que leer_pagina, pero sobre la lista cacheada.
+        Sin limit ni cursor devuelve todos: la entrada ya está acotada por max_marcadores.
+        """
+        marcadores = entrada["marcadores"]
+        if not cursor and not limit:
+            return [{c: m[c] for c in CAMPOS_MARCADOR} for m in marcadores], None
+        inicio = 0
+        if cursor:
+            ultimo = str(decodificar_cursor(cursor)["_id"])
+            # Los ObjectId en hexadecimal se ordenan igual que los originales
+            inicio = bisect_right([m["_id"] for m in marcadores], ultimo)
+
+        limite = limitar(limit)
+        trozo = marcadores[inicio:inicio + limite]
+        siguiente = None
+        if inicio + limite < len(marcadores):
+            siguiente = codificar_cursor({"_id": ObjectId(trozo[-1]["_id"])})
+        return [{c: m[c] for c in CAMPOS_MARCADOR} for m in trozo], siguiente
+
+    def metricas(self) -> dict:
+        return {
+            "memoria": self.memoria.metricas(),
+            "aciertos_compartido": self.aciertos_compartido,
+            "lecturas_mongo": self.lecturas_mongo,
+            "respuestas_304": self.respuestas_304,
+        }
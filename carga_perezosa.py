@@ -0,0 +1,57 @@
+"""
+Carga perezosa para el arranque en frío (despliegue serverless).
+
+- Perezoso: construye un objeto la primera vez que se usa.
+- RutasPerezosas: una ruta que cubre un prefijo (p.ej. /path) y solo importa
+  y registra los endpoints de verdad en la primera petición que llega a él.
+  FastAPI analiza la firma de cada endpoint al registrarlo, y eso es una
+  parte apreciable del tiempo de importar main.py.
+"""
+from typing import Callable, Generic, Optional, TypeVar
+
+from starlette.routing import BaseRoute, Match, NoMatchFound, Router
+
+T = TypeVar("T")
+
+
+class Perezoso(Generic[T]):
+
+    def __init__(self, fabrica: Callable[[], T]):
+        self._fabrica = fabrica
+        self._objeto: Optional[T] = None
+
+    @property
+    def creado(self) -> bool:
+        return self._objeto is not None
+
+    def __call__(self) -> T:
+        if self._objeto is None:
+            self._objeto = self._fabrica()
+        return self._objeto
+
+
+class RutasPerezosas(BaseRoute):
+    """
+    Las rutas del router se declaran con su ruta completa, así que se le
+    pasa el scope tal cual. Los 404/405 los resuelve el propio router.
+    Estas rutas no aparecen en /docs (ver CARGA_PEREZOSA en main.py).
+    """
+
+    def __init__(self, prefijo: str, crear_router: Callable[[], Router]):
+        self.prefijo = prefijo.rstrip("/")
+        self.router = Perezoso(crear_router)
+
+    def matches(self, scope) -> tuple:
+        if scope["type"] == "http":
+            ruta = scope["path"]
+            if ruta == self.prefijo or ruta.startswith(self.prefijo + "/"):
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        if not self.router.creado:
+            raise NoMatchFound(name, path_params)
+        return self.router().url_path_for(name, **path_params)
+
+    async def handle(self, scope, receive, send) -> None:
+        await self.router()(scope, receive, send)
@@ -0,0 +1,328 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import shutil
+import socket
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from deduplicacion import AlmacenBlobs, hash_archivo
+from subidas import EjecutorSubidas
+
+PENDIENTE = "pendiente"
+SUBIENDO = "subiendo"
+LISTO = "listo"
+ERROR = "error"
+
+
+class TrabajadorArchivos:
+    """
+    Modo diferido de /v2/archivo: el endpoint guarda los bytes en un spool
+    local y crea el documento en estado "pendiente" con una sola escritura.
+    Este trabajador, en segundo plano, sube el archivo y rellena "enlace",
+    reintentando con espera exponencial si el almacenamiento falla.
+
+    Con blobs, el hash se calcula mientras se vuelca al spool: si el
+    contenido ya estaba subido el documento nace "listo" y no se encola.
+
+    El spool está en el disco local pero la cola es compartida, así que cada
+    documento guarda la instancia que tiene su archivo y solo ella lo
+    reclama. Al reclamarlo se anota hasta cuándo es suyo (reclamado_hasta);
+    si el proceso muere a mitad de la subida, pasado ese plazo lo vuelve a
+    tomar otro proceso de la misma instancia.
+    """
+
+    def __init__(
+        self,
+        coleccion,
+        ejecutor: EjecutorSubidas,
+        directorio_spool: str = "spool",
+        trabajadores: int = 2,
+        max_intentos: int = 5,
+        espera_base: float = 2.0,
+        espera_max: float = 300.0,
+        intervalo_sondeo: float = 5.0,
+        blobs: Optional[AlmacenBlobs] = None,
+        instancia: Optional[str] = None,
+        duracion_reclamo: Optional[float] = None,
+    ):
+        self.coleccion = coleccion
+        self.ejecutor = ejecutor
+        self.directorio_spool = directorio_spool
+        self.trabajadores = trabajadores
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.intervalo_sondeo = intervalo_sondeo
+        self.blobs = blobs
+        # Los procesos de una misma máquina comparten el directorio del spool
+        self.instancia = instancia or socket.gethostname()
+        # Una subida no pasa del timeout del ejecutor, ni la espera a un blob de 2 timeouts
+        self.duracion_reclamo = timedelta(seconds=duracion_reclamo or 4 * ejecutor.timeout)
+        self._aviso = asyncio.Event()
+        self._tareas = []
+        self._parar = False
+        os.makedirs(directorio_spool, exist_ok=True)
+
+    # --- ENTRADA (desde el endpoint) ---
+
+    async def encolar(self, file, nombre: str, tipo: Optional[str]) -> dict:
+        archivo_id = ObjectId()
+        ruta = os.path.join(self.directorio_spool, str(archivo_id))
+
+        await file.seek(0)
+        def volcar():
+            with open(ruta, "wb") as destino:
+                if self.blobs is None:
+                    shutil.copyfileobj(file.file, destino, 1024 * 1024)
+                    return None
+                return hash_archivo(file.file, destino)
+        hash_y_tamano = await asyncio.to_thread(volcar)
+
+        body = {
+            "_id": archivo_id,
+            "nombre": nombre,
+            "tipo": tipo,
+            "enlace": "",
+            "estado": PENDIENTE,
+            "intentos": 0,
+            "proximo_intento": datetime.now(),
+            "ruta_spool": ruta,
+            "instancia": self.instancia,
+        }
+        blob = None
+        if hash_y_tamano is not None:
+            blob = await self.blobs.adquirir(*hash_y_tamano)
+            body["hash"] = blob["hash"]
+            if blob.get("enlace"):
+                # Contenido repetido: reutilizamos el enlace sin subir nada
+                self.blobs.reutilizadas += 1
+                body.update({"enlace": blob["enlace"], "estado": LISTO})
+                for campo in ("intentos", "proximo_intento", "ruta_spool", "instancia"):
+                    del body[campo]
+        try:
+            await self.coleccion.insert_one(body)
+        except Exception:
+            os.remove(ruta)
+            if blob is not None:
+                await self.blobs.liberar(blob["hash"])
+            raise
+
+        if body["estado"] == LISTO:
+            os.remove(ruta)
+        else:
+            self._aviso.set()
+        return body
+
+    # --- CICLO DE VIDA ---
+
+    async def iniciar(self) -> None:
+        await self._adoptar_sin_instancia()
+        await self._limpiar_spool()
+        self._parar = False
+        self._tareas = [asyncio.create_task(self._bucle()) for _ in range(self.trabajadores)]
+
+    async def detener(self) -> None:
+        self._parar = True
+        self._aviso.set()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    async def _adoptar_sin_instancia(self) -> None:
+        """
+        Documentos encolados antes de que se guardara la instancia: los toma
+        quien tenga su archivo en el spool local.
+        """
+        sin_instancia = self.coleccion.find(
+            {"estado": {"$in": [PENDIENTE, SUBIENDO]}, "instancia": {"$exists": False}},
+            {"ruta_spool": 1},
+        )
+        async for doc in sin_instancia:
+            if doc.get("ruta_spool") and await asyncio.to_thread(os.path.exists, doc["ruta_spool"]):
+                await self.coleccion.update_one(
+                    {"_id": doc["_id"], "instancia": {"$exists": False}},
+                    {"$set": {"instancia": self.instancia, "estado": PENDIENTE}},
+                )
+
+    async def _limpiar_spool(self) -> None:
+        """
+        Borra del spool los archivos cuyo documento ya no existe (p.ej. se
+        eliminó desde otra instancia). Los recientes se respetan: encolar
+        escribe el archivo antes de insertar el documento.
+        """
+        nombres = await asyncio.to_thread(os.listdir, self.directorio_spool)
+        limite = datetime.now(timezone.utc) - self.duracion_reclamo
+        ids = [ObjectId(n) for n in nombres if ObjectId.is_valid(n) and ObjectId(n).generation_time < limite]
+        if not ids:
+            return
+        existentes = {doc["_id"] async for doc in self.coleccion.find({"_id": {"$in": ids}}, {"_id": 1})}
+        for archivo_id in ids:
+            if archivo_id not in existentes:
+                await self._borrar_spool(os.path.join(self.directorio_spool, str(archivo_id)))
+
+    async def cancelar(self, archivo_id: ObjectId) -> bool:
+        """
+        Elimina un documento que aún no tiene enlace (pendiente o subiendo) y
+        su archivo del spool. Devuelve False si ya no estaba en esos estados.
+
+        La referencia al blob se suelta aquí solo si ningún trabajador tiene
+        el documento; si hay una subida en curso, lo hace el trabajador al
+        ver que el documento ya no existe.
+        """
+        doc = await self.coleccion.find_one_and_delete({
+            "_id": archivo_id,
+            "$or": [{"estado": PENDIENTE}, {"estado": SUBIENDO, "reclamado_hasta": {"$lt": datetime.now()}}],
+        })
+        if doc is not None:
+            if doc.get("hash") and self.blobs is not None:
+                await self.blobs.liberar(doc["hash"])
+        else:
+            doc = await self.coleccion.find_one_and_delete({"_id": archivo_id, "estado": SUBIENDO})
+            if doc is None:
+                return False
+        # El spool está en el disco de la instancia del documento; si es otra, lo limpia ella al arrancar
+        await self._borrar_spool(doc["ruta_spool"])
+        return True
+
+    # --- TRABAJO ---
+
+    async def _reclamar(self) -> Optional[dict]:
+        ahora = datetime.now()
+        return await self.coleccion.find_one_and_update(
+            {
+                "instancia": self.instancia,
+                "$or": [
+                    {"estado": PENDIENTE, "proximo_intento": {"$lte": ahora}},
+                    # Reclamado por un proceso que no terminó a tiempo (murió a medias)
+                    {"estado": SUBIENDO, "reclamado_hasta": {"$lt": ahora}},
+                ],
+            },
+            {"$set": {"estado": SUBIENDO, "reclamado_hasta": ahora + self.duracion_reclamo}},
+            sort=[("proximo_intento", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _bucle(self) -> None:
+        while not self._parar:
+            try:
+                doc = await self._reclamar()
+            except Exception as e:
+                print(f"ERROR COLA ARCHIVOS: {e}")
+                doc = None
+
+            if doc is None:
+                self._aviso.clear()
+                try:
+                    await asyncio.wait_for(self._aviso.wait(), self.intervalo_sondeo)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._procesar(doc)
+            except Exception as e:
+                # Un fallo de Mongo al anotar el resultado no debe parar el trabajador
+                print(f"ERROR COLA ARCHIVOS {doc['_id']}: {e}")
+                await self._devolver(doc)
+
+    async def _devolver(self, doc: dict) -> None:
+        """Vuelve a dejar pendiente un documento que se quedó a medias."""
+        try:
+            await self.coleccion.update_one(
+                {"_id": doc["_id"], "estado": SUBIENDO},
+                {
+                    "$set": {"estado": PENDIENTE, "proximo_intento": datetime.now() + timedelta(seconds=self.espera_base)},
+                    "$unset": {"reclamado_hasta": ""},
+                },
+            )
+        except Exception as e:
+            print(f"ERROR COLA ARCHIVOS {doc['_id']}: {e}")
+
+    async def _procesar(self, doc: dict) -> None:
+        archivo_id = doc["_id"]
+        ruta = doc["ruta_spool"]
+        try:
+            with open(ruta, "rb") as origen:
+                if doc.get("hash") and self.blobs is not None:
+                    # Si otra subida del mismo contenido ya terminó, no se repite
+                    blob = await self.blobs.obtener(doc["hash"])
+                    if blob is None:
+                        raise RuntimeError(f"Blob {doc['hash']} no encontrado")
+                    enlace = await self.blobs.asegurar_subido(blob, origen)
+                else:
+                    resultado = await self.ejecutor.subir(
+                        origen, public_id=str(archivo_id), folder="archivos", resource_type="auto"
+                    )
+                    enlace = resultado["secure_url"]
+        except Exception as e:
+            await self._fallo(doc, e)
+            return
+
+        resultado = await self.coleccion.update_one(
+            {"_id": archivo_id},
+            {
+                "$set": {"enlace": enlace, "estado": LISTO},
+                "$unset": {"ruta_spool": "", "proximo_intento": "", "ultimo_error": "", "reclamado_hasta": ""},
+            },
+        )
+        await self._borrar_spool(ruta)
+        if resultado.matched_count == 0:
+            # Se eliminó mientras subíamos: lo subido no lo usa nadie
+            if doc.get("hash") and self.blobs is not None:
+                await self.blobs.liberar(doc["hash"])
+            else:
+                await self.ejecutor.borrar(f"archivos/{archivo_id}")
+
+    @staticmethod
+    async def _borrar_spool(ruta: str) -> None:
+        try:
+            await asyncio.to_thread(os.remove, ruta)
+        except FileNotFoundError:
+            pass
+
+    async def _fallo(self, doc: dict, error: Exception) -> None:
+        intentos = doc.get("intentos", 0) + 1
+        print(f"ERROR SUBIDA DIFERIDA {doc['_id']} (intento {intentos}): {error}")
+
+        if intentos >= self.max_intentos:
+            # Sin más reintentos: el documento deja de apuntar al spool y al blob
+            resultado = await self.coleccion.update_one(
+                {"_id": doc["_id"]},
+                {
+                    "$set": {"estado": ERROR, "intentos": intentos, "ultimo_error": str(error)},
+                    "$unset": {"ruta_spool": "", "proximo_intento": "", "reclamado_hasta": "", "hash": ""},
+                },
+            )
+            await self._borrar_spool(doc["ruta_spool"])
+            # Si se eliminó entretanto, la referencia ya la soltó cancelar
+            if resultado.matched_count and doc.get("hash") and self.blobs is not None:
+                await self.blobs.liberar(doc["hash"])
+            return
+
+        espera = min(self.espera_max, self.espera_base * 2 ** (intentos - 1))
+        espera *= random.uniform(0.8, 1.2)
+        cambios = {
+            "estado": PENDIENTE,
+            "intentos": intentos,
+            "ultimo_error": str(error),
+            "proximo_intento": datetime.now() + timedelta(seconds=espera),
+        }
+        await self.coleccion.update_one({"_id": doc["_id"]}, {"$set": cambios, "$unset": {"reclamado_hasta": ""}})
+
+
+def crear_trabajador(env, coleccion, ejecutor: EjecutorSubidas,
+                     blobs: Optional[AlmacenBlobs] = None) -> TrabajadorArchivos:
+    return TrabajadorArchivos(
+        coleccion,
+        ejecutor,
+        directorio_spool=env('SPOOL_DIR', 'spool'),
+        trabajadores=env.int('ARCHIVOS_TRABAJADORES', 2),
+        max_intentos=env.int('ARCHIVOS_MAX_INTENTOS', 5),
+        espera_base=env.float('ARCHIVOS_ESPERA_BASE', 2.0),
+        blobs=blobs,
+        instancia=env('ARCHIVOS_INSTANCIA', None),
+        duracion_reclamo=env.float('ARCHIVOS_DURACION_RECLAMO', None),
+    )
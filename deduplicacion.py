@@ -0,0 +1,175 @@
+"""
+Deduplicación de archivos subidos por contenido (SHA-256).
+
+Cada contenido distinto es un "blob" en la colección Blobs:
+    {hash, public_id, enlace, referencias, bytes}
+con índice único en "hash". Los documentos de Archivos guardan el hash de
+su contenido; subir algo que ya existe solo suma una referencia y reutiliza
+el enlace, y el archivo remoto se borra cuando se elimina la última.
+
+El public_id remoto es el propio hash, así que hay que coordinar subidas y
+borrados del mismo contenido:
+- La primera subida se reclama con un update condicional (campo "subiendo");
+  las demás esperan a que aparezca el enlace en lugar de subir otra vez.
+- Al soltar la última referencia el blob se marca "borrando" (lápida) antes
+  de destruir el archivo remoto, y solo después se borra el documento. Un
+  adquirir del mismo hash espera a que desaparezca la lápida, así que nunca
+  sube un archivo nuevo que el borrado en curso vaya a destruir.
+Las marcas llevan fecha: si un proceso muere a medias, pasado el margen otro
+las puede tomar.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import hashlib
+from typing import BinaryIO, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from subidas import EjecutorSubidas
+
+CARPETA_BLOBS = "archivos"
+TAMANO_BLOQUE = 1024 * 1024
+
+
+def hash_archivo(archivo: BinaryIO, destino: Optional[BinaryIO] = None) -> Tuple[str, int]:
+    """
+    SHA-256 y tamaño leyendo por bloques (bloqueante: llamar en un hilo).
+    Si se pasa destino, copia los bytes a la vez que los lee.
+    """
+    sha = hashlib.sha256()
+    tamano = 0
+    while bloque := archivo.read(TAMANO_BLOQUE):
+        sha.update(bloque)
+        tamano += len(bloque)
+        if destino is not None:
+            destino.write(bloque)
+    return sha.hexdigest(), tamano
+
+
+class AlmacenBlobs:
+
+    def __init__(self, coleccion, ejecutor: EjecutorSubidas, intervalo_espera: float = 0.1):
+        self.coleccion = coleccion
+        self.ejecutor = ejecutor
+        self.intervalo_espera = intervalo_espera
+        # Una subida o un borrado remoto no dura más que el timeout del ejecutor
+        self.margen = timedelta(seconds=2 * ejecutor.timeout)
+        self.subidas = 0
+        self.reutilizadas = 0
+        self.borradas = 0
+
+    async def calcular_hash(self, file) -> Tuple[str, int]:
+        """Hash de un UploadFile sin cargarlo entero en memoria."""
+        await file.seek(0)
+        resultado = await asyncio.to_thread(hash_archivo, file.file)
+        await file.seek(0)
+        return resultado
+
+    async def adquirir(self, hash_: str, tamano: int) -> dict:
+        """Suma una referencia al blob (lo crea si no existe) y lo devuelve."""
+        limite = datetime.now() + self.margen
+        while True:
+            try:
+                return await self.coleccion.find_one_and_update(
+                    {"hash": hash_, "borrando": {"$exists": False}},
+                    {
+                        "$inc": {"referencias": 1},
+                        "$setOnInsert": {"public_id": f"{CARPETA_BLOBS}/{hash_}", "enlace": "", "bytes": tamano},
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # Dos upserts a la vez (se repite enseguida) o un borrado en curso
+                lapida = await self.coleccion.find_one({"hash": hash_, "borrando": {"$exists": True}})
+                if lapida is None:
+                    continue
+                if lapida["borrando"] < datetime.now() - self.margen:
+                    # El proceso que borraba murió a medias: quitamos su lápida
+                    await self.coleccion.delete_one({"_id": lapida["_id"], "borrando": lapida["borrando"]})
+                    continue
+                if datetime.now() > limite:
+                    raise RuntimeError(f"El blob {hash_} sigue borrándose")
+                await asyncio.sleep(self.intervalo_espera)
+
+    async def obtener(self, hash_: str) -> Optional[dict]:
+        return await self.coleccion.find_one({"hash": hash_})
+
+    async def _reclamar_subida(self, blob: dict) -> bool:
+        ahora = datetime.now()
+        reclamado = await self.coleccion.find_one_and_update(
+            {
+                "_id": blob["_id"],
+                "enlace": "",
+                "$or": [{"subiendo": {"$exists": False}}, {"subiendo": {"$lt": ahora - self.margen}}],
+            },
+            {"$set": {"subiendo": ahora}},
+        )
+        return reclamado is not None
+
+    async def asegurar_subido(self, blob: dict, archivo: BinaryIO) -> str:
+        """Devuelve el enlace del blob, subiendo el contenido solo si aún no lo tiene."""
+        limite = datetime.now() + self.margen
+        while True:
+            if blob.get("enlace"):
+                self.reutilizadas += 1
+                return blob["enlace"]
+            if await self._reclamar_subida(blob):
+                break
+            # Otra subida del mismo contenido en curso: esperamos su enlace
+            if datetime.now() > limite:
+                raise RuntimeError(f"El blob {blob['hash']} sigue subiéndose")
+            await asyncio.sleep(self.intervalo_espera)
+            blob = await self.obtener(blob["hash"])
+            if blob is None:
+                raise RuntimeError("Blob no encontrado")
+
+        try:
+            resultado = await self.ejecutor.subir(
+                archivo, public_id=blob["hash"], folder=CARPETA_BLOBS, resource_type="auto"
+            )
+        except BaseException:
+            # Dejamos que otro lo intente sin esperar al margen
+            await self.coleccion.update_one({"_id": blob["_id"]}, {"$unset": {"subiendo": ""}})
+            raise
+        self.subidas += 1
+        await self.coleccion.update_one(
+            {"_id": blob["_id"]}, {"$set": {"enlace": resultado["secure_url"]}, "$unset": {"subiendo": ""}}
+        )
+        return resultado["secure_url"]
+
+    async def liberar(self, hash_: str) -> bool:
+        """
+        Resta una referencia. Si era la última, borra el archivo remoto y el
+        blob. Devuelve True si se ha borrado.
+        """
+        blob = await self.coleccion.find_one_and_update(
+            {"hash": hash_}, {"$inc": {"referencias": -1}}, return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob["referencias"] > 0:
+            return False
+
+        # Lápida: solo si nadie ha vuelto a sumar una referencia entretanto.
+        # Desde aquí adquirir espera en lugar de reutilizar o recrear el blob
+        marca = datetime.now()
+        blob = await self.coleccion.find_one_and_update(
+            {"_id": blob["_id"], "referencias": {"$lte": 0}, "borrando": {"$exists": False}},
+            {"$set": {"borrando": marca}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if blob is None:
+            return False
+        if blob.get("enlace"):
+            try:
+                await self.ejecutor.borrar(blob["public_id"])
+            except BaseException:
+                # El archivo remoto sigue ahí: el blob vuelve a ser reutilizable
+                await self.coleccion.update_one({"_id": blob["_id"], "borrando": marca}, {"$unset": {"borrando": ""}})
+                raise
+        await self.coleccion.delete_one({"_id": blob["_id"], "borrando": marca})
+        self.borradas += 1
+        return True
+
+    def metricas(self) -> dict:
+        return {"subidas": self.subidas, "reutilizadas": self.reutilizadas, "borradas": self.borradas}
@@ -0,0 +1,92 @@
+"""
+Exportación de los marcadores de un usuario en streaming.
+
+Cada formato es un generador que va escribiendo los documentos según los
+entrega el cursor de Motor, sin construir listas intermedias. La compresión
+gzip también se hace por trozos, con un flush cada cierto número de bytes
+para que el cliente empiece a recibir datos enseguida.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict
+import zlib
+
+from marcador import CAMPOS_MARCADOR
+
+# Campos que se exportan (la ubicación GeoJSON va en "geometry")
+PROYECCION_EXPORTACION = {"_id": 0, **dict.fromkeys(CAMPOS_MARCADOR, 1)}
+
+FLUSH_GZIP = 64 * 1024
+
+
+def _json(datos) -> str:
+    return json.dumps(datos, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+async def exportar_ndjson(cursor) -> AsyncIterator[bytes]:
+    async for doc in cursor:
+        yield (_json(doc) + "\n").encode()
+
+
+async def exportar_geojson(cursor) -> AsyncIterator[bytes]:
+    """FeatureCollection de puntos; el resto de campos van en properties."""
+    yield b'{"type":"FeatureCollection","features":['
+    separador = ""
+    async for doc in cursor:
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [doc.get("longitud"), doc.get("latitud")]},
+            "properties": {c: doc.get(c) for c in CAMPOS_MARCADOR if c not in ("latitud", "longitud")},
+        }
+        yield (separador + _json(feature)).encode()
+        separador = ",\n"
+    yield b"]}\n"
+
+
+async def exportar_csv(cursor) -> AsyncIterator[bytes]:
+    """Mismas columnas que acepta /marcadores/import."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(CAMPOS_MARCADOR)
+    async for doc in cursor:
+        escritor.writerow([doc.get(c, "") for c in CAMPOS_MARCADOR])
+        # Vaciamos el buffer de vez en cuando en vez de por fila
+        if buffer.tell() >= 16 * 1024:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+FORMATOS: Dict[str, tuple] = {
+    # formato: (generador, media_type, extensión)
+    "geojson": (exportar_geojson, "application/geo+json", "geojson"),
+    "ndjson": (exportar_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (exportar_csv, "text/csv; charset=utf-8", "csv"),
+}
+
+
+async def comprimir_gzip(trozos: AsyncIterator[bytes], nivel: int = 6,
+                         flush_cada: int = FLUSH_GZIP) -> AsyncIterator[bytes]:
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31 = cabecera gzip
+    # El primer trozo se envía en cuanto llega, sin esperar a llenar el buffer
+    sin_enviar = flush_cada
+    async for trozo in trozos:
+        salida = compresor.compress(trozo)
+        sin_enviar += len(trozo)
+        if sin_enviar >= flush_cada:
+            salida += compresor.flush(zlib.Z_SYNC_FLUSH)
+            sin_enviar = 0
+        if salida:
+            yield salida
+    yield compresor.flush()
+
+
+def acepta_gzip(accept_encoding: str) -> bool:
+    for codificacion in accept_encoding.split(","):
+        nombre, _, parametros = codificacion.strip().partition(";")
+        if nombre.strip().lower() in ("gzip", "*"):
+            return parametros.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
@@ -0,0 +1,65 @@
+"""
+Utilidades GeoJSON para los marcadores (campo "ubicacion" con índice 2dsphere).
+"""
+from typing import List, Optional
+
+# Filtro que no encaja con ningún documento (caja sin superficie)
+FILTRO_VACIO = {"_id": {"$in": []}}
+
+
+def punto_geojson(lat: float, lon: float) -> dict:
+    # GeoJSON guarda las coordenadas como [longitud, latitud]
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def _rectangulo(min_lon: float, min_lat: float, max_lon: float, max_lat: float, paso: float = 5.0) -> list:
+    """
+    Anillo de un rectángulo lon/lat. En 2dsphere los lados son geodésicas, así
+    que añadimos puntos intermedios a lo largo de los paralelos para que los
+    bordes norte y sur no se curven hacia el polo.
+    """
+    n = max(1, int((max_lon - min_lon) // paso) + 1)
+    lons = [min_lon + (max_lon - min_lon) * i / n for i in range(n + 1)]
+    anillo = [[lon, min_lat] for lon in lons]
+    anillo += [[lon, max_lat] for lon in reversed(lons)]
+    anillo.append([min_lon, min_lat])
+    return [anillo]
+
+
+def filtro_bbox(min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                campo: str = "ubicacion") -> Optional[dict]:
+    """
+    Filtro $geoWithin para la caja visible del mapa. Devuelve None si la caja
+    cubre el mundo entero (no hace falta filtrar por posición) y FILTRO_VACIO
+    si no tiene superficie (Mongo rechaza los polígonos degenerados).
+    Soporta cajas que cruzan el antimeridiano (min_lon > max_lon).
+    """
+    if max_lon - min_lon >= 360:
+        return None
+    # En los polos todos los vértices coinciden: nos quedamos justo antes
+    min_lat, max_lat = max(-89.9, min_lat), min(89.9, max_lat)
+    if min_lat >= max_lat:
+        return FILTRO_VACIO
+
+    # Normalizamos a [-180, 180] y partimos la caja si cruza el antimeridiano
+    if not -180 <= min_lon <= 180:
+        min_lon = (min_lon + 180) % 360 - 180
+    if not -180 <= max_lon <= 180:
+        max_lon = (max_lon + 180) % 360 - 180
+    if min_lon <= max_lon:
+        tramos = [(min_lon, max_lon)]
+    else:
+        tramos = [(min_lon, 180.0), (-180.0, max_lon)]
+    tramos = [(inicio, fin) for inicio, fin in tramos if fin > inicio]
+    if not tramos:
+        return FILTRO_VACIO
+
+    # Ningún polígono puede abarcar 180º o más de longitud: lo troceamos
+    poligonos: List[list] = []
+    for inicio, fin in tramos:
+        while fin - inicio > 90:
+            poligonos.append(_rectangulo(inicio, min_lat, inicio + 90, max_lat))
+            inicio += 90
+        poligonos.append(_rectangulo(inicio, min_lat, fin, max_lat))
+
+    return {campo: {"$geoWithin": {"$geometry": {"type": "MultiPolygon", "coordinates": poligonos}}}}
@@ -0,0 +1,229 @@
+import asyncio
+from datetime import datetime, timedelta
+import re
+import unicodedata
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Optional, Protocol, Tuple
+
+from cache_lru import CacheLRU
+
+Coordenadas = Tuple[Optional[float], Optional[float]]
+SIN_RESULTADO: Coordenadas = (None, None)
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def normalizar_consulta(ciudad: str) -> str:
+    """
+    Clave canónica de una búsqueda: "  Madrid ,España" y "madrid, españa"
+    deben resolverse una sola vez.
+    """
+    texto = unicodedata.normalize("NFKC", ciudad).casefold()
+    texto = re.sub(r"\s*,\s*", ", ", texto)
+    texto = re.sub(r"\s+", " ", texto)
+    return texto.strip(" ,")
+
+
+# --- PROVEEDORES (upstream intercambiable) ---
+
+class ProveedorGeocoding(Protocol):
+    async def consultar(self, consulta: str) -> Coordenadas: ...
+
+
+class ProveedorNominatim:
+    """
+    Usa la API gratuita de OpenStreetMap para obtener lat/lon.
+    Comparte un httpx.AsyncClient (pool de conexiones) entre peticiones;
+    obtener_cliente lo devuelve y solo se llama en la primera consulta.
+    """
+
+    def __init__(
+        self,
+        obtener_cliente: Optional[Callable[[], "httpx.AsyncClient"]] = None,
+        url: str = "https://nominatim.openstreetmap.org/search",
+        user_agent: str = "MiMapaExamen/1.0",
+    ):
+        self.url = url
+        # Es importante poner un User-Agent para que no nos bloqueen
+        self.headers = {"User-Agent": user_agent}
+        self._obtener = obtener_cliente
+        self._cliente = None
+
+    def _obtener_cliente(self) -> "httpx.AsyncClient":
+        if self._cliente is None:
+            if self._obtener is not None:
+                self._cliente = self._obtener()
+            else:
+                import httpx
+
+                self._cliente = httpx.AsyncClient(timeout=10.0)
+        return self._cliente
+
+    async def consultar(self, consulta: str) -> Coordenadas:
+        params = {"q": consulta, "format": "json", "limit": 1}
+        response = await self._obtener_cliente().get(self.url, params=params, headers=self.headers)
+        response.raise_for_status()
+        data = response.json()
+
+        if data:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        return SIN_RESULTADO
+
+
+class ProveedorLocal:
+    """
+    Sustituto de Nominatim para tests y benchmarks: resuelve desde un dict
+    y puede simular latencia de red.
+    """
+
+    def __init__(self, tabla: Optional[Dict[str, Tuple[float, float]]] = None, latencia: float = 0.0):
+        self.tabla = {normalizar_consulta(k): v for k, v in (tabla or {}).items()}
+        self.latencia = latencia
+        self.consultas = 0
+
+    async def consultar(self, consulta: str) -> Coordenadas:
+        self.consultas += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return self.tabla.get(normalizar_consulta(consulta), SIN_RESULTADO)
+
+
+# --- GEOCODIFICADOR CON CACHÉ ---
+
+class Geocodificador:
+    """
+    Resuelve ciudades a coordenadas con tres niveles:
+    LRU en memoria -> colección Mongo "Geocache" (con TTL) -> proveedor upstream.
+    Los fallos también se cachean (caché negativa) con un TTL más corto y las
+    búsquedas concurrentes de la misma clave comparten una única petición.
+    """
+
+    def __init__(
+        self,
+        proveedor: ProveedorGeocoding,
+        coleccion=None,
+        max_entradas: int = 4096,
+        ttl: timedelta = timedelta(days=30),
+        ttl_negativo: timedelta = timedelta(days=1),
+        concurrencia: int = 1,
+    ):
+        self.proveedor = proveedor
+        self.coleccion = coleccion
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.cache = CacheLRU(max_entradas=max_entradas)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self.consultas_upstream = 0
+
+    def _ttl_de(self, coordenadas: Coordenadas) -> timedelta:
+        return self.ttl_negativo if coordenadas == SIN_RESULTADO else self.ttl
+
+    def _guardar_en_memoria(self, clave: str, coordenadas: Coordenadas) -> None:
+        self.cache.guardar(clave, coordenadas, ttl=self._ttl_de(coordenadas).total_seconds())
+
+    async def buscar(self, ciudad: str) -> Coordenadas:
+        """Devuelve (lat, lon) o (None, None) si no se encuentra la ciudad."""
+        clave = normalizar_consulta(ciudad)
+        if not clave:
+            return SIN_RESULTADO
+
+        coordenadas = self.cache.obtener(clave)
+        if coordenadas is not None:
+            return coordenadas
+        return await self._resolver(clave, ciudad, leer_mongo=True)
+
+    async def _buscar_fuera(self, clave: str, ciudad: str, leer_mongo: bool) -> Coordenadas:
+        coordenadas = await self._leer_mongo(clave) if leer_mongo else None
+        if coordenadas is None:
+            coordenadas = await self._consultar_upstream(clave, ciudad)
+        else:
+            self._guardar_en_memoria(clave, coordenadas)
+        return coordenadas
+
+    def _terminada(self, clave: str, tarea: asyncio.Future) -> None:
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            # Evitamos el aviso de "exception never retrieved" si nadie más esperaba
+            tarea.exception()
+
+    async def _resolver(self, clave: str, ciudad: str, leer_mongo: bool) -> Coordenadas:
+        # Single-flight: si ya hay una búsqueda en curso para esta clave, la esperamos.
+        # La búsqueda va en su propia tarea y todos la esperan con shield: si se
+        # cancela la petición que la lanzó, las demás no reciben CancelledError
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._buscar_fuera(clave, ciudad, leer_mongo))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminada(clave, t))
+        return await asyncio.shield(tarea)
+
+    async def buscar_varios(self, ciudades: Iterable[str]) -> Dict[str, Coordenadas]:
+        """
+        Resuelve muchas ciudades a la vez: una sola consulta $in a Mongo y una
+        petición upstream por cada lugar distinto que no esté en caché.
+        """
+        claves: Dict[str, str] = {}
+        for ciudad in ciudades:
+            claves.setdefault(ciudad, normalizar_consulta(ciudad))
+
+        resueltas: Dict[str, Coordenadas] = {}
+        pendientes = set()
+        for clave in set(claves.values()):
+            coordenadas = self.cache.obtener(clave) if clave else SIN_RESULTADO
+            if coordenadas is None:
+                pendientes.add(clave)
+            else:
+                resueltas[clave] = coordenadas
+
+        if pendientes and self.coleccion is not None:
+            cursor = self.coleccion.find({"_id": {"$in": list(pendientes)}, "expira": {"$gt": datetime.now()}})
+            async for doc in cursor:
+                coordenadas = (doc.get("lat"), doc.get("lon"))
+                resueltas[doc["_id"]] = coordenadas
+                self._guardar_en_memoria(doc["_id"], coordenadas)
+                pendientes.discard(doc["_id"])
+
+        if pendientes:
+            originales = {clave: ciudad for ciudad, clave in claves.items()}
+            claves_pendientes = list(pendientes)
+            resultados = await asyncio.gather(
+                # Mongo ya se consultó arriba con $in: vamos directos al upstream
+                *(self._resolver(clave, originales[clave], leer_mongo=False) for clave in claves_pendientes),
+                return_exceptions=True,
+            )
+            for clave, resultado in zip(claves_pendientes, resultados):
+                resueltas[clave] = SIN_RESULTADO if isinstance(resultado, BaseException) else resultado
+
+        return {ciudad: resueltas[clave] for ciudad, clave in claves.items()}
+
+    async def _leer_mongo(self, clave: str) -> Optional[Coordenadas]:
+        if self.coleccion is None:
+            return None
+        doc = await self.coleccion.find_one({"_id": clave, "expira": {"$gt": datetime.now()}})
+        if doc is None:
+            return None
+        return doc.get("lat"), doc.get("lon")
+
+    async def _consultar_upstream(self, clave: str, ciudad: str) -> Coordenadas:
+        async with self._semaforo:
+            self.consultas_upstream += 1
+            coordenadas = await self.proveedor.consultar(ciudad)
+
+        self._guardar_en_memoria(clave, coordenadas)
+        if self.coleccion is not None:
+            lat, lon = coordenadas
+            await self.coleccion.update_one(
+                {"_id": clave},
+                {"$set": {"lat": lat, "lon": lon, "expira": datetime.now() + self._ttl_de(coordenadas)}},
+                upsert=True,
+            )
+        return coordenadas
+
+    def metricas(self) -> dict:
+        return {
+            "cache": self.cache.metricas(),
+            "en_vuelo": len(self._en_vuelo),
+            "consultas_upstream": self.consultas_upstream,
+        }
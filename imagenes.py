@@ -0,0 +1,98 @@
+"""
+Imágenes de los marcadores: reducción antes de subir y versiones derivadas.
+
+Cada foto se guarda con dos derivadas además del original:
+  - miniatura: la que se ve en el popup del mapa
+  - media: para pantallas con más densidad o vistas ampliadas
+
+En Cloudinary las derivadas son URLs con transformación (c_limit,w_...), así
+que también sirven para marcadores antiguos. El backend local las genera
+con Pillow al subir.
+"""
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, Optional
+
+# Ancho máximo (px) de cada derivada
+TAMANOS_DERIVADAS = {"miniatura": 200, "media": 640}
+
+FORMATOS_CONSERVADOS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+
+def tamano_archivo(archivo: BinaryIO) -> int:
+    posicion = archivo.tell()
+    archivo.seek(0, 2)
+    tamano = archivo.tell()
+    archivo.seek(posicion)
+    return tamano
+
+
+def _abrir(archivo: BinaryIO):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        imagen = Image.open(archivo)
+        imagen.load()
+    except Image.DecompressionBombError:
+        raise ValueError("La imagen tiene demasiados píxeles")
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("El archivo no es una imagen válida")
+    formato = imagen.format if imagen.format in FORMATOS_CONSERVADOS else "JPEG"
+    # Aplicamos la rotación de la cámara antes de redimensionar
+    return ImageOps.exif_transpose(imagen), formato
+
+
+def _guardar(imagen, formato: str, destino) -> None:
+    if formato == "JPEG" and imagen.mode not in ("RGB", "L"):
+        imagen = imagen.convert("RGB")
+    opciones = {"quality": 85, "optimize": True} if formato in ("JPEG", "WEBP") else {}
+    imagen.save(destino, format=formato, **opciones)
+
+
+def reducir_imagen(archivo: BinaryIO, lado_maximo: int) -> BinaryIO:
+    """
+    Si la imagen supera lado_maximo píxeles por algún lado, devuelve una copia
+    reducida; si no, el mismo archivo rebobinado. Lanza ValueError si no es
+    una imagen.
+    """
+    archivo.seek(0)
+    imagen, formato = _abrir(archivo)
+    if max(imagen.size) <= lado_maximo:
+        archivo.seek(0)
+        return archivo
+
+    imagen.thumbnail((lado_maximo, lado_maximo))
+    reducida = SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+    _guardar(imagen, formato, reducida)
+    reducida.seek(0)
+    return reducida
+
+
+def generar_derivadas(archivo: BinaryIO) -> Dict[str, tuple]:
+    """{nombre: (bytes, formato)} con una versión por cada TAMANOS_DERIVADAS."""
+    archivo.seek(0)
+    original, formato = _abrir(archivo)
+    derivadas = {}
+    for nombre, ancho in TAMANOS_DERIVADAS.items():
+        imagen = original.copy()
+        imagen.thumbnail((ancho, ancho * 4))
+        destino = SpooledTemporaryFile(max_size=1024 * 1024)
+        _guardar(imagen, formato, destino)
+        destino.seek(0)
+        derivadas[nombre] = (destino.read(), formato)
+    archivo.seek(0)
+    return derivadas
+
+
+def url_cloudinary(secure_url: str, ancho: int) -> Optional[str]:
+    """URL de Cloudinary con la transformación de tamaño (None si no es de Cloudinary)."""
+    if "res.cloudinary.com" not in secure_url or "/image/upload/" not in secure_url:
+        return None
+    return secure_url.replace("/image/upload/", f"/image/upload/c_limit,w_{ancho},f_auto,q_auto/", 1)
+
+
+def urls_derivadas(secure_url: Optional[str]) -> Dict[str, Optional[str]]:
+    """Derivadas de una URL ya subida (vacío si no se pueden calcular)."""
+    if not secure_url:
+        return {}
+    urls = {nombre: url_cloudinary(secure_url, ancho) for nombre, ancho in TAMANOS_DERIVADAS.items()}
+    return urls if all(urls.values()) else {}
@@ -0,0 +1,264 @@
+"""
+Importación masiva de marcadores desde CSV o GeoJSON.
+
+El cuerpo de la petición se lee en streaming y se procesa por lotes:
+geocodificación de las filas sin coordenadas (una consulta por lugar
+distinto, con la concurrencia limitada del geocodificador), validación con
+el modelo Marcador e inserción con insert_many(ordered=False). El informe
+por fila se va escribiendo como NDJSON, así que la memoria no depende del
+tamaño del archivo.
+
+El cuerpo se vuelca antes a un SpooledTemporaryFile (memoria hasta 1 MiB,
+disco a partir de ahí; con un máximo de bytes) y se relee por trozos; las
+escrituras en disco y las lecturas van en un hilo. Con ASGI < 2.4,
+StreamingResponse escucha la desconexión del cliente con receive() y se
+comería los trozos del cuerpo si los leyéramos mientras respondemos.
+
+CSV: cabecera con ciudad_pais (o ciudad), y opcionalmente latitud, longitud
+e imagen_url. GeoJSON: FeatureCollection de Point; sin geometría se
+geocodifica properties.ciudad_pais / ciudad / name.
+"""
+import asyncio
+import codecs
+import csv
+import json
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import ijson
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from geo import punto_geojson
+from geocodificador import Geocodificador
+from marcador import Marcador
+from versiones_marcadores import VersionesMarcadores
+
+Fila = Tuple[int, dict]
+
+TAMANO_TROZO = 64 * 1024
+
+
+# --- LECTORES EN STREAMING ---
+
+class CuerpoDemasiadoGrande(ValueError):
+    """El cuerpo de la petición supera el máximo permitido (413)."""
+
+
+async def volcar_cuerpo(trozos: AsyncIterator[bytes], max_bytes: Optional[int] = None,
+                        max_memoria: int = 1024 * 1024) -> SpooledTemporaryFile:
+    archivo = SpooledTemporaryFile(max_size=max_memoria)
+    escritos = 0
+    try:
+        async for trozo in trozos:
+            escritos += len(trozo)
+            if max_bytes is not None and escritos > max_bytes:
+                raise CuerpoDemasiadoGrande(f"El cuerpo supera {max_bytes} bytes")
+            if escritos > max_memoria:
+                # Ya en disco (o a punto de pasar): la escritura no va en el bucle
+                await asyncio.to_thread(archivo.write, trozo)
+            else:
+                archivo.write(trozo)
+    except BaseException:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
+
+
+async def leer_archivo(archivo, tamano: int = TAMANO_TROZO) -> AsyncIterator[bytes]:
+    """Devuelve el archivo por trozos y lo cierra al terminar (lee en un hilo: puede estar en disco)."""
+    try:
+        while trozo := await asyncio.to_thread(archivo.read, tamano):
+            yield trozo
+    finally:
+        archivo.close()
+
+
+async def filas_csv(trozos: AsyncIterator[bytes]) -> AsyncIterator[Fila]:
+    """
+    Parte los bytes en registros CSV completos. Un registro acaba en un salto
+    de línea que no está dentro de comillas, así que un campo entrecomillado
+    puede llevar saltos de línea aunque llegue partido entre dos trozos.
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    cabecera: Optional[List[str]] = None
+    pendiente = ""
+    registro = ""
+    numero = 0
+
+    async def registros() -> AsyncIterator[str]:
+        nonlocal pendiente, registro
+        async for trozo in trozos:
+            pendiente += decodificador.decode(trozo)
+            *lineas, pendiente = pendiente.split("\n")
+            for linea in lineas:
+                registro += linea + "\n"
+                if registro.count('"') % 2 == 0:
+                    yield registro
+                    registro = ""
+        resto = registro + pendiente + decodificador.decode(b"", final=True)
+        if resto.strip():
+            yield resto
+
+    async for texto in registros():
+        valores = next(csv.reader([texto]), [])
+        if not any(v.strip() for v in valores):
+            continue
+        if cabecera is None:
+            cabecera = [c.strip().lower() for c in valores]
+            continue
+        numero += 1
+        yield numero, dict(zip(cabecera, valores))
+
+
+class _LectorAsincrono:
+    """Adapta un iterador asíncrono de bytes al read() que espera ijson."""
+
+    def __init__(self, trozos: AsyncIterator[bytes]):
+        self._trozos = trozos.__aiter__()
+        self._resto = b""
+
+    async def read(self, n: int = -1) -> bytes:
+        while not self._resto:
+            try:
+                self._resto = await self._trozos.__anext__()
+            except StopAsyncIteration:
+                return b""
+        if n < 0:
+            n = len(self._resto)
+        datos, self._resto = self._resto[:n], self._resto[n:]
+        return datos
+
+
+def elementos_json(trozos: AsyncIterator[bytes], prefijo: str) -> AsyncIterator:
+    """Objetos de un documento JSON en streaming (prefijo de ijson, p.ej. "item")."""
+    return ijson.items_async(_LectorAsincrono(trozos), prefijo, use_float=True)
+
+
+async def filas_geojson(trozos: AsyncIterator[bytes]) -> AsyncIterator[Fila]:
+    numero = 0
+    async for feature in elementos_json(trozos, "features.item"):
+        numero += 1
+        propiedades = feature.get("properties") or {}
+        fila = {k: v for k, v in propiedades.items() if v is not None}
+        geometria = feature.get("geometry") or {}
+        if geometria.get("type") == "Point" and len(geometria.get("coordinates") or []) >= 2:
+            fila["longitud"], fila["latitud"] = geometria["coordinates"][:2]
+        yield numero, fila
+
+
+# --- PROCESO POR LOTES ---
+
+def _vacio(valor) -> bool:
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+class ImportadorMarcadores:
+
+    def __init__(self, coleccion, geocodificador: Geocodificador, lote: int = 500,
+                 al_terminar: Optional[Callable[[str], Awaitable[None]]] = None,
+                 versiones: Optional[VersionesMarcadores] = None):
+        self.coleccion = coleccion
+        self.geocodificador = geocodificador
+        self.lote = lote
+        self.al_terminar = al_terminar
+        # Si se indica, cada lote reserva sus versiones (sincronización del mapa)
+        self.versiones = versiones
+
+    async def importar(self, email: str, filas: AsyncIterator[Fila]) -> AsyncIterator[bytes]:
+        """Genera el informe NDJSON: una línea por fila y un resumen al final."""
+        resumen = {"filas": 0, "insertadas": 0, "errores": 0}
+        lote: List[Fila] = []
+        try:
+            async for fila in filas:
+                lote.append(fila)
+                if len(lote) >= self.lote:
+                    async for linea in self._procesar(email, lote, resumen):
+                        yield linea
+                    lote = []
+            if lote:
+                async for linea in self._procesar(email, lote, resumen):
+                    yield linea
+        except (ValueError, ijson.JSONError, csv.Error) as e:
+            # Archivo mal formado: informamos y cerramos con lo que se haya insertado
+            resumen["error_archivo"] = str(e)
+        finally:
+            if resumen["insertadas"] and self.al_terminar is not None:
+                await self.al_terminar(email)
+
+        yield _linea({"resumen": resumen})
+
+    async def _procesar(self, email: str, lote: List[Fila], resumen: dict) -> AsyncIterator[bytes]:
+        resumen["filas"] += len(lote)
+
+        # 1. Geocodificar solo lo que no trae coordenadas (una vez por lugar)
+        sin_coordenadas = set()
+        for _, fila in lote:
+            fila["ciudad_pais"] = str(fila.get("ciudad_pais") or fila.get("ciudad") or fila.get("name") or "").strip()
+            if _vacio(fila.get("latitud")) or _vacio(fila.get("longitud")):
+                sin_coordenadas.add(fila["ciudad_pais"])
+        coordenadas = await self.geocodificador.buscar_varios(sin_coordenadas) if sin_coordenadas else {}
+
+        # 2. Validar contra el modelo
+        informe = {}
+        documentos, numeros = [], []
+        for numero, fila in lote:
+            if not fila["ciudad_pais"]:
+                informe[numero] = {"fila": numero, "estado": "error", "error": "Falta ciudad_pais"}
+                continue
+            if fila["ciudad_pais"] in coordenadas and (_vacio(fila.get("latitud")) or _vacio(fila.get("longitud"))):
+                lat, lon = coordenadas[fila["ciudad_pais"]]
+                if lat is None:
+                    informe[numero] = {"fila": numero, "estado": "error",
+                                       "error": f"No se encontraron coordenadas para {fila['ciudad_pais']}"}
+                    continue
+                fila["latitud"], fila["longitud"] = lat, lon
+            try:
+                marcador = Marcador(
+                    email_usuario=email,
+                    ciudad_pais=fila["ciudad_pais"],
+                    latitud=fila.get("latitud"),
+                    longitud=fila.get("longitud"),
+                    imagen_url=None if _vacio(fila.get("imagen_url")) else fila["imagen_url"],
+                )
+            except ValidationError as e:
+                errores = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                informe[numero] = {"fila": numero, "estado": "error", "error": errores}
+                continue
+            documento = marcador.model_dump()
+            documento["ubicacion"] = punto_geojson(marcador.latitud, marcador.longitud)
+            documentos.append(documento)
+            numeros.append(numero)
+
+        # 3. Insertar el lote de una vez
+        fallidas = {}
+        if documentos:
+            try:
+                if self.versiones is not None:
+                    primera = await self.versiones.reservar(email, len(documentos))
+                    for i, documento in enumerate(documentos):
+                        documento["version"] = primera + i
+                await self.coleccion.insert_many(documentos, ordered=False)
+            except BulkWriteError as e:
+                fallidas = {err["index"]: err.get("errmsg", "Error de escritura")
+                            for err in e.details.get("writeErrors", [])}
+            except PyMongoError as e:
+                # Red, timeout...: no sabemos qué filas llegaron, el lote entero cuenta como fallido
+                fallidas = dict.fromkeys(range(len(documentos)), f"Error de escritura del lote: {e}")
+        for indice, numero in enumerate(numeros):
+            if indice in fallidas:
+                informe[numero] = {"fila": numero, "estado": "error", "error": fallidas[indice]}
+            else:
+                informe[numero] = {"fila": numero, "estado": "ok", "id": str(documentos[indice]["_id"])}
+
+        for numero, _ in lote:
+            if informe[numero]["estado"] == "ok":
+                resumen["insertadas"] += 1
+            else:
+                resumen["errores"] += 1
+            yield _linea(informe[numero])
+
+
+def _linea(datos: dict) -> bytes:
+    return (json.dumps(datos, ensure_ascii=False) + "\n").encode()
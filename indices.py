@@ -0,0 +1,164 @@
+"""
+Registro declarativo de índices de Mongo para los dos servicios.
+
+Los índices se crean al arrancar cada app (lifespan). Este módulo también es
+un comando de diagnóstico que ejecuta explain() sobre las consultas más
+usadas y falla si alguna acaba en COLLSCAN o ordena en memoria (SORT):
+
+    python indices.py --servicio mapa --crear --explain
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import sys
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+
+Registro = Dict[str, List[IndexModel]]
+
+# --- ÍNDICES POR SERVICIO ---
+
+# Base de datos "MiMapa" (main.py)
+INDICES_MAPA: Registro = {
+    "Visitas": [
+        # /mapa/visitas: historial de un mapa por fecha descendente, con _id
+        # como desempate del cursor (ver paginacion.orden_keyset)
+        IndexModel([("email_visitado", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)],
+                   name="visitado_fecha_id"),
+    ],
+    "Marcadores": [
+        IndexModel([("email_usuario", ASCENDING)], name="email_usuario"),
+        # /marcadores/bbox: marcadores de un usuario dentro de la zona visible
+        IndexModel([("email_usuario", ASCENDING), ("ubicacion", GEOSPHERE)], name="email_ubicacion"),
+        # /marcadores/{email}/cambios: marcadores posteriores a una versión
+        IndexModel([("email_usuario", ASCENDING), ("version", ASCENDING)], name="email_version"),
+    ],
+    "Tabla1": [
+        # filtrar_objeto1: búsqueda por palabras en la descripción
+        IndexModel([("descripcion", TEXT)], name="descripcion_texto", default_language="spanish"),
+        IndexModel([("fecha", ASCENDING)], name="fecha"),
+    ],
+    "Geocache": [
+        # Mongo borra la entrada cuando se alcanza la fecha de "expira"
+        IndexModel([("expira", ASCENDING)], name="expira_ttl", expireAfterSeconds=0),
+    ],
+    "Sesiones": [
+        IndexModel([("expira", ASCENDING)], name="expira_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Base de datos "KalendasV2" (archivoAPI.py)
+INDICES_ARCHIVOS: Registro = {
+    "Archivos": [
+        # Cola del modo diferido: pendientes de cada instancia por orden de próximo intento
+        IndexModel([("instancia", ASCENDING), ("estado", ASCENDING), ("proximo_intento", ASCENDING)],
+                   name="cola_instancia"),
+    ],
+    "Blobs": [
+        # Deduplicación: un único blob por contenido
+        IndexModel([("hash", ASCENDING)], name="hash_unico", unique=True),
+    ],
+}
+
+# --- CONSULTAS CALIENTES (para explain) ---
+# (colección, descripción, filtro, orden)
+Consulta = Tuple[str, str, dict, list]
+
+CONSULTAS_MAPA: List[Consulta] = [
+    ("Visitas", "historial de visitas", {"email_visitado": "a@b.c"}, [("fecha", DESCENDING), ("_id", DESCENDING)]),
+    ("Marcadores", "ver_mapa: marcadores del propietario", {"email_usuario": "a@b.c"}, []),
+    ("Marcadores", "marcadores en la zona visible",
+     {"email_usuario": "a@b.c", "ubicacion": {"$geoWithin": {"$geometry": {
+         "type": "Polygon", "coordinates": [[[-10, 35], [5, 35], [5, 44], [-10, 44], [-10, 35]]]}}}}, []),
+    ("Marcadores", "cambios desde una versión", {"email_usuario": "a@b.c", "version": {"$gt": 10}},
+     [("version", ASCENDING)]),
+    ("Tabla1", "filtrar_objeto1: descripcion", {"$text": {"$search": "texto"}}, []),
+    ("Tabla1", "filtrar_objeto1: rango de fechas", {"fecha": {"$gte": datetime(2000, 1, 1)}}, []),
+    ("Geocache", "obtener_coordenadas: caché", {"_id": "madrid, españa"}, []),
+    ("ResumenVisitas", "ver_mapa: resumen de visitas", {"_id": "a@b.c"}, []),
+]
+
+CONSULTAS_ARCHIVOS: List[Consulta] = [
+    ("Archivos", "cola diferida: siguiente pendiente",
+     {"instancia": "host", "$or": [{"estado": "pendiente", "proximo_intento": {"$lte": datetime.now()}},
+                                   {"estado": "subiendo", "reclamado_hasta": {"$lt": datetime.now()}}]},
+     [("proximo_intento", ASCENDING)]),
+    ("Blobs", "deduplicación: blob por hash", {"hash": "0" * 64}, []),
+]
+
+SERVICIOS = {
+    "mapa": ("MiMapa", INDICES_MAPA, CONSULTAS_MAPA),
+    "archivos": ("KalendasV2", INDICES_ARCHIVOS, CONSULTAS_ARCHIVOS),
+}
+
+
+async def crear_indices(db, registro: Registro) -> None:
+    """Crea (si no existen) todos los índices del registro."""
+    for nombre, modelos in registro.items():
+        await db[nombre].create_indexes(modelos)
+
+
+def etapas(plan: dict) -> List[str]:
+    """Lista las etapas (stage) de un plan de ejecución, recorriéndolo entero."""
+    encontradas = []
+    if "stage" in plan:
+        encontradas.append(plan["stage"])
+    for clave in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(clave), dict):
+            encontradas += etapas(plan[clave])
+    for hijo in plan.get("inputStages", []):
+        encontradas += etapas(hijo)
+    return encontradas
+
+
+async def explicar(db, consultas: List[Consulta]) -> List[dict]:
+    informe = []
+    for nombre, descripcion, filtro, orden in consultas:
+        cursor = db[nombre].find(filtro)
+        if orden:
+            cursor = cursor.sort(orden)
+        plan = await cursor.explain()
+        ganador = plan.get("queryPlanner", {}).get("winningPlan", {})
+        lista = etapas(ganador)
+        informe.append({
+            "coleccion": nombre,
+            "consulta": descripcion,
+            "etapas": lista,
+            "collscan": "COLLSCAN" in lista,
+            "sort_en_memoria": "SORT" in lista,
+        })
+    return informe
+
+
+async def _main(servicio: str, crear: bool, explain: bool) -> int:
+    import motor.motor_asyncio as motor
+    from environs import Env
+
+    env = Env()
+    env.read_env()
+    nombre_db, registro, consultas = SERVICIOS[servicio]
+    client = motor.AsyncIOMotorClient(env('MONGO_URI'))
+    db = client[nombre_db]
+
+    codigo = 0
+    if crear:
+        await crear_indices(db, registro)
+        print(f"Índices creados en {nombre_db}")
+    if explain:
+        for fila in await explicar(db, consultas):
+            estado = "COLLSCAN" if fila["collscan"] else "SORT" if fila["sort_en_memoria"] else "ok"
+            print(f"[{estado}] {fila['coleccion']}: {fila['consulta']} -> {' > '.join(fila['etapas'])}")
+            if estado != "ok":
+                codigo = 1
+    client.close()
+    return codigo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gestión y diagnóstico de índices")
+    parser.add_argument("--servicio", choices=SERVICIOS, default="mapa")
+    parser.add_argument("--crear", action="store_true", help="crear los índices del registro")
+    parser.add_argument("--explain", action="store_true", help="falla si alguna consulta hace COLLSCAN")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.servicio, args.crear, args.explain or not args.crear)))
@@ -0,0 +1,271 @@
+"""
+Instrumentación de las peticiones: tiempos por tramo y métricas Prometheus.
+
+- MiddlewareTiempos (ASGI): mide cada petición, añade la cabecera
+  Server-Timing con lo que se ha ido en cada tipo de tramo (mongo, http,
+  plantilla, subida...) y alimenta los histogramas.
+- tramo(tipo, nombre): mide un bloque de código dentro de la petición actual.
+- MonitorComandos: CommandListener de pymongo; cada comando es un tramo
+  "mongo". Motor ejecuta pymongo en hilos con una copia del contexto, así
+  que el tiempo se suma a la petición que lanzó la consulta.
+- eventos_httpx(): event hooks para el httpx.AsyncClient compartido.
+- exponer_prometheus(): histogramas en formato de texto de Prometheus
+  (para /metrics, sin dependencias).
+- Perfilado bajo demanda (PERFILADO=true): con ?perfil=1 o la cabecera
+  X-Perfil: 1 se devuelve el perfil de la petición en lugar de la respuesta.
+  Usa pyinstrument si está instalado; si no, cProfile (que también recoge lo
+  que hagan otras peticiones a la vez).
+"""
+import bisect
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs
+
+from pymongo import monitoring
+
+CUBETAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+# Tramos fuera de una petición (buffer de visitas, trabajador de archivos...)
+SIN_PETICION = "fondo"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histograma:
+    """Histograma con etiquetas; se observa desde el bucle y desde hilos."""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...], cubetas: Iterable[float] = CUBETAS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.cubetas = tuple(cubetas)
+        self._lock = threading.Lock()
+        # valores de las etiquetas -> [cuentas por cubeta, suma, total]
+        self._series: Dict[tuple, list] = {}
+
+    def observar(self, valores: tuple, segundos: float) -> None:
+        indice = bisect.bisect_left(self.cubetas, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * len(self.cubetas), 0.0, 0]
+            if indice < len(self.cubetas):
+                serie[0][indice] += 1
+            serie[1] += segundos
+            serie[2] += 1
+
+    def exponer(self) -> list:
+        with self._lock:
+            series = [(valores, list(cuentas), suma, total) for valores, (cuentas, suma, total) in self._series.items()]
+
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, cuentas, suma, total in sorted(series):
+            etiquetas = ",".join(f'{e}="{_escapar(v)}"' for e, v in zip(self.etiquetas, valores))
+            separador = "," if etiquetas else ""
+            acumulado = 0
+            for limite, cuenta in zip(self.cubetas, cuentas):
+                acumulado += cuenta
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas}{separador}le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{{{etiquetas}{separador}le="+Inf"}} {total}')
+            lineas.append(f"{self.nombre}_sum{{{etiquetas}}} {suma:.6f}")
+            lineas.append(f"{self.nombre}_count{{{etiquetas}}} {total}")
+        return lineas
+
+
+PETICIONES = Histograma(
+    "http_peticion_segundos", "Duración de las peticiones HTTP.", ("app", "metodo", "ruta", "estado")
+)
+TRAMOS = Histograma(
+    "tramo_segundos", "Duración de los tramos (mongo, http, plantilla, subida...).", ("app", "tipo", "nombre")
+)
+
+
+# --- TRAMOS DE LA PETICIÓN ACTUAL ---
+
+class Tramos:
+    """Tiempo acumulado por tipo de tramo en una petición."""
+
+    def __init__(self, app: str):
+        self.app = app
+        self._lock = threading.Lock()
+        self.tiempos: Dict[str, list] = {}
+
+    def sumar(self, tipo: str, segundos: float) -> None:
+        with self._lock:
+            tiempo = self.tiempos.setdefault(tipo, [0.0, 0])
+            tiempo[0] += segundos
+            tiempo[1] += 1
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            tiempos = list(self.tiempos.items())
+        partes = [f'{tipo};dur={segundos * 1000:.1f};desc="{veces}x"' for tipo, (segundos, veces) in tiempos]
+        partes.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(partes)
+
+
+_actual: ContextVar[Optional[Tramos]] = ContextVar("tramos", default=None)
+
+
+def registrar(tipo: str, nombre: str, segundos: float) -> None:
+    tramos = _actual.get()
+    TRAMOS.observar((tramos.app if tramos else SIN_PETICION, tipo, nombre), segundos)
+    if tramos is not None:
+        tramos.sumar(tipo, segundos)
+
+
+@contextmanager
+def tramo(tipo: str, nombre: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(tipo, nombre, time.perf_counter() - inicio)
+
+
+class MonitorComandos(monitoring.CommandListener):
+    """
+    Cada comando de Mongo es un tramo "mongo" con nombre "<comando> <colección>".
+    Los eventos de fin no traen el comando, así que la colección se recuerda
+    desde started; la tabla está acotada por si algún started se queda sin fin
+    (p.ej. se cierra la conexión a mitad del comando).
+    """
+
+    def __init__(self, max_en_curso: int = 10000):
+        self._colecciones: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_en_curso = max_en_curso
+
+    def started(self, event):
+        coleccion = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            coleccion = event.command.get("collection")
+        with self._lock:
+            self._colecciones[(event.connection_id, event.request_id)] = coleccion if isinstance(coleccion, str) else ""
+            while len(self._colecciones) > self.max_en_curso:
+                self._colecciones.popitem(last=False)
+
+    def _terminar(self, event):
+        with self._lock:
+            coleccion = self._colecciones.pop((event.connection_id, event.request_id), "")
+        nombre = f"{event.command_name} {coleccion}" if coleccion else event.command_name
+        registrar("mongo", nombre, event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._terminar(event)
+
+    def failed(self, event):
+        self._terminar(event)
+
+
+def eventos_httpx() -> dict:
+    """event_hooks del httpx.AsyncClient: un tramo "http" por llamada, por host."""
+
+    async def al_enviar(request):
+        request.extensions["inicio_tramo"] = time.perf_counter()
+
+    async def al_recibir(response):
+        inicio = response.request.extensions.get("inicio_tramo")
+        if inicio is not None:
+            registrar("http", response.request.url.host, time.perf_counter() - inicio)
+
+    return {"request": [al_enviar], "response": [al_recibir]}
+
+
+def exponer_prometheus(indicadores: Optional[Dict[str, float]] = None) -> str:
+    """Histogramas y, opcionalmente, valores instantáneos (gauges) sin etiquetas."""
+    lineas = PETICIONES.exponer() + TRAMOS.exponer()
+    for nombre, valor in (indicadores or {}).items():
+        if valor is not None:
+            lineas += [f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+    return "\n".join(lineas) + "\n"
+
+
+# --- MIDDLEWARE ---
+
+def _pide_perfil(scope) -> bool:
+    if parse_qs(scope.get("query_string", b"").decode("latin-1")).get("perfil") == ["1"]:
+        return True
+    return dict(scope.get("headers", [])).get(b"x-perfil") == b"1"
+
+
+class MiddlewareTiempos:
+    """
+    Middleware ASGI (no BaseHTTPMiddleware: no toca el cuerpo de las
+    respuestas en streaming). La ruta del histograma es la plantilla
+    ("/marcadores/{email}"), no la URL, para no disparar las series.
+    """
+
+    def __init__(self, app, nombre: str, perfilado: bool = False):
+        self.app = app
+        self.nombre = nombre
+        self.perfilado = perfilado
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.perfilado and _pide_perfil(scope):
+            await self._perfilar(scope, receive, send)
+            return
+
+        tramos = Tramos(self.nombre)
+        token = _actual.set(tramos)
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                cabecera = tramos.server_timing(time.perf_counter() - inicio)
+                mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"server-timing", cabecera.encode())]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            PETICIONES.observar((self.nombre, scope["method"], ruta, str(estado)), time.perf_counter() - inicio)
+
+    async def _perfilar(self, scope, receive, send) -> None:
+        from starlette.responses import Response
+
+        async def descartar(mensaje):
+            pass
+
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+
+        if Profiler is not None:
+            perfil = Profiler(async_mode="enabled")
+            perfil.start()
+            try:
+                await self.app(scope, receive, descartar)
+            finally:
+                perfil.stop()
+            respuesta = Response(perfil.output_html(), media_type="text/html")
+        else:
+            import cProfile
+            import io
+            import pstats
+
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                await self.app(scope, receive, descartar)
+            finally:
+                perfil.disable()
+            salida = io.StringIO()
+            pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(60)
+            respuesta = Response(salida.getvalue(), media_type="text/plain")
+        await respuesta(scope, receive, send)
@@ -1,38 +1,45 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
-from typing import Optional
-from bson import ObjectId
+from typing import Literal, Optional
 from environs import Env
-from fastapi import FastAPI, File, Form, Request, Depends, HTTPException, UploadFile, requests
-from fastapi.responses import RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, File, Form, Request, Depends, HTTPException, UploadFile, Query
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import motor.motor_asyncio as motor
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel
 
-# --- IMPORTAMOS LA LIBRERÍA DE VERIFICACIÓN DE GOOGLE ---
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-
-from marcador import Marcador
-from objeto1 import Objeto1
-import requests
-
-# Importar cloudinary
-import cloudinary.uploader
-import cloudinary
+from marcador import Marcador, CAMPOS_MARCADOR, PROYECCION_MAPA, marcador_para_mapa, serializar_marcador
+from geocodificador import Geocodificador, ProveedorNominatim
+from subidas import AlmacenamientoLocal, crear_ejecutor
+from paginacion import cursor_keyset, leer_pagina, respuesta_lista_json, respuesta_ndjson
+from indices import INDICES_MAPA, crear_indices
+from buffer_visitas import crear_buffer
+from resumen_visitas import ResumenVisitas
+from geo import FILTRO_VACIO, filtro_bbox, punto_geojson
+from verificacion_google import GOOGLE_CERTS_URL, VerificadorGoogle
+from sesiones import crear_almacen, nuevo_sid
+from cache_marcadores import CacheMarcadores
+from versiones_marcadores import VersionesMarcadores
+from imagenes import tamano_archivo
+from exportacion import FORMATOS, PROYECCION_EXPORTACION, acepta_gzip, comprimir_gzip
+from importacion import CuerpoDemasiadoGrande, ImportadorMarcadores, filas_csv, filas_geojson, leer_archivo, volcar_cuerpo
+from recursos import Recursos
+from carga_perezosa import Perezoso, RutasPerezosas
+from plantillas import crear_templates
+from instrumentacion import CONTENT_TYPE_PROMETHEUS, MiddlewareTiempos, exponer_prometheus
 
 env = Env()
 env.read_env()
 
 # Variables de entorno
-uri = env('MONGO_URI')
 client_id = env('CLIENT_ID')
 # client_secret ya no es necesario para este flujo, pero puedes dejarlo si quieres
 
 # --- CONFIGURACIÓN DE BASE DE DATOS (Mantenemos tu código) ---
-client = motor.AsyncIOMotorClient(uri)
+# Pool y timeouts configurables (ver recursos.py); se abre y cierra en el lifespan
+recursos = Recursos(env)
+client = recursos.mongo
 db = client["MiMapa"]
 coleccion1 = db["Tabla1"]
 mapas_coleccion = db["Mapas"]
@@ -40,26 +47,159 @@ archivos_coleccion = db["Archivos"]
 usuarios_coleccion = db["Usuarios"]
 marcadores_coleccion = db["Marcadores"]
 visitas_coleccion = db["Visitas"]
+geocache_coleccion = db["Geocache"]
+sesiones_coleccion = db["Sesiones"]
+
+# --- CLIENTE HTTP COMPARTIDO Y GEOCODING ---
+# Un único AsyncClient para reutilizar conexiones con los servicios externos
+geocodificador = Geocodificador(
+    ProveedorNominatim(recursos.cliente_http, url=env('NOMINATIM_URL', "https://nominatim.openstreetmap.org/search")),
+    coleccion=geocache_coleccion,
+    concurrencia=env.int('GEOCODING_CONCURRENCIA', 1),
+)
+
+# --- SESIONES EN EL SERVIDOR (la cookie solo lleva el id de sesión) ---
+sesiones = crear_almacen(env, sesiones_coleccion)
+
+# --- VERIFICACIÓN DE LOS TOKENS DE GOOGLE (certificados y tokens en caché) ---
+verificador_google = VerificadorGoogle(
+    client_id,
+    recursos.cliente_http,
+    url_certs=env('GOOGLE_CERTS_URL', GOOGLE_CERTS_URL),
+)
+
+# Las visitas se escriben por lotes en segundo plano (ver buffer_visitas.py)
+# y cada lote actualiza los contadores pre-agregados del mapa
+resumen_visitas = ResumenVisitas(db, env.int('VISITAS_ULTIMAS', 20))
+buffer_visitas = crear_buffer(env, visitas_coleccion, al_escribir=resumen_visitas.incorporar)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Arranque: ping a Mongo e índices declarados en indices.py
+    await recursos.iniciar()
+    await crear_indices(db, INDICES_MAPA)
+    await buffer_visitas.iniciar()
+    yield
+    # Apagado: primero vaciamos las visitas pendientes, luego cerramos clientes
+    await buffer_visitas.detener()
+    ejecutor_subidas.cerrar()
+    await recursos.cerrar()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- CONFIGURACIÓN DE MIDDLEWARE (IMPORTANTE) ---
 # Clave secreta para firmar la cookie de sesión
 app.add_middleware(SessionMiddleware, secret_key="SUPER_SECRET_KEY_RANDOM")
+# Tiempos por petición y por tramo (Server-Timing y /metrics); el último
+# middleware añadido es el más externo, así mide también la sesión
+app.add_middleware(MiddlewareTiempos, nombre="mapa", perfilado=env.bool('PERFILADO', False))
 
 # Configurar Jinja2
-templates = Jinja2Templates(directory="templates")
+# Usa las plantillas precompiladas si están al día (ver plantillas.py)
+templates = crear_templates()
 
-cloudinary.config( 
-    cloud_name = env('CLOUDINARY_CLOUD_NAME'), 
-    api_key = env('CLOUDINARY_API_KEY'), 
-    api_secret = env('CLOUDINARY_API_SECRET'),
-    secure = True
-)
+# Pool de hilos para las subidas (Cloudinary o disco local, según ALMACENAMIENTO)
+ejecutor_subidas = crear_ejecutor(env)
+if isinstance(ejecutor_subidas.almacenamiento, AlmacenamientoLocal):
+    almacen = ejecutor_subidas.almacenamiento
+    app.mount(almacen.url_base, StaticFiles(directory=almacen.directorio), name="media")
+
+# Fotos de los marcadores: tamaño máximo aceptado y lado máximo del original guardado
+imagen_max_bytes = env.int('IMAGEN_MAX_BYTES', 15 * 1024 * 1024)
+imagen_lado_maximo = env.int('IMAGEN_LADO_MAXIMO', 2048)
 
 
 path = "/path"
+# Máximo de marcadores que devuelve /marcadores/bbox en una respuesta
+max_marcadores_bbox = env.int('MAX_MARCADORES_BBOX', 2000)
+# Por debajo de este zoom /marcadores/bbox agrupa los marcadores en clusters
+zoom_clusters = env.int('ZOOM_CLUSTERS', 12)
+def crear_clusters():
+    # numpy solo se importa si alguien pide clusters
+    from agrupamiento import CacheClusters
+
+    return CacheClusters(
+        marcadores_coleccion,
+        max_usuarios=env.int('CLUSTERS_MAX_USUARIOS', 256),
+        radio_px=env.int('CLUSTERS_RADIO_PX', 60),
+        max_zoom=zoom_clusters,
+        ttl=env.float('CLUSTERS_TTL', 300.0),
+    )
+
+clusters = Perezoso(crear_clusters)
+# Caché de lectura de los marcadores por propietario (con ETag)
+cache_marcadores = CacheMarcadores(
+    marcadores_coleccion,
+    max_usuarios=env.int('CACHE_MARCADORES_USUARIOS', 1024),
+    ttl=env.float('CACHE_MARCADORES_TTL', 300.0),
+    max_marcadores=env.int('CACHE_MARCADORES_MAX', 5000),
+)
+
+# Contador de versión por usuario: el mapa guarda los marcadores en el
+# navegador y pide solo los cambios (ver versiones_marcadores.py)
+versiones_marcadores = VersionesMarcadores(db, marcadores_coleccion)
+
+async def invalidar_marcadores(email: str):
+    """Tras crear un marcador: descartamos todo lo cacheado de ese usuario."""
+    if clusters.creado:
+        clusters().invalidar(email)
+    await cache_marcadores.invalidar(email)
+
+# Importación masiva: filas que se geocodifican, validan e insertan de una vez
+importador_marcadores = ImportadorMarcadores(
+    marcadores_coleccion,
+    geocodificador,
+    lote=env.int('IMPORTACION_LOTE', 500),
+    al_terminar=invalidar_marcadores,
+    versiones=versiones_marcadores,
+)
+
+# --- TESELAS DEL MAPA ---
+# Con TILES_PROXY=true el mapa pide las teselas a /teselas/... y se guardan
+# en disco (LRU de TILES_MAX_BYTES); si no, el navegador va directo al origen
+tiles_proxy = env.bool('TILES_PROXY', False)
+tiles_origen = env('TILES_ORIGEN', "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+tiles_max_age = env.int('TILES_MAX_AGE', 24 * 3600)
+url_teselas = "/teselas/{z}/{x}/{y}.png" if tiles_proxy else tiles_origen
+
+def crear_proxy_teselas():
+    from teselas import CacheTeselasDisco, ProxyTeselas
+
+    return ProxyTeselas(
+        recursos.cliente_http,
+        CacheTeselasDisco(env('TILES_DIR', 'teselas'), max_bytes=env.int('TILES_MAX_BYTES', 512 * 1024 * 1024)),
+        origen=tiles_origen,
+        ttl=env.float('TILES_TTL', 7 * 24 * 3600),
+        max_zoom=env.int('TILES_MAX_ZOOM', 19),
+    )
+
+proxy_teselas = Perezoso(crear_proxy_teselas)
+
+# Tamaño máximo del archivo de /marcadores/import (se vuelca a disco antes de procesarlo)
+importacion_max_bytes = env.int('IMPORTACION_MAX_BYTES', 50 * 1024 * 1024)
+
+# Documentos por lote del cursor al exportar los marcadores de un usuario
+exportacion_batch_size = env.int('EXPORTACION_BATCH_SIZE', 1000)
+
+# Documentos que trae Mongo en cada lote del cursor al filtrar Objeto1
+objeto1_batch_size = env.int('OBJETO1_BATCH_SIZE', 500)
+
+# Rutas poco usadas (CRUD de Objeto1) registradas en la primera petición.
+# Con CARGA_PEREZOSA=false se registran al arrancar y aparecen en /docs.
+carga_perezosa = env.bool('CARGA_PEREZOSA', True)
+
+def crear_router_objeto1():
+    from rutas_objeto1 import CacheEstadisticas, crear_router
+
+    # Resultados de /path/stats por filtro; se invalidan con cada escritura
+    estadisticas = CacheEstadisticas(
+        max_entradas=env.int('OBJETO1_STATS_CACHE', 256),
+        ttl=env.float('OBJETO1_STATS_TTL', 300.0),
+    )
+    return crear_router(coleccion1, objeto1_batch_size, path, estadisticas,
+                        bulk_lote=env.int('OBJETO1_BULK_LOTE', 500),
+                        bulk_max_bytes=env.int('OBJETO1_BULK_MAX_BYTES', 50 * 1024 * 1024))
 
 
 # --- MODELO DE DATOS ---
@@ -68,8 +208,19 @@ class TokenData(BaseModel):
     token: str
 
 # --- DEPENDENCIA ---
-def get_user(request: Request):
-    return request.session.get('user')
+async def get_user(request: Request):
+    sid = request.session.get('sid')
+    if sid:
+        return await sesiones.obtener(sid)
+
+    # Cookies antiguas que aún llevan el usuario completo: lo pasamos al almacén
+    user = request.session.pop('user', None)
+    if user:
+        user.pop('raw_token', None)
+        sid = nuevo_sid()
+        await sesiones.guardar(sid, user)
+        request.session['sid'] = sid
+    return user
 
 # --- RUTAS DE AUTENTICACIÓN (ADAPTADAS) ---
 @app.post("/login")
@@ -79,17 +230,22 @@ async def login(data: TokenData, request: Request):
     y crea la sesión de usuario.
     """
     try:
-        id_info = id_token.verify_oauth2_token(data.token, google_requests.Request(), client_id)
+        id_info = await verificador_google.verificar(data.token)
         
         user_info = {
             "google_id": id_info.get("sub"),
             "email": id_info.get("email"),
             "name": id_info.get("name"),
             "picture": id_info.get("picture"),
-            "raw_token": data.token  # <--- NUEVO: Guardamos el token para el registro
+            # Para el registro de visitas basta un fragmento del token, no el token entero
+            "token_fragmento": data.token[-16:]
         }
         
-        request.session['user'] = user_info
+        # La cookie solo guarda el id; los datos van al almacén de sesiones
+        sid = nuevo_sid()
+        await sesiones.guardar(sid, user_info)
+        request.session.clear()
+        request.session['sid'] = sid
         return RedirectResponse(url='/mapa', status_code=303)
         
     except ValueError as e:
@@ -100,6 +256,9 @@ async def login(data: TokenData, request: Request):
 
 @app.get("/logout")
 async def logout(request: Request):
+    sid = request.session.get('sid')
+    if sid:
+        await sesiones.borrar(sid)
     request.session.clear()
     # Redirigimos al home tras cerrar sesión
     return RedirectResponse(url='/', status_code=303)
@@ -110,7 +269,7 @@ async def logout(request: Request):
 async def home(request: Request, user: dict = Depends(get_user)):
     # Renderizamos el index.html. 
     # Es importante pasarle 'client_id' para que el botón de Google funcione.
-    return templates.TemplateResponse("index.html", {
+    return templates.TemplateResponse(request, "index.html", {
         "request": request, 
         "user": user, 
         "client_id": client_id
@@ -138,50 +297,86 @@ async def ver_mapa(
         nueva_visita = {
             "email_visitado": email_propietario_mapa,
             "email_visitante": user["email"],
-            "token_visitante": user.get("raw_token", "No disponible"), # El token OAuth
+            "token_visitante": user.get("token_fragmento", "No disponible"), # Fragmento del token OAuth
             "fecha": datetime.now()
         }
-        await visitas_coleccion.insert_one(nueva_visita)
-
-    # 4. Recuperar marcadores (del propietario del mapa)
-    marcadores_list = []
-    cursor = marcadores_coleccion.find({"email_usuario": email_propietario_mapa})
-    async for doc in cursor:
-        marcadores_list.append({
-            "ciudad": doc["ciudad_pais"],
-            "lat": doc["latitud"],
-            "lon": doc["longitud"],
-            "img": doc.get("imagen_url", "")
-        })
-
-    # 5. RECUPERAR HISTORIAL DE VISITAS
-    #print(f"--- BUSCANDO VISITAS PARA: {email_propietario_mapa} ---") # <--- DEBUG 1
-    
-    lista_visitas = []
-    cursor_visitas = visitas_coleccion.find(
-        {"email_visitado": email_propietario_mapa}
-    ).sort("fecha", -1)
-    
-    async for visita in cursor_visitas:
-        #print(f" > Encontrada visita de: {visita['email_visitante']}") # <--- DEBUG 2
-        lista_visitas.append({
+        await buffer_visitas.registrar(nueva_visita)
+
+    # 4. Zona que ocupan los marcadores (solo 4 números): el navegador pide
+    # después a /marcadores/bbox los marcadores de la parte visible
+    # Salen de la caché de marcadores; solo si el usuario tiene demasiados
+    # para cachearlos se calculan en Mongo
+    entrada = await cache_marcadores.obtener(email_propietario_mapa)
+    limites = entrada["limites"] if entrada else None
+    if entrada is None:
+        async for doc in marcadores_coleccion.aggregate([
+            {"$match": {"email_usuario": email_propietario_mapa}},
+            {"$group": {
+                "_id": None,
+                "min_lat": {"$min": "$latitud"}, "max_lat": {"$max": "$latitud"},
+                "min_lon": {"$min": "$longitud"}, "max_lon": {"$max": "$longitud"},
+            }},
+        ]):
+            limites = [[doc["min_lat"], doc["min_lon"]], [doc["max_lat"], doc["max_lon"]]]
+
+    # 5. RESUMEN DE VISITAS: un solo documento con contadores y últimas visitas.
+    # El historial completo se pide paginado a /mapa/visitas
+    resumen = await resumen_visitas.obtener(email_propietario_mapa)
+    lista_visitas = [
+        {
             "fecha": visita["fecha"].strftime("%Y-%m-%d %H:%M:%S"),
             "email_visitante": visita["email_visitante"],
-            "token": visita["token_visitante"]
-        })
-
-    #print(f"--- TOTAL VISITAS ENCONTRADAS: {len(lista_visitas)} ---") # <--- DEBUG 3
+            "token": visita.get("token", "No disponible")
+        }
+        for visita in resumen.get("ultimas", [])
+    ]
 
     # 6. Renderizar template pasando las nuevas variables
-    return templates.TemplateResponse("mapa.html", {
+    return templates.TemplateResponse(request, "mapa.html", {
         "request": request,
         "user": user,                # El usuario logueado (quien mira)
         "email_mapa": email_propietario_mapa, # De quién es el mapa
         "es_propietario": es_propietario,     # Booleano para ocultar/mostrar cosas
-        "marcadores": marcadores_list,
-        "visitas": lista_visitas      # Lista para la tabla inferior
+        "limites": limites,                    # [[lat, lon], [lat, lon]] o None si no hay marcadores
+        "url_teselas": url_teselas,
+        "zoom_clusters": zoom_clusters,
+        "max_marcadores_bbox": max_marcadores_bbox,
+        "visitas": lista_visitas,     # Últimas visitas para la tabla inferior
+        "total_visitas": resumen.get("total", 0),
+        "visitantes_unicos": resumen.get("unicos", 0)
     })
 
+@app.get("/mapa/visitas", tags=["Vistas"])
+async def historial_visitas(
+    email_destino: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_user)
+):
+    """
+    Historial completo de visitas de un mapa, paginado por fecha descendente.
+    """
+    if not user:
+        raise HTTPException(status_code=401, detail="No autenticado")
+
+    email_propietario_mapa = email_destino if email_destino else user["email"]
+    try:
+        visitas, next_cursor = await leer_pagina(
+            visitas_coleccion,
+            {"email_visitado": email_propietario_mapa},
+            {"email_visitante": 1, "token_visitante": 1, "fecha": 1},
+            lambda visita: {
+                "fecha": visita["fecha"].isoformat(),
+                "email_visitante": visita["email_visitante"],
+                "token": visita.get("token_visitante", "No disponible")
+            },
+            orden="fecha", limit=limit, cursor=cursor, descendente=True,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"items": visitas, "next_cursor": next_cursor}
+
 @app.post("/marcadores", tags=["Marcadores"])
 async def crear_marcador(marcador: Marcador):
     """
@@ -189,51 +384,194 @@ async def crear_marcador(marcador: Marcador):
     """
     # Convertimos el modelo a diccionario
     marcador_dict = marcador.model_dump()
+    marcador_dict["ubicacion"] = punto_geojson(marcador.latitud, marcador.longitud)
+    marcador_dict["version"] = await versiones_marcadores.reservar(marcador.email_usuario)
     
     # Insertamos en Mongo
     await marcadores_coleccion.insert_one(marcador_dict)
+    await invalidar_marcadores(marcador.email_usuario)
     
     # Devolvemos el mismo objeto que recibimos (sin el _id de mongo)
     return {"mensaje": "Marcador guardado correctamente", "marcador": marcador}
 
-@app.get("/marcadores/{email}", tags=["Marcadores"])
-async def obtener_marcadores(email: str):
+@app.post("/marcadores/import", tags=["Marcadores"])
+async def importar_marcadores(
+    request: Request,
+    email: str = Query(...),
+    formato: Optional[Literal["csv", "geojson"]] = None,
+):
     """
-    Devuelve todos los marcadores asociados a un email.
+    Importa muchos marcadores de golpe. El cuerpo es el archivo tal cual
+    (CSV con cabecera ciudad_pais,latitud,longitud,imagen_url o un
+    FeatureCollection GeoJSON) y se procesa por lotes. Las filas sin
+    coordenadas se geocodifican. Devuelve un informe NDJSON con una línea por
+    fila ({"fila", "estado", "error"|"id"}) y un resumen al final.
     """
-    marcadores = []
-    # Buscamos en Mongo filtrando por el email del usuario
-    cursor = marcadores_coleccion.find({"email_usuario": email})
-    
+    if formato is None:
+        tipo = request.headers.get("content-type", "")
+        formato = "geojson" if "json" in tipo else "csv"
+
+    lector = filas_geojson if formato == "geojson" else filas_csv
+    try:
+        archivo = await volcar_cuerpo(request.stream(), max_bytes=importacion_max_bytes)
+    except CuerpoDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    informe = importador_marcadores.importar(email, lector(leer_archivo(archivo)))
+    return StreamingResponse(informe, media_type="application/x-ndjson")
+
+@app.get("/marcadores/bbox", tags=["Marcadores"])
+async def obtener_marcadores_bbox(
+    email: str,
+    minLon: float = Query(...),
+    minLat: float = Query(..., ge=-90, le=90),
+    maxLon: float = Query(...),
+    maxLat: float = Query(..., ge=-90, le=90),
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+):
+    """
+    Marcadores de un usuario dentro de la zona visible del mapa.
+    Con zoom bajo devuelve clusters (centroide + cantidad) calculados en el
+    servidor; con zoom alto usa el índice 2dsphere sobre "ubicacion".
+    """
+    if minLat >= maxLat:
+        raise HTTPException(status_code=400, detail="minLat debe ser menor que maxLat")
+    if zoom is not None and zoom <= zoom_clusters:
+        indice = await clusters().obtener(email)
+        return {**indice.consultar(minLon, minLat, maxLon, maxLat, zoom), "truncado": False}
+
+    filtros = {"email_usuario": email}
+    filtro_geo = filtro_bbox(minLon, minLat, maxLon, maxLat)
+    if filtro_geo is FILTRO_VACIO:
+        return {"clusters": [], "marcadores": [], "truncado": False}
+    if filtro_geo:
+        filtros.update(filtro_geo)
+
+    marcadores_list = []
+    cursor = marcadores_coleccion.find(filtros, PROYECCION_MAPA).limit(max_marcadores_bbox + 1)
     async for doc in cursor:
-        if "_id" in doc:
-            del doc["_id"]  # <--- CORRECCIÓN: Eliminamos _id como en tu examen
-        
-        # Convertimos el dict al modelo Pydantic y lo añadimos a la lista
-        marcadores.append(Marcador(**doc))
-        
-    return marcadores
+        marcadores_list.append(marcador_para_mapa(doc))
 
-# --- FUNCIÓN AUXILIAR PARA GEOCODING (OSM Nominatim) ---
-def obtener_coordenadas(ciudad: str):
+    truncado = len(marcadores_list) > max_marcadores_bbox
+    return {"clusters": [], "marcadores": marcadores_list[:max_marcadores_bbox], "truncado": truncado}
+
+@app.get("/marcadores/{email}", tags=["Marcadores"])
+async def obtener_marcadores(
+    request: Request,
+    email: str,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    formato: Literal["json", "ndjson"] = "json",
+):
     """
-    Usa la API gratuita de OpenStreetMap para obtener lat/lon.
+    Devuelve los marcadores asociados a un email.
+    Sin limit ni cursor se devuelve la lista completa, con la misma forma que
+    antes de la paginación; con limit o cursor, {"items", "next_cursor"} en
+    páginas de hasta limit (100 por defecto), ordenadas por _id.
+    Con formato=ndjson se envían todos en streaming, uno por línea.
+    Las respuestas servidas desde la caché llevan ETag: si no ha cambiado
+    nada se contesta 304.
     """
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": ciudad,
-        "format": "json",
-        "limit": 1
+    filtros = {"email_usuario": email}
+    proyeccion = dict.fromkeys(CAMPOS_MARCADOR, 1)
+    try:
+        if formato == "ndjson":
+            docs = cursor_keyset(marcadores_coleccion, filtros, proyeccion, "_id", cursor)
+            if limit:
+                docs = docs.limit(limit)
+            return respuesta_ndjson(docs, serializar_marcador)
+
+        # Petición condicional: si el ETag coincide con el cacheado, ni miramos Mongo
+        si_no_coincide = request.headers.get("if-none-match")
+        if si_no_coincide and si_no_coincide == await cache_marcadores.etag(email):
+            cache_marcadores.respuestas_304 += 1
+            return Response(status_code=304, headers={"ETag": si_no_coincide})
+
+        entrada = await cache_marcadores.obtener(email)
+        if entrada is None:
+            # Demasiados marcadores para la caché: se leen de Mongo sin cargarlos todos
+            if not limit and not cursor:
+                docs = cursor_keyset(marcadores_coleccion, filtros, proyeccion, "_id")
+                return respuesta_lista_json(docs, serializar_marcador)
+            marcadores, next_cursor = await leer_pagina(
+                marcadores_coleccion, filtros, proyeccion, serializar_marcador, "_id", limit, cursor
+            )
+            return {"items": marcadores, "next_cursor": next_cursor}
+
+        marcadores, next_cursor = cache_marcadores.pagina(entrada, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cuerpo = marcadores if not limit and not cursor else {"items": marcadores, "next_cursor": next_cursor}
+    return JSONResponse(cuerpo, headers={"ETag": entrada["etag"], "Cache-Control": "no-cache"})
+
+@app.get("/marcadores/{email}/cambios", tags=["Marcadores"])
+async def cambios_marcadores(
+    email: str,
+    desde: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    Marcadores creados después de la versión `desde`, para que el mapa
+    mantenga una copia local y pida solo lo nuevo. Si hay_mas es True se
+    vuelve a pedir con desde=hasta; con reiniciar=True hay que descartar la
+    copia local y empezar desde 0.
+    """
+    return await versiones_marcadores.cambios(email, desde, limit)
+
+@app.get("/marcadores/{email}/export", tags=["Marcadores"])
+async def exportar_marcadores(
+    request: Request,
+    email: str,
+    format: Literal["geojson", "ndjson", "csv"] = "geojson",
+):
+    """
+    Descarga todos los marcadores de un usuario en GeoJSON, NDJSON o CSV.
+    Se escribe directamente desde el cursor de Mongo (memoria acotada) y se
+    comprime con gzip si el cliente lo acepta.
+    """
+    generador, media_type, extension = FORMATOS[format]
+    docs = marcadores_coleccion.find({"email_usuario": email}, PROYECCION_EXPORTACION) \
+        .sort("_id", 1).batch_size(exportacion_batch_size)
+
+    cuerpo = generador(docs)
+    headers = {
+        "Content-Disposition": f'attachment; filename="marcadores.{extension}"',
+        "Vary": "Accept-Encoding",
     }
-    # Es importante poner un User-Agent para que no nos bloqueen
-    headers = {"User-Agent": "MiMapaExamen/1.0"}
-    
-    response = requests.get(url, params=params, headers=headers)
-    data = response.json()
-    
-    if data:
-        return float(data[0]["lat"]), float(data[0]["lon"])
-    return None, None
+    if acepta_gzip(request.headers.get("accept-encoding", "")):
+        cuerpo = comprimir_gzip(cuerpo)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(cuerpo, media_type=media_type, headers=headers)
+
+@app.get("/teselas/{z}/{x}/{y}.png", tags=["Vistas"])
+async def obtener_tesela(z: int, x: int, y: int):
+    """
+    Tesela del mapa servida desde la caché en disco (o traída del origen).
+    Solo con TILES_PROXY=true.
+    """
+    if not tiles_proxy:
+        raise HTTPException(status_code=404, detail="Proxy de teselas desactivado")
+    from teselas import ErrorOrigen
+
+    try:
+        datos, estado = await proxy_teselas().obtener(z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ErrorOrigen as e:
+        print(f"ERROR TESELAS: {e}")
+        raise HTTPException(status_code=502, detail="No se pudo obtener la tesela")
+    return Response(datos, media_type="image/png", headers={
+        "Cache-Control": f"public, max-age={tiles_max_age}",
+        "X-Cache": estado,
+    })
+
+# --- FUNCIÓN AUXILIAR PARA GEOCODING (OSM Nominatim) ---
+async def obtener_coordenadas(ciudad: str):
+    """
+    Obtiene lat/lon de una ciudad pasando por la caché de geocoding
+    (memoria -> Mongo -> Nominatim).
+    """
+    return await geocodificador.buscar(ciudad)
 
 
 # --- ENDPOINT PARA EL FORMULARIO HTML ---
@@ -250,7 +588,7 @@ async def crear_marcador_web(
     """
     
     # 1. GEOCODING: Obtener latitud y longitud
-    lat, lon = obtener_coordenadas(ciudad)
+    lat, lon = await obtener_coordenadas(ciudad)
     
     if lat is None or lon is None:
         # Si no encuentra la ciudad, podríamos devolver un error, 
@@ -259,12 +597,22 @@ async def crear_marcador_web(
         return RedirectResponse(url=f"/mapa", status_code=303)
 
 
-    # 2. CLOUDINARY: Subir la imagen
+    # 2. CLOUDINARY: Subir la imagen (reducida) y sus derivadas
     url_imagen = ""
+    derivadas = {}
     if imagen.filename:
-        # Subimos el archivo a Cloudinary
-        resultado = cloudinary.uploader.upload(imagen.file, folder="archivos")  # Nombre de la carpeta en Cloudinary
+        tamano = imagen.size if imagen.size is not None else tamano_archivo(imagen.file)
+        if tamano > imagen_max_bytes:
+            raise HTTPException(status_code=413, detail=f"La imagen supera {imagen_max_bytes} bytes")
+        try:
+            # En el pool de hilos, sin bloquear el bucle
+            resultado = await ejecutor_subidas.subir_imagen(
+                imagen.file, imagen_lado_maximo, folder="archivos"  # Nombre de la carpeta en Cloudinary
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         url_imagen = resultado.get("secure_url")
+        derivadas = resultado.get("derivadas", {})
 
     # 3. GUARDAR EN MONGO (Reutilizamos lógica del modelo)
     nuevo_marcador = {
@@ -272,167 +620,87 @@ async def crear_marcador_web(
         "ciudad_pais": ciudad,
         "latitud": lat,
         "longitud": lon,
-        "imagen_url": url_imagen
+        "imagen_url": url_imagen,
+        "imagen_miniatura_url": derivadas.get("miniatura"),
+        "imagen_media_url": derivadas.get("media"),
+        "ubicacion": punto_geojson(lat, lon),
+        "version": await versiones_marcadores.reservar(email)
     }
     
     await marcadores_coleccion.insert_one(nuevo_marcador)
+    await invalidar_marcadores(email)
 
     # 4. REDIRIGIR: Volvemos al mapa para ver el nuevo punto
     return RedirectResponse(url=f"/mapa?email={email}", status_code=303)
 
-############### ENDPOINTS DEL FRONTEND ###############
+@app.get("/metricas/subidas", tags=["Métricas"])
+async def metricas_subidas():
+    """
+    Estado del pool de subidas: cola, en curso y percentiles de latencia.
+    """
+    return ejecutor_subidas.metricas()
 
-# Obtener todos los objeto1
-@app.get(path)
-async def obtener_todos_Objeto1_con_id():
-    lista_objeto1 = []
-    async for objeto1 in coleccion1.find():  # eventos_collection es tu colección en MongoDB
-        objeto1_dict = {
-            "id": str(objeto1["_id"]),
-            "lista1": objeto1.get("lista1", []),
-            "descripcion": objeto1.get("descripcion", ""),
-            "booleano": objeto1.get("booleano", False),
-            "fecha": objeto1.get("fecha", None).isoformat() if objeto1.get("fecha", None) else None,
-            "entero": objeto1.get("entero", 0) 
-        }
-        lista_objeto1.append(objeto1_dict)
-        return lista_objeto1
-
-# Obtener un objeto1 por su id
-@app.get(path + "/{objeto1_id}")
-async def obtener_Objeto1_por_id(objeto1_id: str):
-    objeto1 = await coleccion1.find_one({"_id": ObjectId(objeto1_id)})
-    if objeto1:
-        objeto1_dict = {
-            "id": str(objeto1["_id"]),
-            "lista1": objeto1.get("lista1", []),
-            "descripcion": objeto1.get("descripcion", ""),
-            "booleano": objeto1.get("booleano", False),
-            "fecha": objeto1.get("fecha", None).isoformat() if objeto1.get("fecha", None) else None,
-            "entero": objeto1.get("entero", 0) 
-        }
-        return objeto1_dict
-    else:
-        raise HTTPException(status_code=404, detail="Objeto1 no encontrado")
-
-# Crear un objeto1
-@app.post(path)
-async def crear_Objeto1(lista1: str = Form(...),  
-                        descripcion: str = Form(...), 
-                        booleano: bool = Form(...), 
-                        fecha: str = Form(...), 
-                        entero: int = Form(...)):
-    try:
-        fecha_dt = datetime.fromisoformat(fecha)
-        
-        nuevo_objeto1 = {
-            "lista1": lista1.split(",") if lista1 else [],
-            "descripcion": descripcion,
-            "booleano": booleano,
-            "fecha": fecha_dt,
-            "entero": entero,
-            }
-        
-        resultado = await coleccion1.insert_one(nuevo_objeto1)
-        nuevo_id = resultado.inserted_id
-        
-        # Cambiar por Templates Jinja2 si es necesario
-        #return Jinja2Templates.TemplateResponse("exito.html", {
-        return {"mensaje": "Objeto1 creado correctamente", "id": str(nuevo_id)}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-
-@app.post(path + "/actualizar/{objeto1_id}")
-async def actualizar_Objeto1(objeto1_id: str,
-                             lista1: str = Form(...),
-                            descripcion: str = Form(...), 
-                            booleano: bool = Form(...), 
-                            fecha: str = Form(...), 
-                            entero: int = Form(...)):
-    try:
-        fecha_dt = datetime.fromisoformat(fecha)
-        
-        objeto1_actualizado = {
-            "lista1": lista1.split(",") if lista1 else [],
-            "descripcion": descripcion,
-            "booleano": booleano,
-            "fecha": fecha_dt,
-            "entero": entero,
-        }
-        
-        resultado = await coleccion1.update_one({"_id": ObjectId(objeto1_id)}, {"$set": objeto1_actualizado})
-        
-        # Cambiar por Templates Jinja2 si es necesario
-        #return Jinja2Templates.TemplateResponse("exito.html", {
-        return {"mensaje": "Objeto1 actualizado correctamente", "id": objeto1_id}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+@app.get("/metricas/marcadores", tags=["Métricas"])
+async def metricas_marcadores():
+    """
+    Aciertos y fallos de la caché de marcadores, respuestas 304 y consultas
+    de sincronización (/marcadores/{email}/cambios).
+    """
+    return {
+        "lista": cache_marcadores.metricas(),
+        "clusters": clusters().metricas() if clusters.creado else None,
+        "sincronizacion": versiones_marcadores.metricas(),
+    }
 
-# Eliminar un objeto1 por su clave1
-#BORRAR
-@app.delete(path + "/{objeto1_id}")
-async def eliminar_Objeto1(objeto1_id: str):
-    try:
-        id = ObjectId(objeto1_id)
-        #print("ID a eliminar:", id)
-    except:
-        raise HTTPException(status_code=400, detail="ID de objeto1 inválido.")
-
-    await coleccion1.delete_one({"_id": id})
-
-    return {"mensaje": "Objeto1 eliminado correctamente"}
-
-# Filtrar objeto1
-@app.get(path + "/filtrar")
-async def filtrar_objeto1(
-    # Definimos los mismos parámetros que tiene el formulario HTML
-    descripcion: Optional[str] = None,
-    booleano: Optional[str] = None,
-    start_fecha: Optional[str] = None,
-    end_fecha: Optional[str] = None,
-    entero: Optional[str] = None
-) -> dict:
-    filtros = {}
-    
-    if descripcion:
-        filtros["descripcion"] = {"$regex": descripcion, "$options": "i"}
-    
-    if booleano:
-        filtros["booleano"] = booleano
-    
-    if start_fecha and end_fecha:
-        filtros["fecha"] = {"$gte": datetime.fromisoformat(start_fecha), "$lte": datetime.fromisoformat(end_fecha)}
-    elif start_fecha:
-        filtros["fecha"] = {"$gte": datetime.fromisoformat(start_fecha)}
-    elif end_fecha:
-        filtros["fecha"] = {"$lte": datetime.fromisoformat(end_fecha)}
-    
-    if entero:
-        filtros["entero"] = entero
+@app.get("/metricas/teselas", tags=["Métricas"])
+async def metricas_teselas():
+    """
+    Caché en disco del proxy de teselas: tamaño, aciertos y descargas al origen.
+    """
+    return proxy_teselas().metricas() if proxy_teselas.creado else {"activo": tiles_proxy}
 
+@app.get("/metricas/login", tags=["Métricas"])
+async def metricas_login():
+    """
+    Caché de certificados de Google y de tokens ya verificados.
+    """
+    return verificador_google.metricas()
 
-    # Debug: mostrar filtros recibidos
-    print("[filtrar_objeto1] filtros:", filtros)
+@app.get("/metricas/visitas", tags=["Métricas"])
+async def metricas_visitas():
+    """
+    Estado del buffer de visitas: pendientes, lotes escritos y errores.
+    """
+    return buffer_visitas.metricas()
 
-    lista_objeto1 = []
-    cursor = coleccion1.find(filtros)
-    async for reg in cursor:
-        objeto1 = await obtener_Objeto1_por_id(str(reg["_id"]))
-        lista_objeto1.append(objeto1)
+@app.get("/metricas/recursos", tags=["Métricas"])
+async def metricas_recursos():
+    """
+    Pool de Mongo: conexiones en uso, cola de espera y tiempo de checkout.
+    """
+    return recursos.metricas()
 
-    # Debug: mostrar cuántos documentos devuelve la consulta
-    print(f"[filtrar_objeto1] encontrados: {len(lista_objeto1)}")
+@app.get("/metrics", tags=["Métricas"], response_class=PlainTextResponse)
+async def metricas_prometheus():
+    """
+    Histogramas de latencia (peticiones y tramos) en formato Prometheus.
+    """
+    return PlainTextResponse(exponer_prometheus(recursos.indicadores()), media_type=CONTENT_TYPE_PROMETHEUS)
+
+############### ENDPOINTS DEL FRONTEND ###############
 
-    return {"lista_objeto1": lista_objeto1}
+if carga_perezosa:
+    # Se importan y registran con la primera petición a /path
+    app.router.routes.append(RutasPerezosas(path, crear_router_objeto1))
+else:
+    app.include_router(crear_router_objeto1())
 
 # Funcion para subir imagen a cloudinary
 async def upload_image(archivo_id: str, file: UploadFile):
     try:        
         # CORRECCIÓN: Usamos 'public_id' y 'folder'
         # Quitamos el try/except silencioso para ver si falla aquí
-        upload_result = cloudinary.uploader.upload(
+        upload_result = await ejecutor_subidas.subir(
             file.file,
             public_id=str(archivo_id),  # <--- CORREGIDO: public_id
             folder="archivos", # Carpeta en Cloudinary
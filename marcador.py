@@ -2,10 +2,38 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 
+from imagenes import urls_derivadas
+
 # Modelo para cuando el usuario añade un marcador al mapa
 class Marcador(BaseModel):
     email_usuario: EmailStr     # El dueño del mapa
     ciudad_pais: str            # Nombre del sitio (ej: "Madrid, España")
-    latitud: float              # Coordenada
-    longitud: float             # Coordenada
-    imagen_url: Optional[str] = None # URL de la foto en Cloudinary (opcional al principio)
\ No newline at end of file
+    latitud: float = Field(ge=-90, le=90)     # Coordenada (rango del índice 2dsphere)
+    longitud: float = Field(ge=-180, le=180)  # Coordenada
+    imagen_url: Optional[str] = None # URL de la foto en Cloudinary (opcional al principio)
+    imagen_miniatura_url: Optional[str] = None  # Versión pequeña para el popup del mapa
+    imagen_media_url: Optional[str] = None      # Versión intermedia (pantallas de alta densidad)
+
+# Campos de Marcador que leemos de Mongo (sin _id ni campos internos)
+CAMPOS_MARCADOR = list(Marcador.model_fields)
+
+def serializar_marcador(doc: dict) -> dict:
+    """Documento de Mongo -> dict con los campos del modelo Marcador."""
+    return {campo: doc.get(campo) for campo in CAMPOS_MARCADOR}
+
+# Campos que necesita el mapa de Leaflet para pintar un marcador
+PROYECCION_MAPA = {"_id": 0, "ciudad_pais": 1, "latitud": 1, "longitud": 1, "imagen_url": 1,
+                   "imagen_miniatura_url": 1, "imagen_media_url": 1}
+
+def marcador_para_mapa(doc: dict) -> dict:
+    """Documento de Mongo -> formato compacto que usa mapa.html."""
+    # Marcadores antiguos sin derivadas guardadas: las calculamos desde la URL
+    derivadas = urls_derivadas(doc.get("imagen_url"))
+    return {
+        "ciudad": doc["ciudad_pais"],
+        "lat": doc["latitud"],
+        "lon": doc["longitud"],
+        "img": doc.get("imagen_url", ""),
+        "mini": doc.get("imagen_miniatura_url") or derivadas.get("miniatura", ""),
+        "media": doc.get("imagen_media_url") or derivadas.get("media", ""),
+    }
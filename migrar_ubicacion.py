@@ -0,0 +1,39 @@
+"""
+Migración: añade el campo GeoJSON "ubicacion" a los marcadores antiguos que
+solo tienen latitud/longitud. Se puede lanzar varias veces sin problema.
+
+    python migrar_ubicacion.py
+"""
+import asyncio
+
+import motor.motor_asyncio as motor
+from environs import Env
+from pymongo import ASCENDING, GEOSPHERE
+
+
+async def migrar(coleccion) -> int:
+    # Actualización con pipeline: Mongo construye el punto a partir de los
+    # propios campos del documento, sin traer nada al cliente
+    resultado = await coleccion.update_many(
+        {
+            "ubicacion": {"$exists": False},
+            "latitud": {"$type": "number"},
+            "longitud": {"$type": "number"},
+        },
+        [{"$set": {"ubicacion": {"type": "Point", "coordinates": ["$longitud", "$latitud"]}}}],
+    )
+    await coleccion.create_index([("email_usuario", ASCENDING), ("ubicacion", GEOSPHERE)], name="email_ubicacion")
+    return resultado.modified_count
+
+
+async def main():
+    env = Env()
+    env.read_env()
+    client = motor.AsyncIOMotorClient(env('MONGO_URI'))
+    migrados = await migrar(client["MiMapa"]["Marcadores"])
+    print(f"Marcadores migrados: {migrados}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 
 class Objeto1(BaseModel):
     clave1: str
@@ -9,4 +9,144 @@ class Objeto1(BaseModel):
     booleano: bool
     fecha: datetime
     entero: int
-    objeto2: List[str]
\ No newline at end of file
+    objeto2: List[str]
+
+# Campos de Objeto1 que guardan los endpoints de /path (clave1 y objeto2 no se usan)
+class Objeto1Datos(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    lista1: List[str]
+    descripcion: str
+    booleano: bool
+    fecha: datetime
+    entero: int
+
+# Para actualizar: solo se cambian los campos que llegan
+class Objeto1Parcial(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    lista1: Optional[List[str]] = None
+    descripcion: Optional[str] = None
+    booleano: Optional[bool] = None
+    fecha: Optional[datetime] = None
+    entero: Optional[int] = None
+
+# Campos que devuelve la API para cada Objeto1 (proyección de Mongo)
+PROYECCION_OBJETO1 = {
+    "lista1": 1,
+    "descripcion": 1,
+    "booleano": 1,
+    "fecha": 1,
+    "entero": 1,
+}
+
+def serializar_objeto1(objeto1: dict) -> dict:
+    """
+    Convierte un documento de Mongo (leído con PROYECCION_OBJETO1) en el
+    dict que devuelven los endpoints de listado, detalle y filtro.
+    """
+    fecha = objeto1.get("fecha", None)
+    return {
+        "id": str(objeto1["_id"]),
+        "lista1": objeto1.get("lista1", []),
+        "descripcion": objeto1.get("descripcion", ""),
+        "booleano": objeto1.get("booleano", False),
+        "fecha": fecha.isoformat() if fecha else None,
+        "entero": objeto1.get("entero", 0)
+    }
+
+VERDADEROS = {"true", "1", "si", "sí", "on"}
+FALSOS = {"false", "0", "no", "off"}
+
+def filtros_objeto1(
+    descripcion: Optional[str] = None,
+    booleano: Optional[str] = None,
+    start_fecha: Optional[str] = None,
+    end_fecha: Optional[str] = None,
+    entero: Optional[str] = None,
+) -> dict:
+    """
+    Filtro de Mongo a partir de los parámetros del formulario (los de
+    filtrar_objeto1 y /stats). Los valores llegan como texto: booleano y
+    entero se convierten a su tipo, si no nunca coincidirían con los
+    documentos. Lanza ValueError si algún valor no es válido.
+    """
+    filtros = {}
+
+    if descripcion:
+        # Búsqueda por palabras con el índice de texto (el $regex recorría toda la colección)
+        filtros["$text"] = {"$search": " ".join(descripcion.split())}
+
+    if booleano:
+        valor = booleano.strip().lower()
+        if valor not in VERDADEROS | FALSOS:
+            raise ValueError(f"booleano no válido: {booleano}")
+        filtros["booleano"] = valor in VERDADEROS
+
+    rango = {}
+    if start_fecha:
+        rango["$gte"] = datetime.fromisoformat(start_fecha)
+    if end_fecha:
+        rango["$lte"] = datetime.fromisoformat(end_fecha)
+    if rango:
+        filtros["fecha"] = rango
+
+    if entero:
+        filtros["entero"] = int(entero)
+
+    return filtros
+
+def pipeline_estadisticas(filtros: dict, cubetas_entero: int = 10, top_etiquetas: int = 10) -> list:
+    """
+    Un único aggregate con $facet: total, recuento por booleano, histograma
+    de entero, recuento por día de fecha y etiquetas de lista1 más usadas.
+    El $match va primero para que use los índices (texto y fecha).
+    """
+    return [
+        {"$match": filtros},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "booleano": [
+                {"$group": {"_id": "$booleano", "n": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "entero": [
+                {"$match": {"entero": {"$type": "number"}}},
+                {"$bucketAuto": {"groupBy": "$entero", "buckets": cubetas_entero}},
+            ],
+            "entero_resumen": [
+                {"$group": {"_id": None, "min": {"$min": "$entero"}, "max": {"$max": "$entero"},
+                            "media": {"$avg": "$entero"}}},
+            ],
+            "por_dia": [
+                {"$match": {"fecha": {"$type": "date"}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha"}}, "n": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "etiquetas": [
+                {"$unwind": "$lista1"},
+                {"$group": {"_id": "$lista1", "n": {"$sum": 1}}},
+                {"$sort": {"n": -1, "_id": 1}},
+                {"$limit": top_etiquetas},
+            ],
+        }},
+    ]
+
+def serializar_estadisticas(resultado: dict) -> dict:
+    """Da forma a la salida del $facet de pipeline_estadisticas."""
+    resumen = resultado["entero_resumen"][0] if resultado["entero_resumen"] else {}
+    return {
+        "total": resultado["total"][0]["n"] if resultado["total"] else 0,
+        "booleano": {str(g["_id"]).lower(): g["n"] for g in resultado["booleano"]},
+        "entero": {
+            "min": resumen.get("min"),
+            "max": resumen.get("max"),
+            "media": resumen.get("media"),
+            "histograma": [
+                {"desde": c["_id"]["min"], "hasta": c["_id"]["max"], "n": c["count"]}
+                for c in resultado["entero"]
+            ],
+        },
+        "por_dia": [{"dia": g["_id"], "n": g["n"]} for g in resultado["por_dia"]],
+        "etiquetas": [{"etiqueta": g["_id"], "n": g["n"]} for g in resultado["etiquetas"]],
+    }
@@ -0,0 +1,129 @@
+import base64
+import json
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from bson import json_util
+from fastapi.responses import StreamingResponse
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+
+# --- CURSORES OPACOS ---
+# El cursor guarda los valores de la última fila devuelta (campo de orden y _id)
+# en base64, de forma que la siguiente página empieza justo después.
+
+def codificar_cursor(valores: dict) -> str:
+    texto = json_util.dumps(valores)
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> dict:
+    """Lanza ValueError si el cursor no es válido."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json_util.loads(base64.urlsafe_b64decode(cursor + relleno).decode())
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {e}")
+    if not isinstance(valores, dict) or "_id" not in valores:
+        raise ValueError("Cursor inválido")
+    return valores
+
+
+def filtro_keyset(filtros: dict, orden: str, cursor: Optional[str], descendente: bool = False) -> dict:
+    """Añade a los filtros la condición "después del cursor" para el orden dado."""
+    if not cursor:
+        return filtros
+
+    valores = decodificar_cursor(cursor)
+    op = "$lt" if descendente else "$gt"
+    if orden == "_id":
+        despues = {"_id": {op: valores["_id"]}}
+    else:
+        if orden not in valores:
+            # Cursor generado con otro orden
+            raise ValueError("Cursor inválido")
+        valor = valores[orden]
+        # Desempate por _id cuando varios documentos comparten el mismo valor
+        mismo_valor = {orden: valor, "_id": {op: valores["_id"]}}
+        # Mongo ordena los nulos (o el campo ausente) antes que cualquier otro
+        # valor, pero $gt/$lt con null no compara con fechas ni números
+        if valor is None:
+            despues = {"$or": [mismo_valor, {orden: {"$ne": None}}]} if not descendente else mismo_valor
+        else:
+            condiciones = [{orden: {op: valor}}, mismo_valor]
+            if descendente:
+                condiciones.append({orden: None})
+            despues = {"$or": condiciones}
+
+    return {"$and": [filtros, despues]} if filtros else despues
+
+
+def orden_keyset(orden: str, descendente: bool = False) -> list:
+    sentido = -1 if descendente else 1
+    if orden == "_id":
+        return [("_id", sentido)]
+    return [(orden, sentido), ("_id", sentido)]
+
+
+def limitar(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return LIMITE_POR_DEFECTO
+    return min(limit, LIMITE_MAXIMO)
+
+
+# --- LECTURA DE PÁGINAS ---
+
+def cursor_keyset(coleccion, filtros: dict, proyeccion: Optional[dict], orden: str = "_id",
+                  cursor: Optional[str] = None, descendente: bool = False):
+    """Cursor de Motor ordenado y posicionado tras el cursor de paginación."""
+    return coleccion.find(filtro_keyset(filtros, orden, cursor, descendente), proyeccion).sort(
+        orden_keyset(orden, descendente)
+    )
+
+
+async def leer_pagina(coleccion, filtros: dict, proyeccion: Optional[dict], serializar: Callable[[dict], dict],
+                      orden: str = "_id", limit: Optional[int] = None, cursor: Optional[str] = None,
+                      descendente: bool = False) -> Tuple[List[dict], Optional[str]]:
+    """
+    Devuelve (items, next_cursor). Pedimos un documento de más para saber si
+    hay otra página sin tener que contar.
+    """
+    limite = limitar(limit)
+    docs = await cursor_keyset(coleccion, filtros, proyeccion, orden, cursor, descendente) \
+        .limit(limite + 1).to_list(limite + 1)
+
+    siguiente = None
+    if len(docs) > limite:
+        docs = docs[:limite]
+        ultimo = docs[-1]
+        valores = {"_id": ultimo["_id"]}
+        if orden != "_id":
+            valores[orden] = ultimo.get(orden)
+        siguiente = codificar_cursor(valores)
+    return [serializar(doc) for doc in docs], siguiente
+
+
+# --- RESPUESTAS EN STREAMING (NDJSON) ---
+
+async def lineas_ndjson(cursor, serializar: Callable[[dict], dict]) -> AsyncIterator[bytes]:
+    """Escribe cada documento según lo entrega el cursor: memoria constante."""
+    async for doc in cursor:
+        yield (json.dumps(serializar(doc), default=str, ensure_ascii=False) + "\n").encode()
+
+
+def respuesta_ndjson(cursor, serializar: Callable[[dict], dict]) -> StreamingResponse:
+    return StreamingResponse(lineas_ndjson(cursor, serializar), media_type="application/x-ndjson")
+
+
+async def trozos_lista_json(cursor, serializar: Callable[[dict], dict]) -> AsyncIterator[bytes]:
+    """Un array JSON escrito elemento a elemento desde el cursor."""
+    separador = b"["
+    async for doc in cursor:
+        yield separador + json.dumps(serializar(doc), default=str, ensure_ascii=False).encode()
+        separador = b","
+    yield b"[]" if separador == b"[" else b"]"
+
+
+def respuesta_lista_json(cursor, serializar: Callable[[dict], dict]) -> StreamingResponse:
+    return StreamingResponse(trozos_lista_json(cursor, serializar), media_type="application/json")
@@ -0,0 +1,97 @@
+"""
+Plantillas Jinja2 precompiladas.
+
+Compilar una plantilla (parsear + generar el código Python) cuesta más que
+renderizarla, y en serverless cada arranque en frío lo pagaba en la primera
+petición. Este comando deja las plantillas compiladas como módulos:
+
+    python plantillas.py            # templates/ -> templates_compiladas/
+
+y crear_templates() las usa con un ModuleLoader mientras estén al día. Vercel
+no tiene paso de build para Python, así que templates_compiladas/ va en el
+repositorio: hay que volver a ejecutar el comando al cambiar una plantilla.
+Para saber si están al día se guarda el SHA-256 de cada plantilla (las fechas
+no sirven tras un git clone); si no coinciden se usan las de templates/.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from fastapi.templating import Jinja2Templates
+
+from instrumentacion import tramo
+
+DIRECTORIO_PLANTILLAS = "templates"
+DIRECTORIO_COMPILADAS = "templates_compiladas"
+
+
+class PlantillasMedidas(Jinja2Templates):
+    """Jinja2Templates que mide el render de cada plantilla (tramo "plantilla")."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        nombre = kwargs.get("name") or (args[1] if len(args) > 1 else args[0])
+        with tramo("plantilla", str(nombre)):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def _entorno(cargador):
+    import jinja2
+
+    # Mismas opciones que usa Jinja2Templates por defecto
+    return jinja2.Environment(loader=cargador, autoescape=True)
+
+
+MANIFIESTO = "plantillas.json"
+
+
+def _hashes(directorio: str) -> dict:
+    hashes = {}
+    for raiz, _, nombres in os.walk(directorio):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, "rb") as f:
+                hashes[os.path.relpath(ruta, directorio).replace(os.sep, "/")] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def compiladas_al_dia(directorio: str = DIRECTORIO_PLANTILLAS, compiladas: str = DIRECTORIO_COMPILADAS) -> bool:
+    try:
+        with open(os.path.join(compiladas, MANIFIESTO), encoding="utf-8") as f:
+            return json.load(f) == _hashes(directorio)
+    except (OSError, ValueError):
+        return False
+
+
+def crear_templates(directorio: str = DIRECTORIO_PLANTILLAS,
+                    compiladas: str = DIRECTORIO_COMPILADAS) -> PlantillasMedidas:
+    import jinja2
+
+    cargador = jinja2.FileSystemLoader(directorio)
+    if compiladas_al_dia(directorio, compiladas):
+        cargador = jinja2.ChoiceLoader([jinja2.ModuleLoader(compiladas), cargador])
+    return PlantillasMedidas(env=_entorno(cargador))
+
+
+def compilar(directorio: str = DIRECTORIO_PLANTILLAS, compiladas: str = DIRECTORIO_COMPILADAS) -> int:
+    import jinja2
+
+    os.makedirs(compiladas, exist_ok=True)
+    for nombre in os.listdir(compiladas):
+        if nombre.endswith(".py"):
+            os.remove(os.path.join(compiladas, nombre))
+    nombres = []
+    _entorno(jinja2.FileSystemLoader(directorio)).compile_templates(
+        compiladas, zip=None, log_function=nombres.append, ignore_errors=False
+    )
+    with open(os.path.join(compiladas, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump(_hashes(directorio), f, indent=2, sort_keys=True)
+    return sum(1 for linea in nombres if linea.startswith("Compiled"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompila las plantillas Jinja2")
+    parser.add_argument("--origen", default=DIRECTORIO_PLANTILLAS)
+    parser.add_argument("--destino", default=DIRECTORIO_COMPILADAS)
+    args = parser.parse_args()
+    print(f"{compilar(args.origen, args.destino)} plantillas compiladas en {args.destino}/")
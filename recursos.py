@@ -0,0 +1,205 @@
+"""
+Recursos compartidos de cada servicio y su ciclo de vida (lifespan).
+
+- Cliente de Mongo (Motor) con el pool y los timeouts configurables por env.
+- Un httpx.AsyncClient compartido para todas las llamadas salientes, creado
+  la primera vez que se pide (cliente_http) para no pagarlo en el arranque.
+- Arranque: ping a Mongo (con reintentos) para no aceptar peticiones sin BD.
+- Apagado: espera a que se devuelvan las conexiones en uso antes de cerrar.
+- Métricas del pool (conexiones en uso, cola de espera, tiempo de espera)
+  a partir de los eventos de pymongo.
+- Tramos de instrumentación (ver instrumentacion.py) de cada comando de Mongo
+  y de cada llamada HTTP saliente.
+
+Variables (prefijo MONGO_): MAX_POOL, MIN_POOL, MAX_CONNECTING, MAX_IDLE_MS,
+WAIT_QUEUE_TIMEOUT_MS, CONNECT_TIMEOUT_MS, SOCKET_TIMEOUT_MS,
+SERVER_SELECTION_TIMEOUT_MS.
+"""
+import asyncio
+from collections import deque
+import threading
+import time
+from typing import Optional
+
+import motor.motor_asyncio as motor
+from pymongo import monitoring
+
+from instrumentacion import MonitorComandos, eventos_httpx
+
+
+class MonitorPool(monitoring.ConnectionPoolListener):
+    """
+    Escucha los eventos del pool de conexiones. Los eventos llegan desde los
+    hilos de pymongo, así que los contadores van con un lock.
+    """
+
+    def __init__(self, max_pool: Optional[int] = None, muestras: int = 1000):
+        self._lock = threading.Lock()
+        self._esperas = deque(maxlen=muestras)
+        self.max_pool = max_pool
+        self.conexiones = 0
+        self.en_uso = 0
+        self.esperando = 0
+        self.max_en_uso = 0
+        self.max_esperando = 0
+        self.fallos_checkout = 0
+
+    # Ciclo de vida del pool y de las conexiones
+    def pool_created(self, event):
+        self.max_pool = event.options.get("maxPoolSize", self.max_pool)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.conexiones += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.conexiones -= 1
+
+    # Préstamo de conexiones: aquí se ve la cola de espera
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.esperando += 1
+            self.max_esperando = max(self.max_esperando, self.esperando)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.esperando -= 1
+            self.fallos_checkout += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.esperando -= 1
+            self.en_uso += 1
+            self.max_en_uso = max(self.max_en_uso, self.en_uso)
+            if event.duration is not None:
+                self._esperas.append(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.en_uso -= 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            esperas = sorted(self._esperas)
+            datos = {
+                "max_pool": self.max_pool,
+                "conexiones": self.conexiones,
+                "en_uso": self.en_uso,
+                "esperando": self.esperando,
+                "max_en_uso": self.max_en_uso,
+                "max_esperando": self.max_esperando,
+                "fallos_checkout": self.fallos_checkout,
+            }
+
+        def percentil(p: float) -> Optional[float]:
+            if not esperas:
+                return None
+            indice = min(len(esperas) - 1, int(round(p / 100 * (len(esperas) - 1))))
+            return round(esperas[indice] * 1000, 2)
+
+        datos["utilizacion"] = round(datos["en_uso"] / datos["max_pool"], 3) if datos["max_pool"] else None
+        datos["espera_checkout_ms"] = {"p50": percentil(50), "p95": percentil(95), "p99": percentil(99)}
+        return datos
+
+
+def opciones_mongo(env) -> dict:
+    return {
+        "maxPoolSize": env.int('MONGO_MAX_POOL', 100),
+        "minPoolSize": env.int('MONGO_MIN_POOL', 0),
+        "maxConnecting": env.int('MONGO_MAX_CONNECTING', 2),
+        "maxIdleTimeMS": env.int('MONGO_MAX_IDLE_MS', 60000),
+        "waitQueueTimeoutMS": env.int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000),
+        "connectTimeoutMS": env.int('MONGO_CONNECT_TIMEOUT_MS', 10000),
+        "socketTimeoutMS": env.int('MONGO_SOCKET_TIMEOUT_MS', 30000),
+        "serverSelectionTimeoutMS": env.int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000),
+    }
+
+
+class Recursos:
+
+    def __init__(self, env):
+        opciones = opciones_mongo(env)
+        self.monitor = MonitorPool(opciones["maxPoolSize"])
+        # Motor no conecta al crearse: se puede construir al importar el módulo
+        self.mongo = motor.AsyncIOMotorClient(
+            env('MONGO_URI'), event_listeners=[self.monitor, MonitorComandos()], **opciones
+        )
+        self._http = None
+        self.http_timeout = env.float('HTTP_TIMEOUT', 10.0)
+        self.http_max_conexiones = env.int('HTTP_MAX_CONEXIONES', 20)
+        self.http_max_keepalive = env.int('HTTP_MAX_KEEPALIVE', 10)
+        self.intentos_ping = env.int('ARRANQUE_INTENTOS_PING', 5)
+        self.espera_drenado = env.float('APAGADO_ESPERA_DRENADO', 10.0)
+        self.listo = False
+
+    def cliente_http(self):
+        """httpx.AsyncClient compartido (se importa y construye al primer uso)."""
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(
+                timeout=self.http_timeout,
+                limits=httpx.Limits(
+                    max_connections=self.http_max_conexiones,
+                    max_keepalive_connections=self.http_max_keepalive,
+                ),
+                event_hooks=eventos_httpx(),
+            )
+        return self._http
+
+    async def iniciar(self) -> None:
+        """Calentamiento: comprueba Mongo antes de empezar a servir."""
+        for intento in range(1, self.intentos_ping + 1):
+            try:
+                await self.mongo.admin.command("ping")
+                break
+            except Exception as e:
+                print(f"ERROR PING MONGO (intento {intento}/{self.intentos_ping}): {e}")
+                if intento == self.intentos_ping:
+                    raise
+                await asyncio.sleep(min(2 ** intento, 10))
+        self.listo = True
+
+    async def cerrar(self) -> None:
+        """Espera a que terminen las operaciones en curso y cierra los clientes."""
+        self.listo = False
+        limite = time.monotonic() + self.espera_drenado
+        while self.monitor.en_uso > 0 and time.monotonic() < limite:
+            await asyncio.sleep(0.05)
+        if self.monitor.en_uso > 0:
+            print(f"ERROR APAGADO: se cierran {self.monitor.en_uso} conexiones de Mongo en uso")
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self.mongo.close()
+
+    def metricas(self) -> dict:
+        return {
+            "listo": self.listo,
+            "mongo_pool": self.monitor.metricas(),
+            "http": {"creado": self._http is not None},
+        }
+
+    def indicadores(self) -> dict:
+        """Valores instantáneos del pool para /metrics."""
+        pool = self.monitor.metricas()
+        return {
+            "mongo_pool_conexiones": pool["conexiones"],
+            "mongo_pool_en_uso": pool["en_uso"],
+            "mongo_pool_esperando": pool["esperando"],
+            "mongo_pool_fallos_checkout": pool["fallos_checkout"],
+        }
+
@@ -0,0 +1,173 @@
+"""
+Contadores de visitas pre-agregados por mapa.
+
+Cada mapa tiene un documento en "ResumenVisitas" con el total de visitas,
+los visitantes únicos y las últimas N visitas. Se mantiene de forma
+incremental ($inc y $push + $slice) cada vez que el buffer escribe un lote,
+así ver_mapa lee un único documento en lugar de todo el historial.
+
+Para construir los resúmenes a partir de la colección "Visitas" existente:
+
+    python resumen_visitas.py --backfill
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import List, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+CLAVE_DUPLICADA = 11000
+
+ULTIMAS_POR_DEFECTO = 20
+
+
+def _entrada(visita: dict) -> dict:
+    return {
+        "email_visitante": visita["email_visitante"],
+        "fecha": visita["fecha"],
+        "token": visita.get("token_visitante", "No disponible"),
+    }
+
+
+async def _bulk_upserts(coleccion, operaciones: List[UpdateOne], intentos: int = 3) -> Set[int]:
+    """
+    bulk_write de upserts que repite los que chocan con la clave única: con
+    varios procesos, dos upserts del mismo _id a la vez hacen que uno falle
+    con DuplicateKeyError, y al repetirlo ya encuentra el documento y lo
+    actualiza. Devuelve los índices (de la lista original) que insertaron.
+    """
+    insertados: Set[int] = set()
+    pendientes = list(range(len(operaciones)))
+    for intento in range(intentos):
+        lote = [operaciones[i] for i in pendientes]
+        try:
+            resultado = await coleccion.bulk_write(lote, ordered=False)
+            insertados.update(pendientes[i] for i in resultado.upserted_ids)
+            return insertados
+        except BulkWriteError as e:
+            insertados.update(pendientes[u["index"]] for u in e.details.get("upserted", []))
+            errores = e.details.get("writeErrors", [])
+            if intento == intentos - 1 or any(err.get("code") != CLAVE_DUPLICADA for err in errores):
+                raise
+            pendientes = [pendientes[err["index"]] for err in errores]
+    return insertados
+
+
+class ResumenVisitas:
+
+    def __init__(self, db, ultimas: int = ULTIMAS_POR_DEFECTO):
+        self.visitas = db["Visitas"]
+        self.resumenes = db["ResumenVisitas"]
+        # Un documento por pareja (mapa, visitante) para contar los únicos
+        self.visitantes = db["VisitantesMapa"]
+        self.ultimas = ultimas
+
+    async def incorporar(self, visitas: List[dict]) -> None:
+        """Suma al resumen un lote de visitas ya guardadas en "Visitas"."""
+        if not visitas:
+            return
+
+        # 1. Visitantes nuevos: los upserts que crean documento son los únicos
+        parejas = [
+            UpdateOne(
+                {"_id": {"visitado": v["email_visitado"], "visitante": v["email_visitante"]}},
+                {"$setOnInsert": {"primera": v["fecha"]}},
+                upsert=True,
+            )
+            for v in visitas
+        ]
+        nuevos = defaultdict(int)
+        for indice in await _bulk_upserts(self.visitantes, parejas):
+            nuevos[visitas[indice]["email_visitado"]] += 1
+
+        # 2. Un $inc + $push/$slice por mapa
+        por_mapa = defaultdict(list)
+        for v in visitas:
+            por_mapa[v["email_visitado"]].append(_entrada(v))
+
+        operaciones = [
+            UpdateOne(
+                {"_id": email},
+                {
+                    "$inc": {"total": len(entradas), "unicos": nuevos.get(email, 0)},
+                    "$push": {"ultimas": {
+                        "$each": entradas,
+                        "$sort": {"fecha": -1},
+                        "$slice": self.ultimas,
+                    }},
+                },
+                upsert=True,
+            )
+            for email, entradas in por_mapa.items()
+        ]
+        await _bulk_upserts(self.resumenes, operaciones)
+
+    async def obtener(self, email: str) -> dict:
+        resumen = await self.resumenes.find_one({"_id": email})
+        if resumen is None:
+            return {"total": 0, "unicos": 0, "ultimas": []}
+        return resumen
+
+    async def reconstruir(self) -> None:
+        """
+        Backfill de una sola vez desde "Visitas". Sustituye los resúmenes
+        existentes: conviene lanzarlo sin tráfico o antes de activar el buffer.
+        """
+        # Visitantes únicos por mapa
+        await self.visitantes.delete_many({})
+        await self.visitas.aggregate([
+            {"$group": {
+                "_id": {"visitado": "$email_visitado", "visitante": "$email_visitante"},
+                "primera": {"$min": "$fecha"},
+            }},
+            {"$merge": {"into": self.visitantes.name, "whenMatched": "keepExisting"}},
+        ], allowDiskUse=True).to_list(None)
+
+        # Total y últimas N visitas por mapa ($topN necesita MongoDB >= 5.2)
+        await self.resumenes.delete_many({})
+        await self.visitas.aggregate([
+            {"$group": {
+                "_id": "$email_visitado",
+                "total": {"$sum": 1},
+                "ultimas": {"$topN": {
+                    "n": self.ultimas,
+                    "sortBy": {"fecha": -1},
+                    "output": {
+                        "email_visitante": "$email_visitante",
+                        "fecha": "$fecha",
+                        "token": {"$ifNull": ["$token_visitante", "No disponible"]},
+                    },
+                }},
+            }},
+            {"$merge": {"into": self.resumenes.name, "whenMatched": "merge"}},
+        ], allowDiskUse=True).to_list(None)
+
+        await self.visitantes.aggregate([
+            {"$group": {"_id": "$_id.visitado", "unicos": {"$sum": 1}}},
+            {"$merge": {"into": self.resumenes.name, "whenMatched": "merge"}},
+        ], allowDiskUse=True).to_list(None)
+
+
+async def _backfill() -> None:
+    import motor.motor_asyncio as motor
+    from environs import Env
+
+    env = Env()
+    env.read_env()
+    client = motor.AsyncIOMotorClient(env('MONGO_URI'))
+    resumen = ResumenVisitas(client["MiMapa"], env.int('VISITAS_ULTIMAS', ULTIMAS_POR_DEFECTO))
+    await resumen.reconstruir()
+    print(f"Resúmenes reconstruidos: {await resumen.resumenes.count_documents({})}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resúmenes de visitas por mapa")
+    parser.add_argument("--backfill", action="store_true", help="reconstruir desde la colección Visitas")
+    args = parser.parse_args()
+    if args.backfill:
+        asyncio.run(_backfill())
+    else:
+        parser.print_help()
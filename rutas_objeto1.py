@@ -0,0 +1,239 @@
+"""
+Endpoints CRUD de Objeto1 (/path).
+
+main.py los registra en la primera petición a /path (ver carga_perezosa.py),
+así que estas rutas no cuentan en el arranque en frío.
+"""
+from datetime import datetime
+import json
+from typing import Literal, Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Form, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from bulk_objeto1 import EscritorBulkObjeto1
+from cache_lru import CacheLRU
+from importacion import CuerpoDemasiadoGrande, elementos_json, leer_archivo, volcar_cuerpo
+from objeto1 import (
+    PROYECCION_OBJETO1, filtros_objeto1, pipeline_estadisticas, serializar_estadisticas, serializar_objeto1,
+)
+from paginacion import cursor_keyset, leer_pagina, respuesta_lista_json, respuesta_ndjson
+
+
+class CacheEstadisticas:
+    """
+    Resultados de /stats por filtro normalizado. Cualquier escritura puede
+    cambiar cualquier resultado, así que las invalida todas; la versión evita
+    guardar un resultado calculado antes de una escritura que ya lo invalidó.
+    """
+
+    def __init__(self, max_entradas: int = 256, ttl: Optional[float] = 300.0):
+        self.cache = CacheLRU(max_entradas=max_entradas, ttl=ttl)
+        self.version = 0
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        return self.cache.obtener(clave)
+
+    def guardar(self, clave: str, valor: dict, version: int) -> None:
+        if version == self.version:
+            self.cache.guardar(clave, valor)
+
+    def invalidar(self) -> None:
+        self.version += 1
+        self.cache.limpiar()
+
+    def metricas(self) -> dict:
+        return {**self.cache.metricas(), "version": self.version}
+
+
+def crear_router(coleccion1, objeto1_batch_size: int = 500, path: str = "/path",
+                 estadisticas: Optional[CacheEstadisticas] = None, bulk_lote: int = 500,
+                 bulk_max_bytes: Optional[int] = None) -> APIRouter:
+    router = APIRouter()
+    if estadisticas is None:
+        estadisticas = CacheEstadisticas()
+    escritor_bulk = EscritorBulkObjeto1(coleccion1, lote=bulk_lote, al_escribir=estadisticas.invalidar)
+
+    # Obtener todos los objeto1 (paginado por _id o por fecha)
+    @router.get(path)
+    async def obtener_todos_Objeto1_con_id(
+        limit: Optional[int] = Query(None, ge=1),
+        cursor: Optional[str] = None,
+        orden: Literal["_id", "fecha"] = "_id",
+        formato: Literal["json", "ndjson"] = "json",
+    ):
+        """
+        Sin limit ni cursor devuelve la lista completa, con la misma forma que
+        antes de la paginación (en streaming desde el cursor); con limit o
+        cursor, {"items", "next_cursor"} en páginas de hasta limit (100 por
+        defecto).
+        """
+        try:
+            if formato == "ndjson":
+                docs = cursor_keyset(coleccion1, {}, PROYECCION_OBJETO1, orden, cursor).batch_size(objeto1_batch_size)
+                if limit:
+                    docs = docs.limit(limit)
+                return respuesta_ndjson(docs, serializar_objeto1)
+
+            if not limit and not cursor:
+                docs = cursor_keyset(coleccion1, {}, PROYECCION_OBJETO1, orden).batch_size(objeto1_batch_size)
+                return respuesta_lista_json(docs, serializar_objeto1)
+
+            lista_objeto1, next_cursor = await leer_pagina(
+                coleccion1, {}, PROYECCION_OBJETO1, serializar_objeto1, orden, limit, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return {"items": lista_objeto1, "next_cursor": next_cursor}
+
+    # Filtrar objeto1
+    @router.get(path + "/filtrar")
+    async def filtrar_objeto1(
+        # Definimos los mismos parámetros que tiene el formulario HTML
+        descripcion: Optional[str] = None,
+        booleano: Optional[str] = None,
+        start_fecha: Optional[str] = None,
+        end_fecha: Optional[str] = None,
+        entero: Optional[str] = None
+    ) -> dict:
+        try:
+            filtros = filtros_objeto1(descripcion, booleano, start_fecha, end_fecha, entero)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Los tiempos de la consulta salen en Server-Timing y en /metrics (ver instrumentacion.py)
+        # Un solo cursor con proyección: no volvemos a pedir cada documento por id
+        lista_objeto1 = []
+        cursor = coleccion1.find(filtros, PROYECCION_OBJETO1).batch_size(objeto1_batch_size)
+        async for reg in cursor:
+            lista_objeto1.append(serializar_objeto1(reg))
+
+        return {"lista_objeto1": lista_objeto1}
+
+    # Resumen de los objeto1 filtrados (mismos filtros que /filtrar), calculado en Mongo.
+    # Va antes de /{objeto1_id} para que "stats" no se tome por un id
+    @router.get(path + "/stats")
+    async def estadisticas_Objeto1(
+        descripcion: Optional[str] = None,
+        booleano: Optional[str] = None,
+        start_fecha: Optional[str] = None,
+        end_fecha: Optional[str] = None,
+        entero: Optional[str] = None,
+        cubetas: int = Query(10, ge=1, le=100),
+        top: int = Query(10, ge=1, le=100),
+    ) -> dict:
+        try:
+            filtros = filtros_objeto1(descripcion, booleano, start_fecha, end_fecha, entero)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Clave: el filtro ya convertido, así "True" y "true" comparten entrada
+        clave = json.dumps([filtros, cubetas, top], default=str, sort_keys=True)
+        resultado = estadisticas.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        version = estadisticas.version
+        facetas = await coleccion1.aggregate(pipeline_estadisticas(filtros, cubetas, top)).to_list(1)
+        resultado = serializar_estadisticas(facetas[0])
+        estadisticas.guardar(clave, resultado, version)
+        return resultado
+
+    @router.get(path + "/stats/metricas")
+    async def metricas_Estadisticas_Objeto1():
+        return estadisticas.metricas()
+
+    # Obtener un objeto1 por su id
+    @router.get(path + "/{objeto1_id}")
+    async def obtener_Objeto1_por_id(objeto1_id: str):
+        objeto1 = await coleccion1.find_one({"_id": ObjectId(objeto1_id)}, PROYECCION_OBJETO1)
+        if objeto1:
+            return serializar_objeto1(objeto1)
+        else:
+            raise HTTPException(status_code=404, detail="Objeto1 no encontrado")
+
+    # Crear un objeto1
+    @router.post(path)
+    async def crear_Objeto1(lista1: str = Form(...),  
+                            descripcion: str = Form(...), 
+                            booleano: bool = Form(...), 
+                            fecha: str = Form(...), 
+                            entero: int = Form(...)):
+        try:
+            fecha_dt = datetime.fromisoformat(fecha)
+
+            nuevo_objeto1 = {
+                "lista1": lista1.split(",") if lista1 else [],
+                "descripcion": descripcion,
+                "booleano": booleano,
+                "fecha": fecha_dt,
+                "entero": entero,
+                }
+
+            resultado = await coleccion1.insert_one(nuevo_objeto1)
+            nuevo_id = resultado.inserted_id
+            estadisticas.invalidar()
+
+            # Cambiar por Templates Jinja2 si es necesario
+            #return Jinja2Templates.TemplateResponse("exito.html", {
+            return {"mensaje": "Objeto1 creado correctamente", "id": str(nuevo_id)}
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    # Muchas altas, cambios y bajas en una petición (ver bulk_objeto1.py)
+    @router.post(path + "/bulk")
+    async def bulk_Objeto1(request: Request):
+        try:
+            archivo = await volcar_cuerpo(request.stream(), max_bytes=bulk_max_bytes)
+        except CuerpoDemasiadoGrande as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        operaciones = elementos_json(leer_archivo(archivo), "item")
+        return StreamingResponse(escritor_bulk.escribir(operaciones), media_type="application/x-ndjson")
+
+    @router.post(path + "/actualizar/{objeto1_id}")
+    async def actualizar_Objeto1(objeto1_id: str,
+                                 lista1: str = Form(...),
+                                descripcion: str = Form(...), 
+                                booleano: bool = Form(...), 
+                                fecha: str = Form(...), 
+                                entero: int = Form(...)):
+        try:
+            fecha_dt = datetime.fromisoformat(fecha)
+
+            objeto1_actualizado = {
+                "lista1": lista1.split(",") if lista1 else [],
+                "descripcion": descripcion,
+                "booleano": booleano,
+                "fecha": fecha_dt,
+                "entero": entero,
+            }
+
+            resultado = await coleccion1.update_one({"_id": ObjectId(objeto1_id)}, {"$set": objeto1_actualizado})
+            estadisticas.invalidar()
+
+            # Cambiar por Templates Jinja2 si es necesario
+            #return Jinja2Templates.TemplateResponse("exito.html", {
+            return {"mensaje": "Objeto1 actualizado correctamente", "id": objeto1_id}
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    # Eliminar un objeto1 por su clave1
+    #BORRAR
+    @router.delete(path + "/{objeto1_id}")
+    async def eliminar_Objeto1(objeto1_id: str):
+        try:
+            id = ObjectId(objeto1_id)
+            #print("ID a eliminar:", id)
+        except:
+            raise HTTPException(status_code=400, detail="ID de objeto1 inválido.")
+
+        await coleccion1.delete_one({"_id": id})
+        estadisticas.invalidar()
+
+        return {"mensaje": "Objeto1 eliminado correctamente"}
+
+    return router
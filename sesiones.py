@@ -0,0 +1,95 @@
+"""
+Almacén de sesiones en el servidor.
+
+La cookie firmada de SessionMiddleware solo guarda {"sid": ...}; los datos
+del usuario viven aquí, en dos niveles: una LRU en memoria y una colección
+de Mongo con expiración TTL.
+"""
+from datetime import datetime, timedelta
+import secrets
+from typing import Optional, Protocol
+
+from cache_lru import CacheLRU
+
+
+def nuevo_sid() -> str:
+    return secrets.token_urlsafe(32)
+
+
+class AlmacenSesiones(Protocol):
+    async def obtener(self, sid: str) -> Optional[dict]: ...
+
+    async def guardar(self, sid: str, datos: dict) -> None: ...
+
+    async def borrar(self, sid: str) -> None: ...
+
+
+class SesionesMemoria:
+
+    def __init__(self, max_sesiones: int = 10000, ttl: float = 300.0):
+        self.cache = CacheLRU(max_entradas=max_sesiones, ttl=ttl)
+
+    async def obtener(self, sid: str) -> Optional[dict]:
+        return self.cache.obtener(sid)
+
+    async def guardar(self, sid: str, datos: dict) -> None:
+        self.cache.guardar(sid, datos)
+
+    async def borrar(self, sid: str) -> None:
+        self.cache.invalidar(sid)
+
+
+class SesionesMongo:
+    """Colección "Sesiones": {_id: sid, datos, expira} con índice TTL en "expira"."""
+
+    def __init__(self, coleccion, ttl: timedelta = timedelta(days=14)):
+        self.coleccion = coleccion
+        self.ttl = ttl
+
+    async def obtener(self, sid: str) -> Optional[dict]:
+        doc = await self.coleccion.find_one({"_id": sid, "expira": {"$gt": datetime.now()}}, {"datos": 1})
+        return doc["datos"] if doc else None
+
+    async def guardar(self, sid: str, datos: dict) -> None:
+        await self.coleccion.update_one(
+            {"_id": sid},
+            {"$set": {"datos": datos, "expira": datetime.now() + self.ttl}},
+            upsert=True,
+        )
+
+    async def borrar(self, sid: str) -> None:
+        await self.coleccion.delete_one({"_id": sid})
+
+
+class SesionesEnCapas:
+    """Lee primero de memoria y, si falla, de Mongo (y la guarda en memoria)."""
+
+    def __init__(self, memoria: SesionesMemoria, persistente: AlmacenSesiones):
+        self.memoria = memoria
+        self.persistente = persistente
+
+    async def obtener(self, sid: str) -> Optional[dict]:
+        datos = await self.memoria.obtener(sid)
+        if datos is None:
+            datos = await self.persistente.obtener(sid)
+            if datos is not None:
+                await self.memoria.guardar(sid, datos)
+        return datos
+
+    async def guardar(self, sid: str, datos: dict) -> None:
+        await self.persistente.guardar(sid, datos)
+        await self.memoria.guardar(sid, datos)
+
+    async def borrar(self, sid: str) -> None:
+        await self.memoria.borrar(sid)
+        await self.persistente.borrar(sid)
+
+    def metricas(self) -> dict:
+        return self.memoria.cache.metricas()
+
+
+def crear_almacen(env, coleccion) -> SesionesEnCapas:
+    return SesionesEnCapas(
+        SesionesMemoria(env.int('SESIONES_MEMORIA', 10000), env.float('SESIONES_MEMORIA_TTL', 300.0)),
+        SesionesMongo(coleccion, timedelta(seconds=env.int('SESION_TTL', 14 * 24 * 3600))),
+    )
@@ -0,0 +1,259 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import threading
+import time
+from typing import BinaryIO, Optional, Protocol
+
+from imagenes import TAMANOS_DERIVADAS, generar_derivadas, reducir_imagen, urls_derivadas
+from instrumentacion import tramo
+
+
+# --- BACKENDS DE ALMACENAMIENTO ---
+
+class Almacenamiento(Protocol):
+    def subir(self, archivo: BinaryIO, public_id: Optional[str] = None,
+              folder: Optional[str] = None, resource_type: str = "auto") -> dict: ...
+
+    def subir_imagen(self, archivo: BinaryIO, lado_maximo: int, folder: Optional[str] = None) -> dict:
+        """Como subir, pero reduce la imagen y añade "derivadas": {nombre: url}."""
+        ...
+
+    def borrar(self, public_id: str) -> dict: ...
+
+
+class AlmacenamientoCloudinary:
+    """
+    Sube y borra en Cloudinary (llamadas bloqueantes: van al pool de hilos).
+    El SDK se importa y se configura en la primera operación, no al arrancar.
+    """
+
+    def __init__(self, cloud_name: Optional[str] = None, api_key: Optional[str] = None,
+                 api_secret: Optional[str] = None):
+        self._credenciales = {"cloud_name": cloud_name, "api_key": api_key, "api_secret": api_secret}
+        self._lock = threading.Lock()
+        self._configurado = False
+
+    def _uploader(self):
+        import cloudinary
+        import cloudinary.uploader
+
+        # Varios hilos del pool pueden llegar a la vez a la primera subida
+        with self._lock:
+            if not self._configurado:
+                cloudinary.config(**self._credenciales, secure=True)
+                self._configurado = True
+        return cloudinary.uploader
+
+    def subir(self, archivo, public_id=None, folder=None, resource_type="auto") -> dict:
+        opciones = {"resource_type": resource_type}
+        if public_id is not None:
+            opciones["public_id"] = public_id
+        if folder is not None:
+            opciones["folder"] = folder
+        return self._uploader().upload(archivo, **opciones)
+
+    def subir_imagen(self, archivo, lado_maximo, folder=None) -> dict:
+        # Las derivadas las genera Cloudinary la primera vez que se piden
+        reducida = reducir_imagen(archivo, lado_maximo)
+        try:
+            resultado = self.subir(reducida, folder=folder, resource_type="image")
+        finally:
+            if reducida is not archivo:
+                reducida.close()
+        resultado["derivadas"] = urls_derivadas(resultado.get("secure_url"))
+        return resultado
+
+    def borrar(self, public_id: str) -> dict:
+        return self._uploader().destroy(public_id)
+
+
+class AlmacenamientoLocal:
+    """
+    Guarda los archivos en disco. Sirve para desarrollar y medir rendimiento
+    sin conexión: devuelve el mismo formato de respuesta que Cloudinary.
+    """
+
+    def __init__(self, directorio: str = "media", url_base: str = "/media"):
+        self.directorio = directorio
+        self.url_base = url_base.rstrip("/")
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, public_id: str) -> str:
+        ruta = os.path.normpath(os.path.join(self.directorio, public_id))
+        if not ruta.startswith(os.path.normpath(self.directorio) + os.sep):
+            raise ValueError(f"public_id inválido: {public_id}")
+        return ruta
+
+    def subir(self, archivo, public_id=None, folder=None, resource_type="auto") -> dict:
+        public_id = public_id or os.urandom(8).hex()
+        if folder:
+            public_id = f"{folder}/{public_id}"
+        ruta = self._ruta(public_id)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+        # Copiamos por bloques para no cargar el archivo entero en memoria
+        with open(ruta, "wb") as destino:
+            shutil.copyfileobj(archivo, destino, 1024 * 1024)
+
+        return {
+            "public_id": public_id,
+            "secure_url": f"{self.url_base}/{public_id}",
+            "bytes": os.path.getsize(ruta),
+        }
+
+    def subir_imagen(self, archivo, lado_maximo, folder=None) -> dict:
+        reducida = reducir_imagen(archivo, lado_maximo)
+        try:
+            resultado = self.subir(reducida, folder=folder)
+            ruta = self._ruta(resultado["public_id"])
+            resultado["derivadas"] = {}
+            for nombre, (datos, _) in generar_derivadas(reducida).items():
+                with open(f"{ruta}_{nombre}", "wb") as destino:
+                    destino.write(datos)
+                resultado["derivadas"][nombre] = f"{resultado['secure_url']}_{nombre}"
+        finally:
+            if reducida is not archivo:
+                reducida.close()
+        return resultado
+
+    def borrar(self, public_id: str) -> dict:
+        ruta = self._ruta(public_id)
+        for nombre in TAMANOS_DERIVADAS:
+            try:
+                os.remove(f"{ruta}_{nombre}")
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            return {"result": "not found"}
+        return {"result": "ok"}
+
+
+def crear_almacenamiento(env) -> Almacenamiento:
+    """Elige el backend según la variable ALMACENAMIENTO (cloudinary | local)."""
+    tipo = env('ALMACENAMIENTO', 'cloudinary')
+    if tipo == 'local':
+        return AlmacenamientoLocal(env('MEDIA_DIR', 'media'), env('MEDIA_URL', '/media'))
+    return AlmacenamientoCloudinary(
+        env('CLOUDINARY_CLOUD_NAME', None), env('CLOUDINARY_API_KEY', None), env('CLOUDINARY_API_SECRET', None)
+    )
+
+
+# --- EJECUTOR DE SUBIDAS ---
+
+class EjecutorSubidas:
+    """
+    Ejecuta las operaciones del almacenamiento en un pool de hilos acotado
+    para no bloquear el bucle de eventos, con timeout por petición y métricas.
+    """
+
+    def __init__(self, almacenamiento: Almacenamiento, hilos: int = 4,
+                 timeout: float = 60.0, muestras: int = 1000):
+        self.almacenamiento = almacenamiento
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="subidas")
+        self.hilos = hilos
+        self._lock = threading.Lock()
+        self._latencias = deque(maxlen=muestras)
+        self.en_cola = 0
+        self.en_curso = 0
+        self.completadas = 0
+        self.errores = 0
+        self.timeouts = 0
+
+    def _medir(self, trabajo: dict, funcion, *args, **kwargs):
+        # Se ejecuta dentro del hilo del pool
+        with self._lock:
+            if trabajo["descartado"]:
+                # Se dejó de esperar mientras estaba en cola: ya se descontó
+                return None
+            trabajo["empezado"] = True
+            self.en_cola -= 1
+            self.en_curso += 1
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+                self._latencias.append(time.perf_counter() - inicio)
+
+    async def _ejecutar(self, funcion, *args, timeout: Optional[float] = None, **kwargs):
+        loop = asyncio.get_running_loop()
+        trabajo = {"empezado": False, "descartado": False}
+        with self._lock:
+            self.en_cola += 1
+        futuro = loop.run_in_executor(self._pool, lambda: self._medir(trabajo, funcion, *args, **kwargs))
+        try:
+            # Tramo "subida" de la petición: incluye la espera en la cola del pool
+            with tramo("subida", funcion.__name__):
+                resultado = await asyncio.wait_for(futuro, timeout or self.timeout)
+        except BaseException as e:
+            with self._lock:
+                # Timeout o cancelación con el trabajo aún en cola: no llegará a
+                # ejecutarse _medir, así que lo sacamos de la cola aquí
+                if not trabajo["empezado"] and not trabajo["descartado"]:
+                    trabajo["descartado"] = True
+                    self.en_cola -= 1
+                if isinstance(e, asyncio.TimeoutError):
+                    # El hilo sigue hasta terminar, pero el cliente deja de esperar
+                    self.timeouts += 1
+                elif isinstance(e, Exception):
+                    self.errores += 1
+            raise
+        with self._lock:
+            self.completadas += 1
+        return resultado
+
+    async def subir(self, archivo: BinaryIO, timeout: Optional[float] = None, **opciones) -> dict:
+        """
+        Sube un objeto archivo (p.ej. UploadFile.file) tal cual: el backend lo
+        lee por streaming, sin volcarlo antes a memoria.
+        """
+        return await self._ejecutar(self.almacenamiento.subir, archivo, timeout=timeout, **opciones)
+
+    async def subir_imagen(self, archivo: BinaryIO, lado_maximo: int, timeout: Optional[float] = None,
+                           **opciones) -> dict:
+        """Reduce (si hace falta), sube y genera las derivadas, todo en el pool."""
+        return await self._ejecutar(self.almacenamiento.subir_imagen, archivo, lado_maximo,
+                                    timeout=timeout, **opciones)
+
+    async def borrar(self, public_id: str, timeout: Optional[float] = None) -> dict:
+        return await self._ejecutar(self.almacenamiento.borrar, public_id, timeout=timeout)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            en_cola, en_curso = self.en_cola, self.en_curso
+
+        def percentil(p: float) -> Optional[float]:
+            if not latencias:
+                return None
+            indice = min(len(latencias) - 1, int(round(p / 100 * (len(latencias) - 1))))
+            return round(latencias[indice] * 1000, 2)
+
+        return {
+            "backend": type(self.almacenamiento).__name__,
+            "hilos": self.hilos,
+            "en_cola": en_cola,
+            "en_curso": en_curso,
+            "completadas": self.completadas,
+            "errores": self.errores,
+            "timeouts": self.timeouts,
+            "latencia_ms": {"p50": percentil(50), "p95": percentil(95), "p99": percentil(99)},
+        }
+
+    def cerrar(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+def crear_ejecutor(env) -> EjecutorSubidas:
+    return EjecutorSubidas(
+        crear_almacenamiento(env),
+        hilos=env.int('SUBIDAS_HILOS', 4),
+        timeout=env.float('SUBIDAS_TIMEOUT', 60.0),
+    )
@@ -0,0 +1,102 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'mapa.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_email_mapa = resolve('email_mapa')
+    l_0_es_propietario = resolve('es_propietario')
+    l_0_total_visitas = resolve('total_visitas')
+    l_0_visitantes_unicos = resolve('visitantes_unicos')
+    l_0_visitas = resolve('visitas')
+    l_0_url_teselas = resolve('url_teselas')
+    l_0_limites = resolve('limites')
+    l_0_zoom_clusters = resolve('zoom_clusters')
+    l_0_max_marcadores_bbox = resolve('max_marcadores_bbox')
+    try:
+        t_1 = environment.filters['length']
+    except KeyError:
+        @internalcode
+        def t_1(*unused):
+            raise TemplateRuntimeError("No filter named 'length' found.")
+    try:
+        t_2 = environment.filters['tojson']
+    except KeyError:
+        @internalcode
+        def t_2(*unused):
+            raise TemplateRuntimeError("No filter named 'tojson' found.")
+    try:
+        t_3 = environment.filters['urlencode']
+    except KeyError:
+        @internalcode
+        def t_3(*unused):
+            raise TemplateRuntimeError("No filter named 'urlencode' found.")
+    pass
+    yield '<!DOCTYPE html>\n<html lang="es">\n<head>\n    <meta charset="UTF-8">\n    <title>Mapa de '
+    yield escape((undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa))
+    yield '</title>\n    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">\n    <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />\n    \n    <style>\n        body { background-color: #f8f9fa; }\n        #map { height: 500px; width: 100%; border-radius: 10px; }\n        .thumbnail { max-width: 100px; max-height: 100px; object-fit: cover; }\n        .form-card { border: none; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }\n        .table-token { font-size: 0.75rem; color: #666; font-family: monospace; }\n        .cluster div { width: 100%; height: 100%; border-radius: 50%; background: rgba(13, 110, 253, 0.8);\n                       color: #fff; font-weight: bold; display: flex; align-items: center; justify-content: center; }\n    </style>\n</head>\n<body class="container py-4">\n\n    <div class="d-flex justify-content-between align-items-center mb-3">\n        <div>\n            <h1 class="h3">Mapa de: <span class="text-primary">'
+    yield escape((undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa))
+    yield '</span></h1>\n            '
+    if (not (undefined(name='es_propietario') if l_0_es_propietario is missing else l_0_es_propietario)):
+        pass
+        yield '\n                <span class="badge bg-warning text-dark">Modo Visitante</span>\n            '
+    else:
+        pass
+        yield '\n                <span class="badge bg-success">Modo Propietario</span>\n            '
+    yield '\n        </div>\n        <a href="/" class="btn btn-outline-secondary">Volver al Inicio</a>\n    </div>\n\n    <div id="map" class="mb-5 shadow-sm border border-2 border-white"></div>\n\n    <div class="row justify-content-center mb-5">\n        <div class="col-md-8">\n            \n            '
+    if (undefined(name='es_propietario') if l_0_es_propietario is missing else l_0_es_propietario):
+        pass
+        yield '\n                <div class="card form-card">\n                    <div class="card-header bg-primary text-white text-center py-3">\n                        <h5 class="mb-0">📍 Añadir Nuevo Destino</h5>\n                    </div>\n                    <div class="card-body p-4 bg-white">\n                        <form action="/web/nuevo-marcador" method="post" enctype="multipart/form-data">\n                            <input type="hidden" name="email" value="'
+        yield escape((undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa))
+        yield '">\n\n                            <div class="mb-3">\n                                <label class="form-label fw-bold">Ciudad</label>\n                                <input type="text" name="ciudad" class="form-control" placeholder="Ej: Tokio, Japón" required>\n                            </div>\n                            <div class="mb-4">\n                                <label class="form-label fw-bold">Foto</label>\n                                <input type="file" name="imagen" class="form-control" accept="image/*" required>\n                            </div>\n                            <div class="d-grid">\n                                <button type="submit" class="btn btn-primary btn-lg">Guardar Marcador</button>\n                            </div>\n                        </form>\n                    </div>\n                </div>\n\n            '
+    else:
+        pass
+        yield '\n                <div class="alert alert-info text-center p-4 shadow-sm" role="alert">\n                    <h4 class="alert-heading">🗺️ Estás explorando</h4>\n                    <p>Estás viendo el mapa personal de <strong>'
+        yield escape((undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa))
+        yield '</strong>.</p>\n                    <hr>\n                    <p class="mb-0">No puedes añadir marcadores aquí, pero tu visita ha quedado registrada.</p>\n                </div>\n            '
+    yield '\n\n        </div>\n    </div>\n\n    <div class="card shadow-sm mb-5">\n        <div class="card-header bg-secondary text-white d-flex justify-content-between align-items-center">\n            <h5 class="mb-0">👀 Historial de Visitas Recibidas</h5>\n            <span>\n                <span class="badge bg-light text-dark">'
+    yield escape((undefined(name='total_visitas') if l_0_total_visitas is missing else l_0_total_visitas))
+    yield ' visitas</span>\n                <span class="badge bg-light text-dark">'
+    yield escape((undefined(name='visitantes_unicos') if l_0_visitantes_unicos is missing else l_0_visitantes_unicos))
+    yield ' visitantes únicos</span>\n            </span>\n        </div>\n        <div class="card-body">\n            '
+    if (undefined(name='visitas') if l_0_visitas is missing else l_0_visitas):
+        pass
+        yield '\n                <div class="table-responsive">\n                    <table class="table table-striped table-hover align-middle">\n                        <thead class="table-light">\n                            <tr>\n                                <th scope="col">Fecha</th>\n                                <th scope="col">Visitante</th>\n                                <th scope="col">Token (Fragmento)</th>\n                            </tr>\n                        </thead>\n                        <tbody>\n                            '
+        for l_1_v in (undefined(name='visitas') if l_0_visitas is missing else l_0_visitas):
+            _loop_vars = {}
+            pass
+            yield '\n                            <tr>\n                                <td style="width: 20%;">'
+            yield escape(environment.getattr(l_1_v, 'fecha'))
+            yield '</td>\n                                <td style="width: 30%;"><strong>'
+            yield escape(environment.getattr(l_1_v, 'email_visitante'))
+            yield '</strong></td>\n                                <td style="width: 50%;">\n                                    <div class="text-break table-token">\n                                        '
+            yield escape(environment.getattr(l_1_v, 'token'))
+            yield '\n                                    </div>\n                                </td>\n                            </tr>\n                            '
+        l_1_v = missing
+        yield '\n                        </tbody>\n                    </table>\n                </div>\n                '
+        if ((undefined(name='total_visitas') if l_0_total_visitas is missing else l_0_total_visitas) > t_1((undefined(name='visitas') if l_0_visitas is missing else l_0_visitas))):
+            pass
+            yield '\n                    <p class="text-center mb-0">\n                        <a href="/mapa/visitas?email_destino='
+            yield escape(t_3((undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa)))
+            yield '">Ver historial completo</a>\n                    </p>\n                '
+        yield '\n            '
+    else:
+        pass
+        yield '\n                <p class="text-center text-muted my-3">Este mapa aún no ha recibido visitas de otros usuarios.</p>\n            '
+    yield '\n        </div>\n    </div>\n\n    <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>\n    <script>\n        var map = L.map(\'map\').setView([20, 0], 2); // Vista global\n\n        // Teselas directas del origen o, con TILES_PROXY, desde la caché del servidor\n        L.tileLayer('
+    yield escape(t_2(context.eval_ctx, (undefined(name='url_teselas') if l_0_url_teselas is missing else l_0_url_teselas)))
+    yield ", {\n            attribution: 'OpenStreetMap',\n            maxZoom: 19\n        }).addTo(map);\n\n        // Con zoom bajo se piden clusters al servidor; con zoom alto se pintan\n        // los marcadores de la zona visible desde la copia local\n        var emailMapa = "
+    yield escape(t_2(context.eval_ctx, (undefined(name='email_mapa') if l_0_email_mapa is missing else l_0_email_mapa)))
+    yield ';\n        var limites = '
+    yield escape(t_2(context.eval_ctx, (undefined(name='limites') if l_0_limites is missing else l_0_limites)))
+    yield ';\n        var zoomClusters = '
+    yield escape(t_2(context.eval_ctx, (undefined(name='zoom_clusters') if l_0_zoom_clusters is missing else l_0_zoom_clusters)))
+    yield ';\n        var maxMarcadores = '
+    yield escape(t_2(context.eval_ctx, (undefined(name='max_marcadores_bbox') if l_0_max_marcadores_bbox is missing else l_0_max_marcadores_bbox)))
+    yield ';\n        var capaMarcadores = L.layerGroup().addTo(map);\n        var peticionActual = null;\n        var temporizador = null;\n\n        // Copia local de los marcadores (localStorage): en cada visita solo se\n        // piden los creados después de la última versión vista\n        var claveLocal = "marcadores:" + emailMapa;\n        var copiaLocal = leerCopiaLocal();\n        var sincronizada = false;\n\n        function leerCopiaLocal() {\n            try {\n                var copia = JSON.parse(localStorage.getItem(claveLocal));\n                return (copia && Array.isArray(copia.marcadores)) ? copia : null;\n            } catch (e) {\n                return null;\n            }\n        }\n\n        function guardarCopiaLocal() {\n            try {\n                localStorage.setItem(claveLocal, JSON.stringify(copiaLocal));\n            } catch (e) {\n                // Sin espacio en localStorage: la copia sigue valiendo en memoria\n                console.warn(e);\n            }\n        }\n\n        function sincronizar() {\n            var copia = copiaLocal || { hasta: 0, marcadores: [] };\n            var vistas = {};\n            copia.marcadores.forEach(function(m) { vistas[m.v] = true; });\n\n            function pedir() {\n                var params = new URLSearchParams({ desde: copia.hasta, limit: 1000 });\n                return fetch("/marcadores/" + encodeURIComponent(emailMapa) + "/cambios?" + params)\n                    .then(function(res) {\n                        if (!res.ok) { throw new Error("HTTP " + res.status); }\n                        return res.json();\n                    })\n                    .then(function(data) {\n                        if (data.reiniciar) {\n                            copia = { hasta: 0, marcadores: [] };\n                            vistas = {};\n                            return pedir();\n                        }\n                        data.marcadores.forEach(function(m) {\n                            // Puede repetirse alguno si había inserciones en curso\n                            if (!vistas[m.v]) { vistas[m.v] = true; copia.marcadores.push(m); }\n                        });\n                        copia.hasta = data.hasta;\n                        // Con marcadores sin versión la copia no los tiene todos\n                        copia.completa = data.completo;\n                        if (data.hay_mas) { return pedir(); }\n                    });\n            }\n\n            return pedir()\n                .then(function() {\n                    copiaLocal = copia;\n                    sincronizada = true;\n                    guardarCopiaLocal();\n                })\n                .catch(function(e) {\n                    // Sin conexión: seguimos con la copia que hubiera\n                    console.error(e);\n                });\n        }\n\n        function marcadoresLocales() {\n            var b = map.getBounds();\n            var visibles = [];\n            for (var i = 0; i < copiaLocal.marcadores.length && visibles.length < maxMarcadores; i++) {\n                var m = copiaLocal.marcadores[i];\n                if (b.contains([m.lat, m.lon])) { visibles.push(m); }\n            }\n            return visibles;\n        }\n\n        function pintarMarcadores(marcadores, clusters) {\n            capaMarcadores.clearLayers();\n            // Clusters calculados en el servidor: al pulsar, acercamos el zoom\n            clusters.forEach(function(c) {\n                var tamano = c.cantidad < 100 ? 34 : (c.cantidad < 1000 ? 42 : 50);\n                var icono = L.divIcon({\n                    html: "<div>" + c.cantidad + "</div>",\n                    className: "cluster",\n                    iconSize: [tamano, tamano]\n                });\n                L.marker([c.lat, c.lon], { icon: icono }).addTo(capaMarcadores).on("click", function() {\n                    map.setView([c.lat, c.lon], map.getZoom() + 2);\n                });\n            });\n            marcadores.forEach(function(m) {\n                var contenido = "<b>" + (m.ciudad || "?") + "</b><br>";\n                if(m.mini) {\n                    // Miniatura por defecto; el navegador elige la media en pantallas densas\n                    contenido += "<a href=\'" + m.img + "\' target=\'_blank\'><img src=\'" + m.mini + "\'"\n                        + (m.media ? " srcset=\'" + m.mini + " 200w, " + m.media + " 640w\'" : "")\n                        + " sizes=\'100px\' loading=\'lazy\' class=\'thumbnail mt-2\'></a>";\n                } else if(m.img) {\n                    contenido += "<img src=\'" + m.img + "\' loading=\'lazy\' class=\'thumbnail mt-2\'>";\n                }\n                \n                var lat = parseFloat(m.lat);\n                var lon = parseFloat(m.lon);\n                \n                if (!isNaN(lat) && !isNaN(lon)) {\n                    L.marker([lat, lon]).addTo(capaMarcadores).bindPopup(contenido);\n                }\n            });\n        }\n\n        function cargarMarcadores() {\n            // Cancelamos la petición anterior si el usuario sigue moviendo el mapa\n            if (peticionActual) { peticionActual.abort(); }\n            if (sincronizada && copiaLocal.completa && map.getZoom() > zoomClusters) {\n                pintarMarcadores(marcadoresLocales(), []);\n                return;\n            }\n            peticionActual = new AbortController();\n\n            var b = map.getBounds();\n            var params = new URLSearchParams({\n                email: emailMapa,\n                minLon: b.getWest(), minLat: Math.max(-90, b.getSouth()),\n                maxLon: b.getEast(), maxLat: Math.min(90, b.getNorth()),\n                zoom: map.getZoom()\n            });\n            fetch("/marcadores/bbox?" + params, { signal: peticionActual.signal })\n                .then(function(res) { return res.json(); })\n                .then(function(data) { pintarMarcadores(data.marcadores || [], data.clusters || []); })\n                .catch(function(e) {\n                    if (e.name === "AbortError") { return; }\n                    // Sin conexión: lo que haya en la copia local, sin clusters\n                    if (copiaLocal) { pintarMarcadores(marcadoresLocales(), []); } else { console.error(e); }\n                });\n        }\n\n        map.on("moveend", function() {\n            clearTimeout(temporizador);\n            temporizador = setTimeout(cargarMarcadores, 150);\n        });\n\n        // Centrar mapa si hay puntos (dispara moveend y la primera carga)\n        if (limites) {\n            map.fitBounds(L.latLngBounds(limites).pad(0.2), { maxZoom: 10 });\n        } else {\n            cargarMarcadores();\n        }\n\n        // Al terminar la sincronización, con zoom alto pasamos a la copia local\n        sincronizar().then(function() {\n            if (copiaLocal && copiaLocal.completa && map.getZoom() > zoomClusters) { cargarMarcadores(); }\n        });\n    </script>\n</body>\n</html>'
+
+blocks = {}
+debug_info = '5=39&23=41&24=43&38=50&45=53&65=58&78=61&79=63&83=65&94=68&96=72&97=74&100=76&108=80&110=83&124=90&131=92&132=94&133=96&134=98'
\ No newline at end of file
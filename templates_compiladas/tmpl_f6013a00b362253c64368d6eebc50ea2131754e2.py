@@ -0,0 +1,29 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'index.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_user = resolve('user')
+    l_0_client_id = resolve('client_id')
+    pass
+    yield '<!DOCTYPE html>\n<html lang="en">\n  <head>\n    <script src="https://accounts.google.com/gsi/client" async></script>\n    <script>\n      async function handleCredentialResponse(response) {\n        try {\n            // Enviamos el token a tu nuevo endpoint POST /login\n            const res = await fetch("/login", {\n                method: "POST",\n                headers: { "Content-Type": "application/json" },\n                body: JSON.stringify({ token: response.credential })\n            });\n\n            if (res.ok) {\n                // Si el backend dice OK, recargamos la página\n                // para que Jinja detecte la sesión y muestre el dashboard/bienvenida\n                location.reload(); \n            } else {\n                const data = await res.json();\n                alert("Error de autenticación: " + data.detail);\n            }\n        } catch (error) {\n            console.error("Error:", error);\n        }\n      }\n    </script>\n  </head>\n  <body>\n    <h1>Bienvenido a MiMapa</h1>\n    \n    '
+    if (undefined(name='user') if l_0_user is missing else l_0_user):
+        pass
+        yield '\n        <h2>Bienvenido, '
+        yield escape(environment.getattr((undefined(name='user') if l_0_user is missing else l_0_user), 'name'))
+        yield '</h2>\n        <img src="'
+        yield escape(environment.getattr((undefined(name='user') if l_0_user is missing else l_0_user), 'picture'))
+        yield '" width="50" style="border-radius: 50%;">\n        <br><br>\n\n        <style>\n            .boton {\n                display: inline-block;\n                padding: 10px 20px;\n                text-decoration: none;\n                color: white;\n                border-radius: 5px;\n                font-family: Arial, sans-serif;\n                margin: 5px;\n                font-weight: bold;\n            }\n            .boton-mapa {\n                background-color: #007bff; /* Azul */\n            }\n            .boton-logout {\n                background-color: #dc3545; /* Rojo */\n            }\n            /* Efecto al pasar el mouse */\n            .boton:hover {\n                opacity: 0.8;\n            }\n        </style>\n\n        <a href="/mapa" class="boton boton-mapa">Ir al Mapa</a>\n        <hr>\n        <h3>Visitar el mapa de un amigo</h3>\n        <form action="/mapa" method="get" class="row g-3">\n            <div class="col-auto">\n                <input type="email" name="email_destino" class="form-control" placeholder="amigo@gmail.com" required>\n            </div>\n            <div class="col-auto">\n                <button type="submit" class="btn btn-info">Ver Mapa</button>\n            </div>\n        </form>\n        <a href="/logout" class="boton boton-logout">Cerrar Sesión</a>\n    '
+    else:
+        pass
+        yield '\n        <div\n          id="g_id_onload"\n          data-auto_prompt="false"\n          data-callback="handleCredentialResponse"\n          data-client_id="'
+        yield escape((undefined(name='client_id') if l_0_client_id is missing else l_0_client_id))
+        yield '" \n        ></div>\n        <div class="g_id_signin" data-type="standard" data-size="medium"></div>\n    '
+    yield '\n  </body>\n</html>'
+
+blocks = {}
+debug_info = '32=14&33=17&34=19&77=24'
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""
+Proxy de teselas del mapa con caché LRU en disco.
+
+Con TILES_PROXY=true mapa.html pide las teselas a /teselas/{z}/{x}/{y}.png
+y el servidor las sirve desde disco; solo las que no tiene (o las que han
+caducado) se piden al origen (TILES_ORIGEN, por defecto el servidor público
+de OpenStreetMap). Si el origen falla y hay una copia caducada, se sirve esa.
+
+- CacheTeselasDisco: un archivo por tesela bajo el directorio, con un
+  índice LRU en memoria (clave -> bytes) que se reconstruye al arrancar
+  ordenando por fecha de modificación. Al pasar de max_bytes se borran las
+  menos usadas. La lectura y escritura de archivos va en hilos, y se escribe
+  en un temporal + os.replace para no servir nunca una tesela a medias.
+- ProxyTeselas: valida las coordenadas, consulta la caché y agrupa las
+  descargas simultáneas de la misma tesela (single-flight).
+
+El origen es una plantilla de URL, así que se puede apuntar a un servidor
+local de pruebas (ver benchmarks/carga.py).
+"""
+import asyncio
+from collections import OrderedDict
+import os
+import tempfile
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+URL_TESELAS_OSM = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+
+
+class ErrorOrigen(Exception):
+    """El servidor de teselas de origen no ha devuelto la tesela."""
+
+
+class CacheTeselasDisco:
+
+    def __init__(self, directorio: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        # Clave ("z/x/y.png") -> tamaño, de la menos a la más usada
+        self._indice: "OrderedDict[str, int]" = OrderedDict()
+        self.bytes = 0
+        self._escaneo: Optional[asyncio.Future] = None
+        self._indexado = False
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsadas = 0
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, *clave.split("/"))
+
+    def _escanear(self) -> List[Tuple[float, str, int]]:
+        encontradas = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if not nombre.endswith(".png"):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    info = os.stat(ruta)
+                except OSError:
+                    continue
+                clave = os.path.relpath(ruta, self.directorio).replace(os.sep, "/")
+                encontradas.append((info.st_mtime, clave, info.st_size))
+        return sorted(encontradas)
+
+    async def _cargar(self) -> None:
+        # Solo la primera vez: el índice se reconstruye a partir de lo que haya en disco
+        if self._indexado:
+            return
+        if self._escaneo is None:
+            self._escaneo = asyncio.ensure_future(asyncio.to_thread(self._escanear))
+        encontradas = await asyncio.shield(self._escaneo)
+        if not self._indexado:
+            self._indexado = True
+            for _, clave, tamano in encontradas:
+                self._indice[clave] = tamano
+                self.bytes += tamano
+            await self._expulsar()
+
+    @staticmethod
+    def _leer(ruta: str) -> Tuple[bytes, float]:
+        with open(ruta, "rb") as f:
+            return f.read(), os.fstat(f.fileno()).st_mtime
+
+    @staticmethod
+    def _escribir(ruta: str, datos: bytes) -> None:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+
+    @staticmethod
+    def _borrar(rutas: List[str]) -> None:
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    async def obtener(self, clave: str) -> Optional[Tuple[bytes, float]]:
+        """Devuelve (datos, antigüedad en segundos) o None si no está."""
+        await self._cargar()
+        if clave not in self._indice:
+            self.fallos += 1
+            return None
+        self._indice.move_to_end(clave)
+        try:
+            datos, modificada = await asyncio.to_thread(self._leer, self._ruta(clave))
+        except OSError:
+            # Borrada por fuera: la quitamos del índice
+            self.bytes -= self._indice.pop(clave, 0)
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return datos, time.time() - modificada
+
+    async def guardar(self, clave: str, datos: bytes) -> None:
+        await self._cargar()
+        await asyncio.to_thread(self._escribir, self._ruta(clave), datos)
+        self.bytes += len(datos) - self._indice.pop(clave, 0)
+        self._indice[clave] = len(datos)
+        await self._expulsar()
+
+    async def _expulsar(self) -> None:
+        rutas = []
+        while self.bytes > self.max_bytes and len(self._indice) > 1:
+            clave, tamano = self._indice.popitem(last=False)
+            self.bytes -= tamano
+            rutas.append(self._ruta(clave))
+        if rutas:
+            self.expulsadas += len(rutas)
+            await asyncio.to_thread(self._borrar, rutas)
+
+    def metricas(self) -> dict:
+        return {
+            "teselas": len(self._indice),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsadas": self.expulsadas,
+        }
+
+
+class ProxyTeselas:
+
+    def __init__(
+        self,
+        obtener_cliente: Callable[[], "httpx.AsyncClient"],
+        cache: CacheTeselasDisco,
+        origen: str = URL_TESELAS_OSM,
+        ttl: float = 7 * 24 * 3600,
+        max_zoom: int = 19,
+        user_agent: str = "MiMapaExamen/1.0",
+    ):
+        self._obtener_cliente = obtener_cliente
+        self.cache = cache
+        self.origen = origen
+        self.ttl = ttl
+        self.max_zoom = max_zoom
+        # La política de uso de los servidores de OSM exige un User-Agent propio
+        self.headers = {"User-Agent": user_agent}
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self.descargas = 0
+        self.caducadas_servidas = 0
+
+    def _validar(self, z: int, x: int, y: int) -> None:
+        if not 0 <= z <= self.max_zoom:
+            raise ValueError(f"Zoom fuera de rango (0-{self.max_zoom})")
+        if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError("Tesela fuera de rango")
+
+    async def _descargar(self, z: int, x: int, y: int) -> bytes:
+        import httpx
+
+        url = self.origen.format(z=z, x=x, y=y)
+        self.descargas += 1
+        try:
+            response = await self._obtener_cliente().get(url, headers=self.headers)
+        except httpx.HTTPError as e:
+            raise ErrorOrigen(f"{url}: {e}")
+        if response.status_code != 200:
+            raise ErrorOrigen(f"{url}: HTTP {response.status_code}")
+        return response.content
+
+    async def _descargar_y_guardar(self, clave: str, z: int, x: int, y: int) -> bytes:
+        datos = await self._descargar(z, x, y)
+        await self.cache.guardar(clave, datos)
+        return datos
+
+    def _terminada(self, clave: str, tarea: asyncio.Future) -> None:
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            # Evitamos el aviso de "exception never retrieved" si nadie esperaba
+            tarea.exception()
+
+    async def _traer(self, clave: str, z: int, x: int, y: int) -> bytes:
+        # Single-flight: varias peticiones de la misma tesela, una sola descarga.
+        # La descarga va en su propia tarea y todos la esperan con shield: si se
+        # cancela la petición que la lanzó, las demás siguen esperando
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._descargar_y_guardar(clave, z, x, y))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminada(clave, t))
+        return await asyncio.shield(tarea)
+
+    async def obtener(self, z: int, x: int, y: int) -> Tuple[bytes, str]:
+        """
+        Devuelve (png, estado) con estado HIT, MISS o STALE (copia caducada
+        porque el origen ha fallado). Lanza ValueError si las coordenadas no
+        son válidas y ErrorOrigen si no hay copia y el origen falla.
+        """
+        self._validar(z, x, y)
+        clave = f"{z}/{x}/{y}.png"
+        en_cache = await self.cache.obtener(clave)
+        if en_cache is not None and en_cache[1] < self.ttl:
+            return en_cache[0], "HIT"
+        try:
+            return await self._traer(clave, z, x, y), "MISS"
+        except ErrorOrigen as e:
+            if en_cache is None:
+                raise
+            print(f"ERROR TESELAS (se sirve la copia caducada): {e}")
+            self.caducadas_servidas += 1
+            return en_cache[0], "STALE"
+
+    def metricas(self) -> dict:
+        return {
+            "origen": self.origen,
+            "descargas": self.descargas,
+            "en_vuelo": len(self._en_vuelo),
+            "caducadas_servidas": self.caducadas_servidas,
+            **self.cache.metricas(),
+        }
@@ -0,0 +1,64 @@
+import asyncio
+
+import mongomock_motor
+
+from agrupamiento import CacheClusters
+
+
+class CursorLento:
+    """Deja que el test invalide mientras se construye el índice."""
+
+    def __init__(self, docs, antes_de_terminar):
+        self._docs = list(docs)
+        self._antes_de_terminar = antes_de_terminar
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._docs:
+            self._antes_de_terminar()
+            raise StopAsyncIteration
+        return self._docs.pop(0)
+
+
+class ColeccionLenta:
+    def __init__(self, docs):
+        self.docs = docs
+        self.antes_de_terminar = lambda: None
+
+    def find(self, filtro, proyeccion):
+        return CursorLento(self.docs, self.antes_de_terminar)
+
+
+def marcador(i):
+    return {"email_usuario": "a@b.c", "ciudad_pais": f"c{i}", "latitud": 40.0 + i, "longitud": -3.0}
+
+
+def test_caduca_por_ttl_y_no_deja_generaciones():
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Marcadores"]
+        await coleccion.insert_many([marcador(i) for i in range(3)])
+        cache = CacheClusters(coleccion, ttl=0.01)
+        await cache.obtener("a@b.c")
+        assert len(cache.cache) == 1
+        cache.invalidar("a@b.c")
+        assert cache._generacion == {} and cache._construyendo == {}
+
+        await cache.obtener("a@b.c")
+        await asyncio.sleep(0.02)
+        assert cache.cache.obtener("a@b.c") is None
+
+    asyncio.run(prueba())
+
+
+def test_no_guarda_un_indice_invalidado_mientras_se_construye():
+    async def prueba():
+        coleccion = ColeccionLenta([marcador(i) for i in range(3)])
+        cache = CacheClusters(coleccion)
+        coleccion.antes_de_terminar = lambda: cache.invalidar("a@b.c")
+        await cache.obtener("a@b.c")
+        assert len(cache.cache) == 0
+        assert cache._generacion == {} and cache._construyendo == {}
+
+    asyncio.run(prueba())
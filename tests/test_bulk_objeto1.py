@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+from pymongo.errors import NetworkTimeout
+
+from bulk_objeto1 import EscritorBulkObjeto1
+
+DOCUMENTO = {"lista1": [], "descripcion": "d", "booleano": True, "fecha": "2024-01-01", "entero": 1}
+
+
+class ColeccionCaida:
+    async def bulk_write(self, operaciones, ordered=True):
+        raise NetworkTimeout("timeout")
+
+
+async def operaciones(*ops):
+    for op in ops:
+        yield op
+
+
+def test_un_fallo_de_mongo_no_corta_el_informe():
+    async def prueba():
+        escritor = EscritorBulkObjeto1(ColeccionCaida(), lote=1)
+        ops = operaciones({"op": "insertar", "documento": DOCUMENTO}, {"op": "insertar", "documento": DOCUMENTO})
+        lineas = [json.loads(l) async for l in escritor.escribir(ops)]
+        assert [l["estado"] for l in lineas[:2]] == ["error", "error"]
+        assert lineas[-1]["resumen"]["errores"] == 2
+        assert "error_cuerpo" not in lineas[-1]["resumen"]
+
+    asyncio.run(prueba())
+
+
+def test_un_valueerror_al_procesar_no_es_cuerpo_mal_formado():
+    async def prueba():
+        escritor = EscritorBulkObjeto1(ColeccionCaida(), lote=1)
+
+        def falla(numero, operacion):
+            raise ValueError("fallo interno")
+        escritor._preparar = falla
+        with pytest.raises(ValueError, match="fallo interno"):
+            [l async for l in escritor.escribir(operaciones({"op": "insertar", "documento": DOCUMENTO}))]
+
+    asyncio.run(prueba())
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+import mongomock_motor
+
+from cola_archivos import ERROR, LISTO, PENDIENTE, SUBIENDO, TrabajadorArchivos
+
+
+class EjecutorFalso:
+    timeout = 1.0
+
+    def __init__(self):
+        self.borrados = []
+
+    async def subir(self, archivo, public_id, **kwargs):
+        return {"secure_url": f"https://cdn/{public_id}"}
+
+    async def borrar(self, public_id):
+        self.borrados.append(public_id)
+        return {"result": "ok"}
+
+
+class BlobsFalsos:
+    def __init__(self):
+        self.liberados = []
+
+    async def liberar(self, hash_):
+        self.liberados.append(hash_)
+
+
+class ColeccionQueFallaUnaVez:
+    """Delegado de la colección: el primer update_one lanza una excepción."""
+
+    def __init__(self, coleccion):
+        self._coleccion = coleccion
+        self.fallos = 0
+
+    def __getattr__(self, nombre):
+        return getattr(self._coleccion, nombre)
+
+    async def update_one(self, *args, **kwargs):
+        if self.fallos == 0:
+            self.fallos += 1
+            raise RuntimeError("Mongo caído")
+        return await self._coleccion.update_one(*args, **kwargs)
+
+
+def test_el_trabajador_sigue_tras_un_fallo_de_update_one(tmp_path):
+    async def prueba():
+        coleccion = ColeccionQueFallaUnaVez(mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"])
+        ids = []
+        for i in range(2):
+            ruta = tmp_path / f"spool{i}"
+            ruta.write_bytes(b"contenido")
+            resultado = await coleccion.insert_one({
+                "estado": PENDIENTE, "intentos": 0, "enlace": "",
+                "proximo_intento": datetime(2000, 1, i + 1), "ruta_spool": str(ruta), "instancia": "a",
+            })
+            ids.append(resultado.inserted_id)
+
+        trabajador = TrabajadorArchivos(coleccion, EjecutorFalso(), directorio_spool=str(tmp_path / "spool"),
+                                        trabajadores=1, espera_base=0.01, intervalo_sondeo=0.01, instancia="a")
+        await trabajador.iniciar()
+        try:
+            for _ in range(200):
+                estados = [(await coleccion.find_one({"_id": i}))["estado"] for i in ids]
+                if estados == [LISTO, LISTO]:
+                    break
+                await asyncio.sleep(0.01)
+            assert coleccion.fallos == 1
+            assert not trabajador._tareas[0].done()
+            assert estados == [LISTO, LISTO]
+        finally:
+            await trabajador.detener()
+
+    asyncio.run(prueba())
+
+
+def test_solo_reclama_su_instancia_y_reclamos_caducados(tmp_path):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"]
+        ruta = tmp_path / "spool0"
+        ruta.write_bytes(b"contenido")
+        base = {"intentos": 0, "enlace": "", "proximo_intento": datetime(2000, 1, 1), "ruta_spool": str(ruta)}
+        otra = await coleccion.insert_one({**base, "estado": PENDIENTE, "instancia": "b"})
+        en_curso = await coleccion.insert_one(
+            {**base, "estado": SUBIENDO, "instancia": "a", "reclamado_hasta": datetime(2999, 1, 1)}
+        )
+        caducado = await coleccion.insert_one(
+            {**base, "estado": SUBIENDO, "instancia": "a", "reclamado_hasta": datetime(2000, 1, 1)}
+        )
+
+        trabajador = TrabajadorArchivos(coleccion, EjecutorFalso(), directorio_spool=str(tmp_path / "spool"),
+                                        trabajadores=1, instancia="a")
+        reclamado = await trabajador._reclamar()
+        assert reclamado["_id"] == caducado.inserted_id
+        assert reclamado["reclamado_hasta"] > datetime.now()
+        assert await trabajador._reclamar() is None
+        assert (await coleccion.find_one({"_id": otra.inserted_id}))["estado"] == PENDIENTE
+        assert (await coleccion.find_one({"_id": en_curso.inserted_id}))["estado"] == SUBIENDO
+
+    asyncio.run(prueba())
+
+
+def test_el_ultimo_fallo_borra_el_spool_y_libera_el_blob(tmp_path):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"]
+        ruta = tmp_path / "spool0"
+        ruta.write_bytes(b"contenido")
+        resultado = await coleccion.insert_one({
+            "estado": SUBIENDO, "intentos": 1, "enlace": "", "hash": "abc",
+            "proximo_intento": datetime(2000, 1, 1), "ruta_spool": str(ruta), "instancia": "a",
+        })
+        blobs = BlobsFalsos()
+        trabajador = TrabajadorArchivos(coleccion, EjecutorFalso(), directorio_spool=str(tmp_path / "spool"),
+                                        max_intentos=2, blobs=blobs, instancia="a")
+        doc = await coleccion.find_one({"_id": resultado.inserted_id})
+        await trabajador._fallo(doc, RuntimeError("almacenamiento caído"))
+
+        doc = await coleccion.find_one({"_id": resultado.inserted_id})
+        assert doc["estado"] == ERROR
+        assert "hash" not in doc and "ruta_spool" not in doc
+        assert not ruta.exists()
+        assert blobs.liberados == ["abc"]
+
+    asyncio.run(prueba())
+
+
+def test_cancelar_un_pendiente_borra_spool_y_suelta_el_blob(tmp_path):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"]
+        ruta = tmp_path / "spool0"
+        ruta.write_bytes(b"contenido")
+        resultado = await coleccion.insert_one({
+            "estado": PENDIENTE, "intentos": 0, "enlace": "", "hash": "abc",
+            "proximo_intento": datetime(2000, 1, 1), "ruta_spool": str(ruta), "instancia": "a",
+        })
+        blobs = BlobsFalsos()
+        trabajador = TrabajadorArchivos(coleccion, EjecutorFalso(), directorio_spool=str(tmp_path / "spool"),
+                                        blobs=blobs, instancia="a")
+        assert await trabajador.cancelar(resultado.inserted_id)
+        assert await coleccion.find_one({"_id": resultado.inserted_id}) is None
+        assert not ruta.exists()
+        assert blobs.liberados == ["abc"]
+
+    asyncio.run(prueba())
+
+
+def test_subida_de_un_documento_eliminado_se_borra(tmp_path):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"]
+        ruta = tmp_path / "spool0"
+        ruta.write_bytes(b"contenido")
+        doc = {"_id": ObjectId(), "estado": SUBIENDO, "intentos": 0, "enlace": "", "ruta_spool": str(ruta),
+               "instancia": "a", "reclamado_hasta": datetime(2999, 1, 1)}
+        await coleccion.insert_one(doc)
+        ejecutor = EjecutorFalso()
+        trabajador = TrabajadorArchivos(coleccion, ejecutor, directorio_spool=str(tmp_path / "spool"), instancia="a")
+        subir = ejecutor.subir
+
+        async def subir_y_eliminar(archivo, public_id, **kwargs):
+            # Se elimina a mitad de la subida; el reclamo sigue vigente
+            assert await trabajador.cancelar(doc["_id"])
+            return await subir(archivo, public_id, **kwargs)
+        ejecutor.subir = subir_y_eliminar
+
+        await trabajador._procesar(doc)
+        assert ejecutor.borrados == [f"archivos/{doc['_id']}"]
+        assert not ruta.exists()
+
+    asyncio.run(prueba())
+
+
+def test_al_arrancar_limpia_el_spool_huerfano(tmp_path):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Archivos"]
+        spool = tmp_path / "spool"
+        spool.mkdir()
+        antiguo = ObjectId.from_datetime(datetime.now() - timedelta(hours=1))
+        vivo = ObjectId.from_datetime(datetime.now() - timedelta(hours=1))
+        reciente = ObjectId()
+        await coleccion.insert_one({"_id": vivo, "estado": PENDIENTE, "instancia": "a"})
+        for archivo_id in (antiguo, vivo, reciente):
+            (spool / str(archivo_id)).write_bytes(b"x")
+
+        trabajador = TrabajadorArchivos(coleccion, EjecutorFalso(), directorio_spool=str(spool), instancia="a")
+        await trabajador._limpiar_spool()
+        assert sorted(p.name for p in spool.iterdir()) == sorted([str(vivo), str(reciente)])
+
+    asyncio.run(prueba())
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import mongomock_motor
+from pymongo.errors import NetworkTimeout
+
+from importacion import ImportadorMarcadores, filas_csv, leer_archivo, volcar_cuerpo
+
+
+class ColeccionCaida:
+    async def insert_many(self, documentos, ordered=True):
+        raise NetworkTimeout("timeout")
+
+
+async def trozos(*partes):
+    for parte in partes:
+        yield parte
+
+
+def test_un_fallo_de_mongo_no_corta_el_informe():
+    async def prueba():
+        archivo = await volcar_cuerpo(trozos(b"ciudad_pais,latitud,longitud\n", b"Madrid,40.4,-3.7\n"),
+                                      max_memoria=8)
+        importador = ImportadorMarcadores(ColeccionCaida(), geocodificador=None)
+        lineas = [json.loads(l) async for l in importador.importar("a@b.c", filas_csv(leer_archivo(archivo)))]
+        assert lineas[0]["estado"] == "error" and "timeout" in lineas[0]["error"]
+        assert lineas[-1] == {"resumen": {"filas": 1, "insertadas": 0, "errores": 1}}
+
+    asyncio.run(prueba())
+
+
+def test_importa_desde_un_cuerpo_en_disco():
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Marcadores"]
+        filas = b"".join(f"C{i},{i % 90},{i % 180}\n".encode() for i in range(200))
+        archivo = await volcar_cuerpo(trozos(b"ciudad_pais,latitud,longitud\n", filas), max_memoria=1024)
+        importador = ImportadorMarcadores(coleccion, geocodificador=None, lote=64)
+        lineas = [json.loads(l) async for l in importador.importar("a@b.c", filas_csv(leer_archivo(archivo, 100)))]
+        assert lineas[-1] == {"resumen": {"filas": 200, "insertadas": 200, "errores": 0}}
+        assert await coleccion.count_documents({}) == 200
+
+    asyncio.run(prueba())
+
+
+def test_coordenadas_fuera_de_rango_son_error_de_fila():
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Marcadores"]
+        archivo = await volcar_cuerpo(trozos(b"ciudad_pais,latitud,longitud\n", b"A,95,0\nB,0,200\nC,40,-3\n"))
+        importador = ImportadorMarcadores(coleccion, geocodificador=None)
+        lineas = [json.loads(l) async for l in importador.importar("a@b.c", filas_csv(leer_archivo(archivo)))]
+        assert [l.get("estado") for l in lineas[:3]] == ["error", "error", "ok"]
+        assert "latitud" in lineas[0]["error"] and "longitud" in lineas[1]["error"]
+        assert await coleccion.count_documents({}) == 1
+
+    asyncio.run(prueba())
@@ -0,0 +1,58 @@
+import asyncio
+import json
+from datetime import datetime
+
+import mongomock_motor
+import pytest
+
+from paginacion import LIMITE_POR_DEFECTO, codificar_cursor, filtro_keyset, leer_pagina, trozos_lista_json
+
+
+def test_cursor_de_otro_orden_es_invalido():
+    cursor = codificar_cursor({"_id": 1})
+    with pytest.raises(ValueError):
+        filtro_keyset({}, "fecha", cursor)
+
+
+@pytest.mark.parametrize("descendente", [False, True])
+def test_paginas_cruzando_de_nulos_a_fechas(descendente):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Tabla1"]
+        await coleccion.insert_many(
+            [{"_id": i, "fecha": None} for i in range(3)]
+            + [{"_id": 3}]
+            + [{"_id": 4 + i, "fecha": datetime(2024, 1, 1 + i)} for i in range(4)]
+        )
+        vistos, cursor = [], None
+        for _ in range(10):
+            items, cursor = await leer_pagina(coleccion, {}, None, lambda d: d["_id"], "fecha",
+                                              limit=2, cursor=cursor, descendente=descendente)
+            vistos += items
+            if cursor is None:
+                break
+        assert sorted(vistos) == list(range(8))
+        assert len(vistos) == 8
+
+    asyncio.run(prueba())
+
+
+def test_sin_limit_usa_la_pagina_por_defecto():
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Marcadores"]
+        await coleccion.insert_many([{"_id": i} for i in range(250)])
+        items, cursor = await leer_pagina(coleccion, {}, None, lambda d: d["_id"])
+        assert len(items) == LIMITE_POR_DEFECTO and cursor is not None
+
+    asyncio.run(prueba())
+
+
+@pytest.mark.parametrize("n", [0, 1, 3])
+def test_lista_json_en_streaming(n):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Marcadores"]
+        if n:
+            await coleccion.insert_many([{"_id": i} for i in range(n)])
+        trozos = [t async for t in trozos_lista_json(coleccion.find({}).sort("_id", 1), lambda d: d["_id"])]
+        assert json.loads(b"".join(trozos)) == list(range(n))
+
+    asyncio.run(prueba())
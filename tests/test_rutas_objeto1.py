@@ -0,0 +1,30 @@
+import asyncio
+
+from fastapi import FastAPI
+import httpx
+import mongomock_motor
+
+from rutas_objeto1 import crear_router
+
+
+def pedir(params=None, documentos=150):
+    async def prueba():
+        coleccion = mongomock_motor.AsyncMongoMockClient()["t"]["Tabla1"]
+        await coleccion.insert_many([{"descripcion": f"d{i}", "entero": i} for i in range(documentos)])
+        app = FastAPI()
+        app.include_router(crear_router(coleccion))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://local") as cliente:
+            return await cliente.get("/path", params=params)
+
+    return asyncio.run(prueba())
+
+
+def test_sin_limit_ni_cursor_devuelve_la_lista_completa():
+    respuesta = pedir()
+    assert respuesta.status_code == 200
+    assert isinstance(respuesta.json(), list) and len(respuesta.json()) == 150
+
+
+def test_con_limit_devuelve_paginas():
+    cuerpo = pedir({"limit": 100}).json()
+    assert len(cuerpo["items"]) == 100 and cuerpo["next_cursor"]
@@ -0,0 +1,29 @@
+import asyncio
+
+import mongomock_motor
+
+from versiones_marcadores import VersionesMarcadores
+
+
+def marcador(i, **extra):
+    return {"email_usuario": "a@b.c", "ciudad_pais": f"c{i}", "latitud": 40.0 + i, "longitud": -3.0, **extra}
+
+
+def test_cambios_avisa_de_marcadores_sin_version():
+    async def prueba():
+        db = mongomock_motor.AsyncMongoMockClient()["t"]
+        versiones = VersionesMarcadores(db, db["Marcadores"])
+        await db["Marcadores"].insert_one(marcador(0))
+        await db["Marcadores"].insert_one(marcador(1, version=await versiones.reservar("a@b.c")))
+
+        respuesta = await versiones.cambios("a@b.c", 0)
+        assert len(respuesta["marcadores"]) == 1
+        assert respuesta["completo"] is False
+
+        # Lo que hace la migración (numerar_antiguos)
+        await db["Marcadores"].update_one({"ciudad_pais": "c0"}, {"$set": {"version": await versiones.reservar("a@b.c")}})
+        respuesta = await versiones.cambios("a@b.c", respuesta["hasta"])
+        assert len(respuesta["marcadores"]) == 1
+        assert respuesta["completo"] is True
+
+    asyncio.run(prueba())
@@ -0,0 +1,129 @@
+"""
+Verificación de los ID tokens de Google para /login sin bloquear el bucle.
+
+- Los certificados públicos de Google se descargan con el httpx.AsyncClient
+  compartido (que no se crea hasta el primer login) y se guardan el tiempo
+  que indica Cache-Control: max-age.
+- La comprobación de la firma (CPU) se hace en un hilo aparte.
+- Los tokens ya verificados se recuerdan hasta que caducan.
+
+La URL de los certificados es configurable, así que se puede probar sin red
+con un par de claves generado en local y un servidor de certificados falso.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from cache_lru import CacheLRU
+
+if TYPE_CHECKING:
+    import httpx
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+EMISORES_GOOGLE = ("accounts.google.com", "https://accounts.google.com")
+
+
+def max_age(response: "httpx.Response", defecto: float = 300.0) -> float:
+    """Segundos que se puede reutilizar la respuesta según Cache-Control y Age."""
+    coincidencia = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    if not coincidencia:
+        return defecto
+    edad = response.headers.get("Age", "0")
+    return max(0.0, float(coincidencia.group(1)) - (float(edad) if edad.isdigit() else 0.0))
+
+
+class VerificadorGoogle:
+
+    def __init__(
+        self,
+        client_id: str,
+        obtener_cliente: Callable[[], "httpx.AsyncClient"],
+        url_certs: str = GOOGLE_CERTS_URL,
+        max_tokens: int = 10000,
+        margen_reloj: int = 10,
+    ):
+        self.client_id = client_id
+        # El cliente HTTP se pide la primera vez que hacen falta los certificados
+        self.obtener_cliente = obtener_cliente
+        self.url_certs = url_certs
+        self.margen_reloj = margen_reloj
+        self.tokens = CacheLRU(max_entradas=max_tokens)
+        self._certs: Optional[Dict[str, str]] = None
+        self._certs_expiran = 0.0
+        self._ultima_descarga = float("-inf")
+        self._lock = asyncio.Lock()
+        self.descargas_certs = 0
+
+    async def _certificados(self, forzar: bool = False) -> Dict[str, str]:
+        if not forzar and self._certs is not None and time.monotonic() < self._certs_expiran:
+            return self._certs
+
+        # Solo una descarga a la vez: el resto espera y reutiliza el resultado
+        async with self._lock:
+            if not forzar and self._certs is not None and time.monotonic() < self._certs_expiran:
+                return self._certs
+            response = await self.obtener_cliente().get(self.url_certs)
+            response.raise_for_status()
+            self._certs = response.json()
+            self._ultima_descarga = time.monotonic()
+            self._certs_expiran = self._ultima_descarga + max_age(response)
+            self.descargas_certs += 1
+            return self._certs
+
+    def _decodificar(self, token: str, certs: Dict[str, str]) -> dict:
+        from google.auth import jwt
+
+        id_info = jwt.decode(token, certs=certs, audience=self.client_id,
+                             clock_skew_in_seconds=self.margen_reloj)
+        if id_info.get("iss") not in EMISORES_GOOGLE:
+            raise ValueError(f"Emisor incorrecto: {id_info.get('iss')}")
+        return id_info
+
+    async def verificar(self, token: str) -> dict:
+        """
+        Devuelve los datos del token (sub, email, name...). Lanza ValueError
+        si el token es falso, ha caducado o el client_id no coincide.
+        """
+        import httpx
+
+        clave = hashlib.sha256(token.encode()).hexdigest()
+        id_info = self.tokens.obtener(clave)
+        if id_info is not None:
+            return id_info
+
+        try:
+            certs = await self._certificados()
+            if self._kid(token) not in certs and time.monotonic() - self._ultima_descarga > 60:
+                # Google ha rotado las claves antes de que caducara nuestra copia
+                # (como mucho una descarga forzada por minuto)
+                certs = await self._certificados(forzar=True)
+        except httpx.HTTPError as e:
+            raise ValueError(f"No se pudieron obtener los certificados de Google: {e}")
+
+        id_info = await asyncio.to_thread(self._decodificar, token, certs)
+
+        restante = id_info.get("exp", 0) - time.time()
+        if restante > 0:
+            self.tokens.guardar(clave, id_info, ttl=restante)
+        return id_info
+
+    @staticmethod
+    def _kid(token: str) -> Optional[str]:
+        """Identificador de la clave con la que se firmó (cabecera sin verificar)."""
+        try:
+            cabecera = token.split(".", 1)[0]
+            cabecera += "=" * (-len(cabecera) % 4)
+            return json.loads(base64.urlsafe_b64decode(cabecera)).get("kid")
+        except Exception:
+            return None
+
+    def metricas(self) -> dict:
+        return {
+            "tokens": self.tokens.metricas(),
+            "descargas_certs": self.descargas_certs,
+            "certs_caducan_en": round(max(0.0, self._certs_expiran - time.monotonic()), 1),
+        }
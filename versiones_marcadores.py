@@ -0,0 +1,170 @@
+"""
+Sincronización incremental de los marcadores de cada usuario.
+
+Cada usuario tiene un contador en la colección VersionesMarcadores
+({_id: email, version: n}) que se incrementa al insertar marcadores; cada
+marcador guarda la versión que le tocó en el campo "version". El navegador
+guarda una copia local y pide solo lo que haya con versión mayor que la suya
+(GET /marcadores/{email}/cambios?desde=N), por páginas ordenadas por versión.
+
+Las versiones de un usuario no se repiten (el $inc es atómico), así que
+sirven de clave para paginar y para deduplicar en el cliente. Un lote
+reserva un rango de versiones de una vez y luego inserta, así que durante un
+momento puede haber versiones reservadas que aún no se ven: "hasta" (la
+versión desde la que seguir) no pasa de un hueco mientras la última reserva
+sea reciente. Pasado ese margen los huecos son inserciones que fallaron.
+
+Los marcadores anteriores a este esquema no tienen versión: se numeran una
+vez con la migración (la consulta de cambios solo lee):
+
+    python versiones_marcadores.py
+
+Mientras no se haya migrado, la consulta de cambios no los devuelve y lo
+indica con completo=False, y el mapa sigue pidiendo la zona visible al
+servidor en lugar de pintar desde su copia local.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from cache_lru import CacheLRU
+from marcador import PROYECCION_MAPA, marcador_para_mapa
+from paginacion import limitar
+
+
+class VersionesMarcadores:
+
+    def __init__(self, db, coleccion_marcadores, nombre: str = "VersionesMarcadores",
+                 margen_reserva: float = 30.0, max_completos: int = 10000):
+        self.versiones = db[nombre]
+        self.marcadores = coleccion_marcadores
+        # Segundos que puede tardar una inserción desde que reserva su versión
+        self.margen_reserva = timedelta(seconds=margen_reserva)
+        # Usuarios sin marcadores antiguos: todo lo nuevo se inserta con
+        # versión, así que una vez completo lo sigue estando
+        self.completos = CacheLRU(max_entradas=max_completos)
+        self.consultas = 0
+        self.sin_cambios = 0
+
+    async def reservar(self, email: str, cantidad: int = 1) -> int:
+        """Reserva `cantidad` versiones seguidas y devuelve la primera."""
+        doc = await self.versiones.find_one_and_update(
+            {"_id": email},
+            {"$inc": {"version": cantidad}, "$set": {"reservado": datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["version"] - cantidad + 1
+
+    async def _contador(self, email: str) -> dict:
+        return await self.versiones.find_one({"_id": email}) or {"version": 0}
+
+    async def completo(self, email: str) -> bool:
+        """True si todos los marcadores del usuario tienen versión."""
+        if self.completos.obtener(email):
+            return True
+        antiguo = await self.marcadores.find_one(
+            {"email_usuario": email, "version": {"$exists": False}}, {"_id": 1}
+        )
+        if antiguo is None:
+            self.completos.guardar(email, True)
+        return antiguo is None
+
+    async def numerar_antiguos(self, email: str) -> int:
+        """Da versión a los marcadores de un usuario que no la tienen (migración)."""
+        antiguos = await self.marcadores.find(
+            {"email_usuario": email, "version": {"$exists": False}}, {"_id": 1}
+        ).sort("_id", 1).to_list(None)
+        if not antiguos:
+            return 0
+        primera = await self.reservar(email, len(antiguos))
+        # Si se lanza la migración dos veces a la vez, el filtro evita pisarla
+        await self.marcadores.bulk_write([
+            UpdateOne({"_id": doc["_id"], "version": {"$exists": False}}, {"$set": {"version": primera + i}})
+            for i, doc in enumerate(antiguos)
+        ], ordered=False)
+        return len(antiguos)
+
+    async def cambios(self, email: str, desde: int = 0, limit: Optional[int] = None) -> dict:
+        """
+        Marcadores con versión mayor que `desde`, en orden de versión.
+        Devuelve {"version", "hasta", "marcadores", "hay_mas", "reiniciar",
+        "completo"}: el cliente vuelve a pedir con desde=hasta mientras
+        hay_mas sea True. Con reiniciar=True la copia local no corresponde al
+        servidor (p.ej. se borró la colección) y hay que descartarla y empezar
+        desde 0. Con completo=False hay marcadores sin versión que no llegan
+        por aquí, así que la copia local no sirve para pintar el mapa.
+        """
+        self.consultas += 1
+        contador = await self._contador(email)
+        version = contador["version"]
+        completo = await self.completo(email)
+
+        if desde > version:
+            return {"version": version, "hasta": 0, "marcadores": [], "hay_mas": False, "reiniciar": True,
+                    "completo": completo}
+        if desde == version:
+            # Caso más habitual: la copia local ya está al día
+            self.sin_cambios += 1
+            return {"version": version, "hasta": desde, "marcadores": [], "hay_mas": False, "reiniciar": False,
+                    "completo": completo}
+
+        limite = limitar(limit)
+        docs = await self.marcadores.find(
+            {"email_usuario": email, "version": {"$gt": desde}}, {**PROYECCION_MAPA, "version": 1}
+        ).sort("version", 1).limit(limite + 1).to_list(limite + 1)
+
+        hay_mas = len(docs) > limite
+        docs = docs[:limite]
+        reservado = contador.get("reservado")
+        if reservado is not None and datetime.now() - reservado < self.margen_reserva:
+            # Puede haber inserciones en curso: avanzamos solo por versiones seguidas
+            hasta = desde
+            for doc in docs:
+                if doc["version"] != hasta + 1:
+                    break
+                hasta += 1
+            # Si el hueco corta la página, se sigue en la próxima sincronización
+            hay_mas = hay_mas and hasta == docs[-1]["version"]
+        else:
+            hasta = docs[-1]["version"] if hay_mas else version
+        return {
+            "version": version,
+            "hasta": hasta,
+            "marcadores": [{**marcador_para_mapa(doc), "v": doc["version"]} for doc in docs],
+            "hay_mas": hay_mas,
+            "reiniciar": False,
+            "completo": completo,
+        }
+
+    def metricas(self) -> dict:
+        return {"consultas": self.consultas, "sin_cambios": self.sin_cambios}
+
+
+async def migrar(db, coleccion_marcadores) -> int:
+    """Numera los marcadores sin versión de todos los usuarios. Se puede repetir."""
+    versiones = VersionesMarcadores(db, coleccion_marcadores)
+    emails = await coleccion_marcadores.distinct("email_usuario", {"version": {"$exists": False}})
+    total = 0
+    for email in emails:
+        total += await versiones.numerar_antiguos(email)
+    return total
+
+
+async def main():
+    import motor.motor_asyncio as motor
+    from environs import Env
+
+    env = Env()
+    env.read_env()
+    client = motor.AsyncIOMotorClient(env('MONGO_URI'))
+    db = client["MiMapa"]
+    migrados = await migrar(db, db["Marcadores"])
+    print(f"Marcadores numerados: {migrados}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())